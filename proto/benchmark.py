@@ -0,0 +1,196 @@
+import argparse
+import csv
+import os
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from assertpy import assert_that
+
+from corpus import MappedCorpus
+from corpus_index import CorpusIndex
+from fuzzy_score_1 import score
+from fuzzy_score_2 import fuzzy_search_2, fuzzy_search_2_score
+from inverted_index import InvertedIndex
+from narrowing import NarrowingSearch
+from optimal_score import hybrid_score, optimal_score
+from path_store import PathStore
+from prefilter import Prefilter, ignore_case_requirement, lower_requirement
+from typo import Typo, TypoIndex
+
+# typed one key at a time; "\b" is a backspace
+QUERIES = ["sharpd", "kconfig", "drivers/gpu", "dtsi", "usbserial", "mm/slab", "sharp\b\b\bmd", "arm64\b\b\bm/boot"]
+
+CSV_FIELDS = ["date", "commit", "engine", "lines", "keystrokes", "build_s", "p50_ms", "p95_ms", "p99_ms",
+              "lines_per_s", "peak_mb"]
+
+
+class FullScan:
+    """Baseline: scores every line on every keystroke, like run_search did"""
+
+    def __init__(self, texts, alg) -> None:
+        self.texts = texts
+        self.alg = alg
+
+    def search(self, pattern: str):
+        alg = self.alg
+        return [(i, s) for i, text in enumerate(self.texts) if (s := alg(text, pattern)) is not None]
+
+
+class BatchScan:
+    def __init__(self, texts) -> None:
+        from fuzzy_score_1_batch import EncodedCorpus
+        self.corpus = EncodedCorpus(list(texts))
+
+    def search(self, pattern: str):
+        from fuzzy_score_1_batch import score_many, NO_MATCH
+        return (score_many(self.corpus, pattern) != NO_MATCH).nonzero()[0]
+
+
+def _typo_fuzzy_search_2(texts):
+    typo = Typo(fuzzy_search_2_score, k=1)
+    return NarrowingSearch(texts, typo, CorpusIndex(texts), inverted=TypoIndex(texts, typo))
+
+
+def _narrowing_score(alg):
+    return lambda texts: NarrowingSearch(texts, alg, CorpusIndex(texts), Prefilter(texts, ignore_case_requirement),
+                                         InvertedIndex(texts, ignore_case_requirement))
+
+
+def _fuzzy_search_2(text, pattern):
+    s = fuzzy_search_2(text, pattern)
+    return None if s is None else s.score()
+
+
+# name -> engine factory. A factory gets the texts and returns something with search(pattern)
+ENGINES = {
+    "score": lambda texts: FullScan(texts, score),
+    "fuzzy_search_2": lambda texts: FullScan(texts, _fuzzy_search_2),
+    "fuzzy_search_2_score": lambda texts: FullScan(texts, fuzzy_search_2_score),
+    "narrowing_score": _narrowing_score(score),
+    "narrowing_fuzzy_search_2": lambda texts: NarrowingSearch(texts, fuzzy_search_2_score, CorpusIndex(texts),
+                                                              Prefilter(texts, lower_requirement),
+                                                              InvertedIndex(texts, lower_requirement)),
+    "score_many": BatchScan,
+    "typo_fuzzy_search_2": _typo_fuzzy_search_2,
+    "narrowing_optimal_score": _narrowing_score(optimal_score),
+    "narrowing_hybrid_score": _narrowing_score(hybrid_score),
+}
+
+
+def keystrokes(query: str):
+    """Patterns seen while typing the query"""
+    pattern = ""
+    for ch in query:
+        pattern = pattern[:-1] if ch == "\b" else pattern + ch
+        if pattern:
+            yield pattern
+
+
+def replay(factory, texts, queries) -> (float, list[int]):
+    """Build time and the latency (ns) of every keystroke. Each query starts from a fresh engine"""
+    build = 0.0
+    latencies = []
+    for query in queries:
+        t0 = time.perf_counter()
+        engine = factory(texts)
+        build += time.perf_counter() - t0
+
+        for pattern in keystrokes(query):
+            t0 = time.perf_counter_ns()
+            engine.search(pattern)
+            latencies.append(time.perf_counter_ns() - t0)
+    return build / len(queries), latencies
+
+
+def peak_memory(factory, texts, queries) -> int:
+    """Peak bytes allocated while building the engine and replaying, traced in a separate untimed run"""
+    tracemalloc.start()
+    try:
+        replay(factory, texts, queries)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(name: str, texts, queries=QUERIES, memory=True) -> dict:
+    factory = ENGINES[name]
+    build, latencies = replay(factory, texts, queries)
+    q = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "engine": name,
+        "lines": len(texts),
+        "keystrokes": len(latencies),
+        "build_s": f"{build:.3f}",
+        "p50_ms": f"{q[49] / 1e6:.3f}",
+        "p95_ms": f"{q[94] / 1e6:.3f}",
+        "p99_ms": f"{q[98] / 1e6:.3f}",
+        "lines_per_s": f"{len(texts) * len(latencies) / (sum(latencies) / 1e9):.0f}",
+        "peak_mb": f"{peak_memory(factory, texts, queries) / 2 ** 20:.1f}" if memory else "",
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def append_rows(path: str, rows: list[dict]):
+    """Appends to the csv, writing the header first if the file is new"""
+    new = not os.path.exists(path) or os.path.getsize(path) == 0
+    date = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    commit = _commit()
+    with open(path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        if new:
+            writer.writeheader()
+        for row in rows:
+            writer.writerow({"date": date, "commit": commit, **row})
+
+
+def test_measure(tmp_path):
+    texts = ["./arch/arm/boot/compressed/head-sharpsl.S", "./drivers/gpu/drm/panel/panel-sharp-ls037v7dw01.c",
+             "./init/do_mounts.c", "./mm/slab.c"] * 5
+    rows = [measure(name, texts, ["sharpd", "mm/\bs"]) for name in ENGINES if name != "score_many"]
+    for row in rows:
+        assert_that(row["keystrokes"]).is_equal_to(11)
+        assert_that(float(row["p99_ms"])).is_greater_than_or_equal_to(float(row["p50_ms"]))
+
+    path = str(tmp_path / "bench.csv")
+    append_rows(path, rows[:2])
+    append_rows(path, rows[2:])
+    with open(path) as f:
+        written = list(csv.DictReader(f))
+    assert_that([r["engine"] for r in written]).is_equal_to([r["engine"] for r in rows])
+
+
+def test_keystrokes():
+    assert_that(list(keystrokes("ab\bc"))).is_equal_to(["a", "ab", "a", "ac"])
+    assert_that(list(keystrokes("a\b\bb"))).is_equal_to(["a", "b"])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Times the proto scorers replaying QUERIES one keystroke at a time")
+    parser.add_argument("--corpus", default="../benchmark_data/linux_files_list.txt")
+    parser.add_argument("--csv", default="../benchmark_results/proto_benchmark.csv")
+    parser.add_argument("--engines", nargs="*", default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument("--lines", type=int, default=0, help="only the first n lines of the corpus")
+    parser.add_argument("--no-memory", action="store_true", help="skip the (slow) tracemalloc run")
+    parser.add_argument("--path-store", action="store_true",
+                        help="keep the corpus in a PathStore instead of mapping it")
+    args = parser.parse_args()
+
+    _corpus = PathStore.from_file(args.corpus) if args.path_store else MappedCorpus(args.corpus)
+    _texts = _corpus[0:args.lines] if args.lines else _corpus
+
+    _rows = []
+    for _name in args.engines:
+        _rows.append(measure(_name, _texts, memory=not args.no_memory))
+        print(", ".join(f"{k}: {v}" for k, v in _rows[-1].items()))
+    append_rows(args.csv, _rows)
+    _corpus.close()
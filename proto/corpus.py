@@ -0,0 +1,133 @@
+import mmap
+import os
+from array import array
+from itertools import accumulate, repeat
+from operator import add
+
+from assertpy import assert_that
+
+# bytes of the file split at a time when building the offsets
+_BLOCK = 1 << 24
+
+
+class MappedCorpus:
+    """
+    Lines of a file, read through mmap instead of readlines. Only the start offset of each line is kept, in an
+    array('I') ('Q' past 4GB), so nothing but the offsets is resident. `view(i)` is a zero-copy memoryview of a line;
+    `corpus[i]` decodes it to a str (without the newline) only when it's asked for.
+
+    `offsets` skips scanning the file when they are already known e.g. loaded from an index cache.
+    """
+
+    def __init__(self, path: str, offsets=None) -> None:
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._view = memoryview(self._map)
+
+        if offsets is not None:
+            self.offsets = offsets
+            return
+
+        # offsets[i + 1] - 1 is where line i ends, so a last line without "\n" gets a sentinel of size + 1, the
+        # largest offset there can be
+        self.offsets = array('I' if size + 1 < 2 ** 32 else 'Q', [0])
+        pos = 0
+        while (end := self._map.rfind(b"\n", pos, pos + _BLOCK) + 1) > pos:
+            # line lengths of a block with split and accumulate, which run in C
+            lengths = map(add, map(len, self._map[pos:end - 1].split(b"\n")), repeat(1))
+            self.offsets.pop()
+            self.offsets.extend(accumulate(lengths, initial=pos))
+            pos = end
+        if pos < size:
+            self.offsets.append(size + 1)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def view(self, i: int) -> memoryview:
+        return self._view[self.offsets[i]:self.offsets[i + 1] - 1]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return self._map[self.offsets[i]:self.offsets[i + 1] - 1].decode("utf-8", "surrogateescape")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        self._view.release()
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def test_mapped_corpus(tmp_path):
+    path = tmp_path / "files.txt"
+    path.write_bytes("./a\n./bñ\n\n./c".encode())
+
+    with MappedCorpus(str(path)) as corpus:
+        assert_that(len(corpus)).is_equal_to(4)
+        assert_that(list(corpus)).is_equal_to(["./a", "./bñ", "", "./c"])
+        assert_that(corpus[-1]).is_equal_to("./c")
+        assert_that(corpus[1:3]).is_equal_to(["./bñ", ""])
+        assert_that(bytes(corpus.view(1))).is_equal_to("./bñ".encode())
+
+    path.write_bytes(b"./a\n")
+    with MappedCorpus(str(path)) as corpus:
+        assert_that(list(corpus)).is_equal_to(["./a"])
+
+    path.write_bytes(b"")
+    with MappedCorpus(str(path)) as corpus:
+        assert_that(len(corpus)).is_equal_to(0)
+
+
+if __name__ == '__main__':
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+
+    _path = "../benchmark_data/linux_files_list.txt"
+
+    def _rss() -> (int, int):
+        """
+        Resident (anonymous, file) bytes of the process. Unlike tracemalloc's count, it has the pages of a mapped file
+        once read, which are file pages the kernel can drop and read again rather than swap out
+        """
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+        return tuple(int(fields[name].split()[0]) * 1024 for name in ["RssAnon", "RssFile"])
+
+    def _readlines():
+        with open(_path, 'r') as text_file:
+            return text_file.readlines()
+
+    def _mapped():
+        return MappedCorpus(_path)
+
+    def _measure(load):
+        """In a process of its own, so that one loader's memory isn't counted for (or reused by) the next"""
+        anon, file = _rss()
+        t0 = time.perf_counter()
+        corpus = load()
+        elapsed = time.perf_counter() - t0
+        for _ in corpus:
+            pass
+        anon_read, file_read = _rss()
+        return elapsed, anon_read - anon, file_read - file
+
+    for _load in [_readlines, _mapped]:
+        with ProcessPoolExecutor(1, mp_context=get_context("fork")) as pool:
+            _elapsed, _anon, _file = pool.submit(_measure, _load).result()
+        print(f"{_load.__name__:10} {_elapsed:.3f}s, RSS once every line was read: anonymous {_anon / 2 ** 20:.1f}MB, "
+              f"file {_file / 2 ** 20:.1f}MB")
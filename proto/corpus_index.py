@@ -0,0 +1,178 @@
+from array import array
+
+from assertpy import assert_that
+
+from fuzzy_score_1 import BOUNDARY_FLAG, UPPER_FLAG, is_boundary, score
+from fuzzy_score_2 import START_FLAG, END_FLAG, MIDDLE_FLAG, Boundary, is_start_boundary, is_end_boundary, \
+    fuzzy_search_2
+
+# character classes, one bit each
+_SEP_1 = 0b00001  # fuzzy_score_1 boundary char
+_SEP_2 = 0b00010  # fuzzy_score_2 boundary_set
+_UPPER = 0b00100
+_LOWER = 0b01000
+_CASE = 0b10000  # ord(c) & 0b0010_0000
+
+
+def _char_class(c: str) -> int:
+    return (_SEP_1 if c in " _/." else 0) | (_SEP_2 if c in " _-/." else 0) | (_UPPER if c.isupper() else 0) | \
+        (_LOWER if c.islower() else 0) | (_CASE if ord(c) & 0b0010_0000 else 0)
+
+
+_ascii_classes = bytes(_char_class(chr(c)) if c < 128 else 0 for c in range(256))
+# str.lower of ASCII bytes
+_ascii_lower = bytes.maketrans(bytes(range(65, 91)), bytes(range(97, 123)))
+
+
+def text_flags(text: str) -> bytearray:
+    """
+    One flag byte per char with the result of every boundary function of fuzzy_score_1 and fuzzy_score_2, and whether
+    it's uppercase
+    """
+    if text.isascii():
+        classes = text.encode("ascii").translate(_ascii_classes)
+    else:
+        classes = [_char_class(c) for c in text]
+
+    last = len(text) - 1
+    flags = bytearray(len(text))
+    for i, c in enumerate(classes):
+        if i == 0:
+            f = BOUNDARY_FLAG | (0 if c & _SEP_2 else START_FLAG)
+        else:
+            p = classes[i - 1]
+            f = BOUNDARY_FLAG if p & _SEP_1 or (p ^ c) & _CASE else 0
+            if p & _SEP_2 or (c & _UPPER and p & _LOWER):
+                f |= START_FLAG
+
+        if i == last:
+            f |= 0 if c & _SEP_2 else END_FLAG
+        else:
+            n = classes[i + 1]
+            if n & _SEP_2 or (c & _LOWER and n & _UPPER):
+                f |= END_FLAG
+
+        if c & _SEP_2 or not f & (START_FLAG | END_FLAG):
+            f |= MIDDLE_FLAG
+        if c & _UPPER:
+            f |= UPPER_FLAG
+        flags[i] = f
+
+    return flags
+
+
+class CorpusIndex:
+    """
+    Everything about the corpus that doesn't depend on the pattern, built once at load time. Per char arrays of all
+    texts are concatenated; `offsets[row]` is where a text starts in them.
+
+    * `flags`: boundary and case flags (see text_flags) that scorers take instead of computing them
+    * `lower`: lowercase bytes, which scorers compare as ints instead of chars. Only valid for rows where `ascii[row]`
+      is set
+    * `separators`: positions of "/" in each text, starting at `separator_offsets[row]`
+    """
+
+    def __init__(self, texts: list[str]) -> None:
+        self.offsets = array('I', [0])
+        self.flags = bytearray()
+        self.lower = bytearray()
+        self.ascii = bytearray()
+        self.separators = array('I')
+        self.separator_offsets = array('I', [0])
+        self.extend(texts)
+
+    @classmethod
+    def from_arrays(cls, offsets, flags, lower, ascii, separators, separator_offsets):
+        """An index over already built arrays, e.g. memoryviews of an index cache file"""
+        index = cls.__new__(cls)
+        index.offsets = offsets
+        index.flags = flags
+        index.lower = lower
+        index.ascii = ascii
+        index.separators = separators
+        index.separator_offsets = separator_offsets
+        return index
+
+    def __len__(self):
+        return len(self.ascii)
+
+    def add(self, text: str) -> int:
+        """Adds a row for a new text at the end and returns it. Rows of changed or removed texts are left as they are"""
+        return self.extend([text]).start
+
+    def extend(self, texts) -> range:
+        """Adds a row for every text at the end and returns them"""
+        if not isinstance(self.flags, bytearray):
+            # loaded from a read-only cache: copied once, then grown in place
+            self.offsets, self.separators = array('I', self.offsets), array('I', self.separators)
+            self.separator_offsets = array('I', self.separator_offsets)
+            self.flags, self.lower, self.ascii = bytearray(self.flags), bytearray(self.lower), bytearray(self.ascii)
+
+        start = len(self)
+        for text in texts:
+            self.flags += text_flags(text)
+            is_ascii = text.isascii()
+            self.ascii.append(is_ascii)
+            self.lower += text.encode("ascii").translate(_ascii_lower) if is_ascii else b"\xff" * len(text)
+            self.separators.extend(i for i, c in enumerate(text) if c == "/")
+            self.offsets.append(len(self.flags))
+            self.separator_offsets.append(len(self.separators))
+        return range(start, len(self))
+
+    # rows are sliced straight out of the arrays: a copy of a bytearray is cheaper than a memoryview of it, and views
+    # would keep it from growing. From an index cache they are memoryviews of the mmap, so there they're zero-copy
+
+    def flags_of(self, row: int):
+        return self.flags[self.offsets[row]:self.offsets[row + 1]]
+
+    def lower_of(self, row: int):
+        return self.lower[self.offsets[row]:self.offsets[row + 1]] if self.ascii[row] else None
+
+    def separators_of(self, row: int) -> array:
+        return self.separators[self.separator_offsets[row]:self.separator_offsets[row + 1]]
+
+
+def test_text_flags():
+    texts = ["", "a", "_", "fooBar", "FOObar", "fooBAR", "foo_bar", "f_O", "fo_o", "foOo", "FoO", "x/o.n",
+             "./Documentation/devicetree/bindings/display/panel/sharp,ls037v7dw01.yaml", "añB-ñc", "K_K"]
+    for text in texts:
+        flags = text_flags(text)
+        for i in range(len(text)):
+            assert_that(bool(flags[i] & BOUNDARY_FLAG)).is_equal_to(bool(is_boundary(text, i)))
+            assert_that(bool(flags[i] & START_FLAG)).is_equal_to(is_start_boundary(text, i))
+            assert_that(bool(flags[i] & END_FLAG)).is_equal_to(is_end_boundary(text, i))
+            assert_that(Boundary.boundary(text, i, flags)).is_equal_to(Boundary.boundary(text, i))
+            assert_that(bool(flags[i] & UPPER_FLAG)).is_equal_to(text[i].isupper())
+
+
+def test_corpus_index():
+    texts = ["./a/bC", "", "añ/b"]
+    index = CorpusIndex(texts)
+    assert_that(len(index)).is_equal_to(3)
+    assert_that(list(index.offsets)).is_equal_to([0, 6, 6, 10])
+    assert_that(bytes(index.flags_of(0))).is_equal_to(bytes(text_flags("./a/bC")))
+    assert_that(bytes(index.lower_of(0))).is_equal_to(b"./a/bc")
+    assert_that(index.lower_of(2)).is_none()
+    assert_that(list(index.separators_of(0))).is_equal_to([1, 3])
+    assert_that(list(index.separators_of(1))).is_empty()
+    assert_that(list(index.separators_of(2))).is_equal_to([2])
+
+    flags = index.flags_of(0)
+    assert_that(index.add("x/Y")).is_equal_to(3)
+    assert_that(bytes(index.flags_of(3))).is_equal_to(bytes(text_flags("x/Y")))
+    assert_that(bytes(index.lower_of(3))).is_equal_to(b"x/y")
+    assert_that(list(index.separators_of(3))).is_equal_to([1])
+    assert_that(bytes(flags)).is_equal_to(bytes(text_flags("./a/bC")))
+
+
+def test_scorers_with_index():
+    texts = ["sayYxbyZxcy", "AxyzBzyzCxyz", "xyAdxyBxy", "FooBar", "foo_bar", "yx/xyfoo_bar", "fooBAR_abc",
+             "./Documentation/devicetree/bindings/display/panel/sharp,ls037v7dw01.yaml"]
+    index = CorpusIndex(texts)
+    for row, text in enumerate(texts):
+        for pattern in ["abc", "ad", "fb", "sharpd"]:
+            assert_that(score(text, pattern, flags=index.flags_of(row))).is_equal_to(score(text, pattern))
+
+            expected = fuzzy_search_2(text, pattern)
+            actual = fuzzy_search_2(text, pattern, flags=index.flags_of(row))
+            assert_that(str(actual)).is_equal_to(str(expected))
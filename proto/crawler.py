@@ -0,0 +1,292 @@
+import fnmatch
+import os
+import queue
+import re
+import threading
+import time
+from functools import lru_cache
+
+from assertpy import assert_that
+
+# never worth searching. Same syntax as a .gitignore: all of them at any depth but build/, which is only the root's
+# (linux' tools/build, say, is source)
+DEFAULT_IGNORE = [".git/", ".hg/", ".svn/", "__pycache__/", "node_modules/", "zig-out/", "zig-cache/", ".zig-cache/",
+                  "/build/"]
+
+# threads a Crawler lists directories with. They mostly wait on the filesystem, so more than there are cores
+WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# a worker hands over the paths it found once it has this many, or after this long
+FLUSH_PATHS = 4096
+FLUSH_SECONDS = 0.05
+
+
+class IgnoreRules:
+    """
+    Patterns of one .gitignore, for the paths under `base`. A subset of gitignore: `#` comments, `!` to re-include,
+    a trailing `/` only matches directories, and a pattern with a `/` anywhere else is matched against the path
+    relative to `base` while one without is matched against the name at any depth. Globs are fnmatch's, where `*`
+    also matches `/`, so `**` works as well.
+    """
+
+    def __init__(self, patterns: list[str], base: str) -> None:
+        self.base = base
+        self.rules = []
+        for line in patterns:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            line = line[1:] if negate else line
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            anchored = "/" in line
+            line = line.lstrip("/")
+            self.rules.append((re.compile(fnmatch.translate(line)).match, negate, dir_only, anchored, line))
+        # without "!", a path is ignored iff any pattern matches it, whichever rules it's in
+        self.simple = not any(negate for _, negate, _, _, _ in self.rules)
+
+    @classmethod
+    def read(cls, path: str, base: str):
+        try:
+            with open(path, 'r', errors="surrogateescape") as f:
+                return cls(f.readlines(), base)
+        except OSError:
+            return None
+
+    def match(self, path: str, name: str, is_dir: bool):
+        """True if the path is ignored, False if it's re-included, None if no pattern matches it"""
+        result = None
+        for match, negate, dir_only, anchored, _ in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if match(path[len(self.base) + 1:] if anchored else name):
+                result = not negate
+        return result
+
+
+def ignored(rules: tuple, path: str, name: str, is_dir: bool) -> bool:
+    """The deepest rules with a matching pattern decide, like nested .gitignore files"""
+    for r in reversed(rules):
+        m = r.match(path, name, is_dir)
+        if m is not None:
+            return m
+    return False
+
+
+@lru_cache(maxsize=1024)
+def _name_matchers(rules: tuple):
+    """
+    (files, dirs, anchored) for when all of `rules` are simple: regex matches of all the patterns matched against the
+    name, so an entry takes one regex call instead of a call per pattern, and (start, match, dir_only, parent) of the
+    anchored ones, matched against path[start:]. `parent` is the one directory (relative to the rules' base) a pattern
+    without a glob can match entries of, None for a glob. A None matcher matches nothing; the result is None if the
+    rules aren't simple.
+    """
+    if not all(r.simple for r in rules):
+        return None
+    files = []
+    dirs = []
+    anchored = []
+    for r in rules:
+        for match, _, dir_only, is_anchored, pattern in r.rules:
+            if is_anchored:
+                parent = None if any(c in pattern for c in "*?[") else os.path.dirname(pattern)
+                anchored.append((len(r.base) + 1, match, dir_only, parent))
+                continue
+            dirs.append(match.__self__.pattern)
+            if not dir_only:
+                files.append(match.__self__.pattern)
+    return tuple(re.compile("|".join(p)).match if p else None for p in (files, dirs)) + (tuple(anchored),)
+
+
+def list_dir(directory: str, rules: tuple, gitignore=True):
+    """
+    (mtime_ns, {name: (inode, is_dir)} of the entries that aren't ignored, rules for the entries' children), or
+    None if the directory can't be listed. With `gitignore`, the directory's own .gitignore is added to the rules.
+    """
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+        with os.scandir(directory) as it:
+            entries = list(it)
+    except OSError:
+        return None
+
+    if gitignore and any(e.name == ".gitignore" for e in entries):
+        own = IgnoreRules.read(os.path.join(directory, ".gitignore"), directory)
+        if own is not None:
+            rules = rules + (own,)
+
+    kept = {}
+    matchers = _name_matchers(rules)
+    if matchers is None:
+        for e in entries:
+            is_dir = e.is_dir(follow_symlinks=False)
+            if not ignored(rules, e.path, e.name, is_dir):
+                kept[e.name] = (e.inode(), is_dir)
+    else:
+        files, dirs, anchored = matchers
+        # e.g. "/build/" is only checked in the root
+        anchored = [(start, m, dir_only) for start, m, dir_only, parent in anchored
+                    if parent is None or directory[start:] == parent]
+        for e in entries:
+            is_dir = e.is_dir(follow_symlinks=False)
+            match = dirs if is_dir else files
+            if match is not None and match(e.name):
+                continue
+            if anchored and any(m(e.path[start:]) for start, m, dir_only in anchored if is_dir or not dir_only):
+                continue
+            kept[e.name] = (e.inode(), is_dir)
+    return mtime, kept, rules
+
+
+class Crawler:
+    """
+    Lists everything under `root` that isn't ignored, root first, as `find root` would. `workers` threads each walk
+    their own stack of directories depth first, and hand half of it over when another worker runs out. stat and
+    scandir release the GIL, so the threads wait on the filesystem together instead of in turn. Sharing work only on
+    demand, rather than queueing every directory as a task, keeps the overhead per directory down to a list pop.
+
+    Paths come out in batches while the crawl goes on, at least every FLUSH_SECONDS: `drain` takes the ones found so far
+    without blocking, iterating blocks until the next batch. `dirs` has every directory listed in the form
+    PollingWatcher keeps them, so a watcher can start from the crawl.
+    """
+
+    def __init__(self, root: str, ignore=DEFAULT_IGNORE, workers=WORKERS, gitignore=True) -> None:
+        self.root = root
+        self.rules = (IgnoreRules(ignore, root),)
+        self.gitignore = gitignore
+        self.workers = workers
+        self.dirs = {}
+        self.done = False
+        self._batches = queue.SimpleQueue()
+        self._shared = []
+        self._idle = 0
+        self._finished = False
+        self._changed = threading.Condition()
+
+    def start(self):
+        self._batches.put([self.root])
+        self._shared.append((self.root, self.rules))
+        for _ in range(self.workers):
+            threading.Thread(target=self._work, daemon=True).start()
+        return self
+
+    def _take(self):
+        """Directories to walk next, or None once every worker is out of them"""
+        with self._changed:
+            self._idle += 1
+            while not self._shared and self._idle < self.workers:
+                self._changed.wait()
+            if not self._shared:
+                if not self._finished:
+                    self._finished = True
+                    self._batches.put(None)
+                self._changed.notify_all()
+                return None
+            self._idle -= 1
+            return [self._shared.pop()]
+
+    def _flush(self, paths: list[str]) -> list[str]:
+        if paths:
+            self._batches.put(paths)
+        return []
+
+    def _work(self):
+        buffered = []
+        flushed = time.monotonic()
+        while (stack := self._take()) is not None:
+            while stack:
+                directory, rules = stack.pop()
+                listed = list_dir(directory, rules, self.gitignore)
+                if listed is None:
+                    continue
+                self.dirs[directory] = listed
+                _, entries, rules = listed
+                prefix = os.path.join(directory, "")
+                paths = [prefix + name for name in entries]
+                stack.extend((path, rules) for path, (_, is_dir) in zip(paths, entries.values()) if is_dir)
+                buffered += paths
+                # every put wakes a waiting reader, which then takes the GIL, so paths go out in larger batches
+                if len(buffered) >= FLUSH_PATHS or time.monotonic() - flushed >= FLUSH_SECONDS:
+                    buffered = self._flush(buffered)
+                    flushed = time.monotonic()
+
+                if self._idle and len(stack) > 1:
+                    with self._changed:
+                        half = len(stack) // 2
+                        self._shared.extend(stack[:half])
+                        del stack[:half]
+                        self._changed.notify(half)
+            buffered = self._flush(buffered)
+
+    def drain(self) -> list[str]:
+        """Paths found since the last drain, possibly none"""
+        paths = []
+        while not self.done:
+            try:
+                batch = self._batches.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None:
+                self.done = True
+            else:
+                paths.extend(batch)
+        return paths
+
+    def __iter__(self):
+        while not self.done:
+            batch = self._batches.get()
+            if batch is None:
+                self.done = True
+            else:
+                yield batch
+
+
+def crawl(root: str, ignore=DEFAULT_IGNORE, workers=WORKERS, gitignore=True) -> list[str]:
+    return [path for batch in Crawler(root, ignore, workers, gitignore).start() for path in batch]
+
+
+def _tree(root, files):
+    for name in files:
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not name.endswith("/"):
+            with open(path, 'w') as f:
+                f.write(files[name])
+
+
+def test_ignore_rules():
+    rules = (IgnoreRules(DEFAULT_IGNORE, "."), IgnoreRules(["*.o", "!keep.o", "/out/", "docs/*.md", "# c"], "./a"))
+    assert_that(ignored(rules, "./a/.git", ".git", True)).is_true()
+    assert_that(ignored(rules, "./a/.git", ".git", False)).is_false()
+    assert_that(ignored(rules, "./a/x/y.o", "y.o", False)).is_true()
+    assert_that(ignored(rules, "./a/x/keep.o", "keep.o", False)).is_false()
+    assert_that(ignored(rules, "./a/out", "out", True)).is_true()
+    assert_that(ignored(rules, "./a/x/out", "out", True)).is_false()
+    assert_that(ignored(rules, "./a/docs/r.md", "r.md", False)).is_true()
+    assert_that(ignored(rules, "./a/x/docs/r.md", "r.md", False)).is_false()
+    assert_that(ignored(rules[:1], "./b/y.o", "y.o", False)).is_false()
+    assert_that(ignored(rules, "./build", "build", True)).is_true()
+    assert_that(ignored(rules, "./tools/build", "build", True)).is_false()
+
+
+def test_crawler(tmp_path):
+    root = str(tmp_path)
+    _tree(root, {"a/x.c": "", "a/x.o": "", "a/b/y.c": "", "a/.gitignore": "*.o\nb/\n/c/\n", "a/c/z.c": "",
+                 "a/d/c/z.c": "", "b/y.c": "", "b/z.o": "", ".git/HEAD": "", "build/out.c": "", "tools/build/x.c": "",
+                 "empty/": ""})
+
+    found = sorted(os.path.relpath(p, root) for p in crawl(root, workers=3))
+    print("only the root's build directory is ignored: linux' tools/build is source")
+    assert_that(found).is_equal_to([".", "a", "a/.gitignore", "a/d", "a/d/c", "a/d/c/z.c", "a/x.c", "b", "b/y.c",
+                                    "b/z.o", "empty", "tools", "tools/build", "tools/build/x.c"])
+    assert_that(crawl(root, ignore=[], gitignore=False)).is_length(23)
+
+    crawler = Crawler(root, workers=2).start()
+    batches = list(crawler)
+    assert_that(batches[0]).is_equal_to([root])
+    assert_that(crawler.done).is_true()
+    assert_that(crawler.drain()).is_empty()
+    dirs = [root] + [os.path.join(root, d) for d in ["a", "a/d", "a/d/c", "b", "empty", "tools", "tools/build"]]
+    assert_that(sorted(crawler.dirs)).is_equal_to(sorted(dirs))
@@ -1,6 +1,15 @@
+from functools import lru_cache
+
 from assertpy import assert_that
 
 
+# bit of a CorpusIndex flag that caches is_boundary
+BOUNDARY_FLAG = 0b0001
+# bit of a CorpusIndex flag set for uppercase chars. With the index' lowercase bytes, it tells which ASCII char a text
+# has without going through the str
+UPPER_FLAG = 0b1_0000
+
+
 def is_boundary(text, idx):
     return idx == 0 or text[idx - 1] in {" ", "_", "/", "."} or \
         (ord(text[idx]) & 0b0010_0000) ^ (ord(text[idx - 1]) & 0b0010_0000) == 32
@@ -55,8 +64,19 @@ _Ab = lambda text, idx: is_boundary(text, idx)
 # const of boundary. Axyz | a has the cost of Qb i.e. ignore xyz distance because A is the beginning of a word
 _Qb = -1
 
+# cost of an edit i.e. a pattern char that had to be left out to match, in typo tolerant matching (see typo.Typo).
+# Much higher than _Qd so a typo costs more than the gaps of most exact matches
+_Qe = -10
 
-def score(text, pattern, ignore_case=True):
+
+def score(text, pattern, ignore_case=True, flags=None, lower=None):
+    """
+    `flags` is the text's CorpusIndex flags. If given, boundaries are read from it instead of being computed. `lower`
+    is the text's CorpusIndex lowercase bytes, None unless it's ASCII. With both, chars are compared as ints straight
+    from them (see _score_ascii), for the same score.
+    """
+    if lower is not None:
+        return _score_ascii(lower, flags, pattern, ignore_case)
     i = len(text)
     j = len(pattern)
     _score = 0
@@ -70,7 +90,7 @@ def score(text, pattern, ignore_case=True):
             j -= 1
             _score += _Qc
 
-            boundary = _Ab(text, i)
+            boundary = _Ab(text, i) if flags is None else flags[i] & BOUNDARY_FLAG
             if boundary:
                 _score += 0 if _di_acc == 0 else _Qb
             else:
@@ -90,11 +110,83 @@ def score(text, pattern, ignore_case=True):
                 # should we count it as QDi as well?
                 # _score += _QDi
 
-        boundary = _Ab(text, i)
+        boundary = _Ab(text, i) if flags is None else flags[i] & BOUNDARY_FLAG
     # print(f"{'✓' if j == 0 else '✗'} [{_score}] ∈ {text} | {pattern}")
     return _score if j == 0 else None
 
 
+def positions(text, pattern, ignore_case=True):
+    """
+    Indices of text that score matched pattern with, in order, or None if it doesn't match. Only meant for the few
+    results that are shown, so it's a loop of its own rather than something score keeps track of.
+    """
+    i = len(text)
+    j = len(pattern)
+    matched = []
+    while i > 0 and j > 0:
+        i -= 1
+        if (text[i] == pattern[j - 1]) or (ignore_case and eq_ignore_case(text[i], pattern[j - 1])):
+            j -= 1
+            matched.append(i)
+    return matched[::-1] if j == 0 else None
+
+
+@lru_cache(maxsize=256)
+def _ascii_tables(pattern, ignore_case=True) -> list[bytes]:
+    """
+    Per pattern char, by lowercase byte, which ASCII text chars match it the way score compares them: bit 1 if the
+    uppercase one does, bit 2 if the other one does. eq_ignore_case takes any two chars 32 apart, so "0" matches "P"
+    but not "p", and it takes the case to tell.
+    """
+    tables = []
+    for p in pattern:
+        table = bytearray(128)
+        for code in range(128):
+            c = chr(code)
+            if c == p or (ignore_case and eq_ignore_case(c, p)):
+                table[ord(c.lower())] |= 1 if c.isupper() else 2
+        tables.append(bytes(table))
+    return tables
+
+
+def _score_ascii(lower, flags, pattern, ignore_case=True):
+    """score of an ASCII text from its CorpusIndex lowercase bytes and flags"""
+    tables = _ascii_tables(pattern, ignore_case)
+    i = len(lower)
+    j = len(pattern)
+    _score = 0
+
+    _di_acc = 0
+
+    boundary = False
+    while i > 0:
+        i -= 1
+        m = tables[j - 1][lower[i]]
+        if m == 3 or (m and m & (1 if flags[i] & UPPER_FLAG else 2)):
+            j -= 1
+            _score += _Qc
+
+            boundary = flags[i] & BOUNDARY_FLAG
+            if boundary:
+                _score += 0 if _di_acc == 0 else _Qb
+            else:
+                _score += 0 if _di_acc == 0 else _QDi
+                _score += _di_acc
+            _di_acc = 0
+
+            if j == 0:
+                _score += _Qk(i)
+                break
+        else:
+            _di_acc += _Qd
+            if boundary:
+                _score += _di_acc
+                _di_acc = 0
+
+        boundary = flags[i] & BOUNDARY_FLAG
+    return _score if j == 0 else None
+
+
 # const unrolled values to make assertion in tests more clear
 _Qk0 = _Qk(0)
 _Qk1 = _Qk(23)
@@ -202,3 +294,27 @@ if __name__ == '__main__':
 def test_boundary_score():
     s = score("xyAdxyBxy", "ad")
     print(s)
+
+
+def test_score_ascii():
+    from corpus_index import CorpusIndex
+
+    texts = ["", "a", "sabcdbc", "xAxyz", "_axyz", "Aa", "saxyybyzxcy", "0P0p@`[{", "fooBAR-Baz.txt",
+             "./Documentation/devicetree/bindings/display/panel/sharp,ls037v7dw01.yaml", "./arch/arm64/boot/dts"]
+    index = CorpusIndex(texts)
+    for row, text in enumerate(texts):
+        for pattern in ["a", "ad", "abc", "A", "0", "P", "p", "@", "`", "{", "sharpd", "dts", "arm64/", "ñ", "\x80"]:
+            for ignore_case in [True, False]:
+                expected = score(text, pattern, ignore_case, index.flags_of(row))
+                assert_that(score(text, pattern, ignore_case, index.flags_of(row), index.lower_of(row))) \
+                    .described_as(f"{text} | {pattern}").is_equal_to(expected)
+
+
+def test_positions():
+    assert_that(positions("sabcd", "ad")).is_equal_to([1, 4])
+    print("the rightmost match, like score")
+    assert_that(positions("sabcdbc", "ad")).is_equal_to([1, 4])
+    assert_that(positions("xAxa", "A")).is_equal_to([3])
+    assert_that(positions("xAxa", "A", ignore_case=False)).is_equal_to([1])
+    assert_that(positions("sabcd", "xy")).is_none()
+    assert_that(positions("", "")).is_equal_to([])
@@ -0,0 +1,169 @@
+import numpy as np
+from assertpy import assert_that
+
+from fuzzy_score_1 import score, _Qc, _Qd, _QDi, _Qb, _Qk
+
+# score_many's value for a text that doesn't match i.e. where score returns None
+NO_MATCH = np.iinfo(np.int32).min
+
+_boundary_chars = np.array([ord(c) for c in (" ", "_", "/", ".")])
+
+
+class EncodedCorpus:
+    """
+    The corpus as a padded code point matrix (one row per text) plus a length vector. `boundary` is is_boundary
+    of every cell. Both have one extra column of padding, so `boundary[:, i + 1]` is always valid and False past the
+    end of a text. The matrices are column major since score_many walks them one column at a time.
+    """
+
+    def __init__(self, texts: list[str]) -> None:
+        self.lengths = np.fromiter((len(t) for t in texts), dtype=np.int32, count=len(texts))
+        width = int(self.lengths.max(initial=0)) + 1
+
+        joined = "".join(texts)
+        if joined.isascii():
+            flat = np.frombuffer(joined.encode("ascii"), dtype=np.uint8)
+        else:
+            flat = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32)
+
+        rows = np.repeat(np.arange(len(texts)), self.lengths)
+        starts = np.cumsum(self.lengths) - self.lengths
+        cols = np.arange(len(flat)) - np.repeat(starts, self.lengths)
+
+        self.codes = np.zeros((len(texts), width), dtype=flat.dtype, order="F")
+        self.codes[rows, cols] = flat
+
+        in_text = np.arange(width) < self.lengths[:, None]
+        prev = self.codes[:, :-1]
+        cur = self.codes[:, 1:]
+        self.boundary = np.zeros((len(texts), width), dtype=bool, order="F")
+        self.boundary[:, 0] = True
+        self.boundary[:, 1:] = np.isin(prev, _boundary_chars) | (((cur ^ prev) & 0b0010_0000) == 32)
+        self.boundary &= in_text
+
+        # rows by descending length; longer_than[i] of them are longer than i
+        self.order = np.argsort(-self.lengths, kind="stable")
+        self.longer_than = np.cumsum(np.bincount(self.lengths, minlength=width + 1)[::-1])[::-1][1:]
+
+    def __len__(self):
+        return len(self.lengths)
+
+
+def score_many(corpus, pattern: str, ignore_case=True) -> np.ndarray:
+    """
+    fuzzy_score_1.score of every text in `corpus` (an EncodedCorpus or a list of str) as an int32 array, with
+    NO_MATCH in place of None. It runs the same backward match as score, one column at a time over the rows
+    that are still matching. A row joins once i reaches its last character and leaves as soon as it's found.
+    """
+    if not isinstance(corpus, EncodedCorpus):
+        corpus = EncodedCorpus(corpus)
+    if len(pattern) == 0:
+        raise ValueError("pattern can't be empty")
+
+    p = np.array([ord(c) for c in pattern], dtype=np.int32)
+    result = np.full(len(corpus), NO_MATCH, dtype=np.int32)
+
+    live = np.empty(0, dtype=np.intp)
+    j = np.empty(0, dtype=np.int32)
+    _score = np.empty(0, dtype=np.int32)
+    _di_acc = np.empty(0, dtype=np.int32)
+
+    joined = 0
+    for i in range(corpus.codes.shape[1] - 2, -1, -1):
+        if corpus.longer_than[i] > joined:
+            rows = corpus.order[joined:corpus.longer_than[i]]
+            joined = corpus.longer_than[i]
+            live = np.concatenate((live, rows))
+            j = np.concatenate((j, np.full(len(rows), len(p), dtype=np.int32)))
+            _score = np.concatenate((_score, np.zeros(len(rows), dtype=np.int32)))
+            _di_acc = np.concatenate((_di_acc, np.zeros(len(rows), dtype=np.int32)))
+        if len(live) == 0:
+            continue
+
+        diff = corpus.codes[:, i][live].astype(np.int32) - p[j - 1]
+        copy = diff == 0
+        if ignore_case:
+            copy |= np.abs(diff) == 32
+
+        # copy: Qc, then Qb or QDi if there was a distance, plus the distance itself when not on a boundary
+        c = np.flatnonzero(copy)
+        if len(c):
+            on_boundary = corpus.boundary[:, i][live[c]]
+            di = _di_acc[c]
+            _score[c] += _Qc + np.where(di != 0, np.where(on_boundary, _Qb, _QDi), 0) + np.where(on_boundary, 0, di)
+            j[c] -= 1
+
+        # delete: the boundary flag is the one of the previously visited i.e. the next character
+        next_boundary = corpus.boundary[:, i + 1][live]
+        acc = _di_acc + _Qd
+        _score += np.where(next_boundary & ~copy, acc, 0)
+        _di_acc = np.where(copy | next_boundary, 0, acc)
+
+        found = j == 0
+        if found.any():
+            result[live[found]] = _score[found] + _Qk(i)
+            keep = ~found
+            live, j, _score, _di_acc = live[keep], j[keep], _score[keep], _di_acc[keep]
+
+    return result
+
+
+def _expected(texts, pattern):
+    return [NO_MATCH if (s := score(t, pattern)) is None else s for t in texts]
+
+
+def test_encoded_corpus():
+    corpus = EncodedCorpus(["ab", "", "xyz_A"])
+    assert_that(corpus.lengths.tolist()).is_equal_to([2, 0, 5])
+    assert_that(corpus.codes.shape).is_equal_to((3, 6))
+    assert_that(corpus.codes.dtype).is_equal_to(np.uint8)
+    assert_that(corpus.boundary[2].tolist()).is_equal_to([True, False, False, True, True, False])
+    assert_that(corpus.boundary[1].any()).is_false()
+
+    corpus = EncodedCorpus(["añb"])
+    assert_that(corpus.codes.dtype).is_equal_to(np.uint32)
+    assert_that(corpus.codes[0, 1]).is_equal_to(ord("ñ"))
+
+
+def test_score_many_same_as_score():
+    texts = ["", "a", "ad", "sad", "sabcd", "sabcdbc", "saxyybyzxcy", "_axyz", "_A", "Aa", "Xaxyz", "xAxxyz",
+             "ssaxyzBxyz", "ssaxyzBxyzCxyz", "ssCxyzaxyzBxyzCxyz", "sayYxbyZxcy", "AxyzBzyzCxyz", "axyzbzyzcxyz",
+             "xyAdxyBxy", "xyadxybxy", "x/o.n", "./arch/arm/boot/compressed/head-sharpsl.S", "añbñc"]
+    for pattern in ["a", "ad", "abc", "AB", "on", "sharp", "ñc", "/"]:
+        for ignore_case in [True, False]:
+            actual = score_many(texts, pattern, ignore_case).tolist()
+            expected = [NO_MATCH if (s := score(t, pattern, ignore_case)) is None else s for t in texts]
+            assert_that(actual).described_as(pattern).is_equal_to(expected)
+
+
+def test_score_many_linux_files():
+    import os
+    path = os.path.join(os.path.dirname(__file__), "../benchmark_data/linux_files_list.txt")
+    with open(path) as f:
+        texts = f.readlines()[:5000]
+
+    corpus = EncodedCorpus(texts)
+    for pattern in ["sharpd", "dts", "Kconfig", "mm/"]:
+        assert_that(score_many(corpus, pattern).tolist()).is_equal_to(_expected(texts, pattern))
+
+
+if __name__ == '__main__':
+    import time
+
+    with open("../benchmark_data/linux_files_list.txt", 'r') as text_file:
+        _texts = text_file.readlines()
+
+    t0 = time.perf_counter()
+    _corpus = EncodedCorpus(_texts)
+    print(f"encode: {time.perf_counter() - t0:.3f}s")
+
+    for _pattern in ["s", "sharp", "sharpd", "drivers/gpu"]:
+        t0 = time.perf_counter()
+        for _t in _texts:
+            score(_t, _pattern)
+        scalar = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        score_many(_corpus, _pattern)
+        batch = time.perf_counter() - t0
+        print(f"{_pattern:12} score: {scalar:.3f}s  score_many: {batch:.3f}s  ({scalar / batch:.1f}x)")
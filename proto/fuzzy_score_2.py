@@ -4,6 +4,11 @@ from assertpy import assert_that
 
 boundary_set = {" ", "_", "-", "/", "."}
 
+# bits of a CorpusIndex flag that cache is_start_boundary, is_end_boundary and Boundary.MIDDLE
+START_FLAG = 0b0010
+END_FLAG = 0b0100
+MIDDLE_FLAG = 0b1000
+
 
 def case_is_different(a, b):
     return (ord(a) & 0b0010_0000) ^ (ord(b) & 0b0010_0000) == 32
@@ -131,7 +136,11 @@ class Boundary(Enum):
     END = 1
 
     @staticmethod
-    def boundary(text: str, _current: int):
+    def boundary(text: str, _current: int, flags=None):
+        if flags is not None:
+            f = flags[_current]
+            return Boundary.MIDDLE if f & MIDDLE_FLAG else Boundary.START if f & START_FLAG else Boundary.END
+
         boundary_set = {" ", "_", "-", "/", "."}
         if text[_current] in boundary_set:
             return Boundary.MIDDLE
@@ -234,7 +243,8 @@ class Score:
         return f"copy : {self._copy}\nstrat:{self._straight}\ndelet: {self._delete}\nbound: {self._boundary}\nkill : {self._kill}\nSCORE: {self.score()}"
 
 
-def fuzzy_search_2(text: str, pattern: str):
+def fuzzy_search_2(text: str, pattern: str, flags=None):
+    """`flags` is the text's CorpusIndex flags. If given, boundaries are read from it instead of being computed"""
     _score = Score()
     _di_acc = 0
     _straight_acc = 0
@@ -253,6 +263,8 @@ def fuzzy_search_2(text: str, pattern: str):
     prev_start = current_start_i
     prev_end = current_end_i
 
+    found = False
+
     # for debugging
     boundaries = []
 
@@ -270,8 +282,12 @@ def fuzzy_search_2(text: str, pattern: str):
             _i -= 1
 
     while i >= 0:
-        start_boundary = is_start_boundary(text, i)
-        end_boundary = is_end_boundary(text, i)
+        if flags is None:
+            start_boundary = is_start_boundary(text, i)
+            end_boundary = is_end_boundary(text, i)
+        else:
+            start_boundary = flags[i] & START_FLAG
+            end_boundary = flags[i] & END_FLAG
         if start_boundary:
             current_start_i = i
             boundary = None
@@ -299,6 +315,7 @@ def fuzzy_search_2(text: str, pattern: str):
             if j == 0:
                 commit_straight()
                 commit_boundary()
+                found = True
                 break
             j -= 1
             current_p = pattern[j]
@@ -318,7 +335,8 @@ def fuzzy_search_2(text: str, pattern: str):
 
         i -= 1
 
-    calculate_kill(i - 1)
+    if found:
+        calculate_kill(i - 1)
     # for b in boundaries:
     #     print(b)
     # print("------")
@@ -326,7 +344,209 @@ def fuzzy_search_2(text: str, pattern: str):
     # print(f"{'✓' if j == 0 else '✗'} [{_score}] ∈ {text} | {pattern}")
 
     # return _score.score() if j == 0 else None
-    return _score if j == 0 else None
+    return _score if found else None
+
+
+def fuzzy_search_2_score(text: str, pattern: str, flags=None, lower=None):
+    """
+    Same as fuzzy_search_2(text, pattern).score() but without a Score: counters are locals and boundaries are kept as
+    lengths instead of slices. Use fuzzy_search_2 to get the breakdown of a result that is shown.
+
+    `lower` is the text's CorpusIndex lowercase bytes, None unless it's ASCII. With it and `flags`, chars are compared
+    as ints straight from them instead of lowering every one (see _fuzzy_search_2_score_ascii).
+    """
+    if lower is not None:
+        return _fuzzy_search_2_score_ascii(lower, flags, pattern)
+    i = len(text) - 1
+    j = len(pattern) - 1
+    if i < 0 or j < 0:
+        return None
+
+    _copy = _delete = _boundary = _straight = 0
+    _di_acc = 0
+    _straight_acc = 0
+
+    current_p = pattern[j]
+    prev_p = pattern[j]
+    boundary_len = 0
+
+    current_start_i = -1
+    current_end_i = -1
+    prev_start = current_start_i
+    prev_end = current_end_i
+
+    while i >= 0:
+        if flags is None:
+            start_boundary = is_start_boundary(text, i)
+            end_boundary = is_end_boundary(text, i)
+        else:
+            start_boundary = flags[i] & START_FLAG
+            end_boundary = flags[i] & END_FLAG
+        if start_boundary:
+            current_start_i = i
+            boundary_len = 0
+        if end_boundary:
+            boundary_len = 0
+            current_end_i = i + 1
+
+        if current_start_i != prev_start and current_end_i != prev_end:
+            boundary_len = max(current_end_i - current_start_i, 0)
+            prev_end = current_end_i
+            prev_start = current_start_i
+
+        c = text[i].lower()
+        if c == current_p:
+            _copy += 1
+            _straight_acc += 1
+            if boundary_len:
+                _di_acc = 0
+                if _straight_acc != boundary_len:
+                    _boundary += 1
+
+            prev_p = pattern[j]
+
+            if j == 0:
+                _straight += (2 << _straight_acc) - 1
+                _delete += _di_acc
+
+                # kill: chars between the match and the previous "/"
+                _kill = 0
+                _i = i - 1
+                while text[_i] != "/" and _i >= 0:
+                    _kill += 1
+                    _i -= 1
+
+                return _copy * Score._qc + _delete * Score._qd + _boundary * Score._qb + _straight + \
+                    _kill * Score._qk
+            j -= 1
+            current_p = pattern[j]
+
+        elif c == prev_p:
+            _copy += 1
+
+        else:
+            _di_acc += 1
+            if _straight_acc > 0:
+                _straight += (2 << _straight_acc) - 1
+
+            _straight_acc = 0
+
+        if boundary_len:
+            _delete += _di_acc
+            _di_acc = 0
+
+        i -= 1
+
+    return None
+
+
+def _fuzzy_search_2_score_ascii(lower, flags, pattern: str):
+    """fuzzy_search_2_score of an ASCII text from its CorpusIndex lowercase bytes and flags"""
+    i = len(lower) - 1
+    j = len(pattern) - 1
+    if i < 0 or j < 0:
+        return None
+
+    _copy = _delete = _boundary = _straight = 0
+    _di_acc = 0
+    _straight_acc = 0
+
+    # a pattern char that isn't ASCII matches no byte, as lowering an ASCII char never gives one
+    codes = [ord(p) for p in pattern]
+    current_p = codes[j]
+    prev_p = codes[j]
+    boundary_len = 0
+
+    current_start_i = -1
+    current_end_i = -1
+    prev_start = current_start_i
+    prev_end = current_end_i
+
+    while i >= 0:
+        f = flags[i]
+        if f & START_FLAG:
+            current_start_i = i
+            boundary_len = 0
+        if f & END_FLAG:
+            boundary_len = 0
+            current_end_i = i + 1
+
+        if current_start_i != prev_start and current_end_i != prev_end:
+            boundary_len = max(current_end_i - current_start_i, 0)
+            prev_end = current_end_i
+            prev_start = current_start_i
+
+        c = lower[i]
+        if c == current_p:
+            _copy += 1
+            _straight_acc += 1
+            if boundary_len:
+                _di_acc = 0
+                if _straight_acc != boundary_len:
+                    _boundary += 1
+
+            prev_p = codes[j]
+
+            if j == 0:
+                _straight += (2 << _straight_acc) - 1
+                _delete += _di_acc
+
+                _kill = 0
+                _i = i - 1
+                while lower[_i] != 47 and _i >= 0:  # "/"
+                    _kill += 1
+                    _i -= 1
+
+                return _copy * Score._qc + _delete * Score._qd + _boundary * Score._qb + _straight + \
+                    _kill * Score._qk
+            j -= 1
+            current_p = codes[j]
+
+        elif c == prev_p:
+            _copy += 1
+
+        else:
+            _di_acc += 1
+            if _straight_acc > 0:
+                _straight += (2 << _straight_acc) - 1
+
+            _straight_acc = 0
+
+        if boundary_len:
+            _delete += _di_acc
+            _di_acc = 0
+
+        i -= 1
+
+    return None
+
+
+def positions(text: str, pattern: str):
+    """
+    Indices of text that fuzzy_search_2 counted as copies, in order, or None if it doesn't match. Besides the match of
+    each pattern char, that's the repeats of a matched char right before it ("abb" | "ab" is 0, 1, 2). Matches don't
+    depend on boundaries, so no flags. Only meant for the few results that are shown.
+    """
+    i = len(text) - 1
+    j = len(pattern) - 1
+    if i < 0 or j < 0:
+        return None
+
+    current_p = prev_p = pattern[j]
+    matched = []
+    while i >= 0:
+        c = text[i].lower()
+        if c == current_p:
+            matched.append(i)
+            if j == 0:
+                return matched[::-1]
+            prev_p = current_p
+            j -= 1
+            current_p = pattern[j]
+        elif c == prev_p:
+            matched.append(i)
+        i -= 1
+    return None
 
 
 def test_search_debug():
@@ -419,11 +639,57 @@ def test_search():
         s2 = fuzzy_search_2("foo_bar", "fb").score()
         assert s1 > s2
 
+    def no_match():
+        s = fuzzy_search_2("xyz", "a")
+        assert_that(s).is_none()
+        s = fuzzy_search_2("xyz", "ax")
+        assert_that(s).is_none()
+
     base_match()
     straight()
     boundary()
     kill()
     relative()
+    no_match()
+
+
+def test_search_score():
+    texts = ["a", "aa", "ab", "aabb", "aabab", "abb", "abxab", "BarFoo", "FooBar", "foo_bar", "/foo_bar", "yxfoo_bar",
+             "yx/xyfoo_bar", "yx/xyfoo_bar\n", "xyz", "fooBAR-Baz.txt", "./Documentation/devicetree/bindings/display/"
+             "panel/sharp,ls037v7dw01.yaml", "./Documentation/devicetree/bindings/display/panel/sharp,ld-d5116z01b.yaml"]
+    for text in texts:
+        for pattern in ["a", "ab", "abab", "fb", "f", "f_b", "sharpd", "dts", "z", "B"]:
+            s = fuzzy_search_2(text, pattern)
+            expected = None if s is None else s.score()
+            assert_that(fuzzy_search_2_score(text, pattern)).described_as(f"{text} | {pattern}").is_equal_to(expected)
+
+
+def test_search_score_ascii():
+    from corpus_index import CorpusIndex
+
+    texts = ["a", "aa", "aabab", "abxab", "BarFoo", "FooBar", "foo_bar", "yx/xyfoo_bar", "xyfoo_bar/", "K_K",
+             "fooBAR-Baz.txt", "./Documentation/devicetree/bindings/display/panel/sharp,ls037v7dw01.yaml", ""]
+    index = CorpusIndex(texts)
+    for row, text in enumerate(texts):
+        for pattern in ["a", "ab", "abab", "fb", "f_b", "sharpd", "dts", "z", "B", "ñ", "k"]:
+            expected = fuzzy_search_2_score(text, pattern, index.flags_of(row))
+            assert_that(fuzzy_search_2_score(text, pattern, index.flags_of(row), index.lower_of(row))) \
+                .described_as(f"{text} | {pattern}").is_equal_to(expected)
+
+
+def test_positions():
+    assert_that(positions("abb", "ab")).is_equal_to([0, 1, 2])
+    assert_that(positions("abxab", "abab")).is_equal_to([0, 1, 3, 4])
+    assert_that(positions("FooBar", "fb")).is_equal_to([0, 3])
+    assert_that(positions("xyz", "ax")).is_none()
+    for text in ["aabb", "aabab", "yx/xyfoo_bar",
+                 "./Documentation/devicetree/bindings/display/panel/sharp,ls037v7dw01.yaml"]:
+        for pattern in ["ab", "fb", "sharpd", "b"]:
+            s = fuzzy_search_2(text, pattern)
+            matched = positions(text, pattern)
+            assert_that(matched is None).is_equal_to(s is None)
+            if s is not None:
+                assert_that(matched).is_length(s._copy)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,256 @@
+import hashlib
+import mmap
+import os
+import struct
+from array import array
+
+from assertpy import assert_that
+
+from corpus import MappedCorpus
+from corpus_index import CorpusIndex
+from inverted_index import InvertedIndex
+from prefilter import NON_ASCII, Prefilter, lower_requirement
+
+# bump on any change of the layout below; files of another version are rebuilt
+VERSION = 2
+MAGIC = b"VFSZIDX\0"
+
+# magic, version, corpus size, corpus mtime_ns, corpus blake2b, line count, section count
+_HEADER = struct.Struct("<8sIQQ32sQI")
+# name, array typecode, offset, length in bytes
+_SECTION = struct.Struct("<16scQQ")
+
+_MASK_BYTES = (NON_ASCII.bit_length() + 7) // 8
+# where the corpus mtime_ns is in the header: after the magic, version and corpus size
+_MTIME_OFFSET = 8 + 4 + 8
+
+_SECTIONS = {"line_offsets", "index_offsets", "flags", "lower", "ascii", "separators", "separator_offs", "masks",
+             "postings"}
+
+
+def cache_path(corpus_path: str) -> str:
+    return corpus_path + ".idx"
+
+
+def _hash(path: str) -> bytes:
+    h = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        while block := f.read(1 << 20):
+            h.update(block)
+    return h.digest()
+
+
+class Indexes:
+    """Everything the search needs for one corpus file, either built or loaded from its cache"""
+
+    def __init__(self, texts: MappedCorpus, index: CorpusIndex, prefilter: Prefilter, inverted: InvertedIndex):
+        self.texts = texts
+        self.index = index
+        self.prefilter = prefilter
+        self.inverted = inverted
+
+    def close(self):
+        self.texts.close()
+
+
+def build(corpus_path: str, requirement=lower_requirement) -> Indexes:
+    texts = MappedCorpus(corpus_path)
+    return Indexes(texts, CorpusIndex(texts), Prefilter(texts, requirement), InvertedIndex(texts, requirement))
+
+
+def save(indexes: Indexes, corpus_path: str, path=None):
+    """
+    Writes the indexes next to the corpus: a header with the corpus fingerprint, a section table, then every section
+    8-byte aligned so it can be used straight out of an mmap. Written to a temporary file first, then renamed.
+    """
+    path = path or cache_path(corpus_path)
+    n = len(indexes.texts)
+    index = indexes.index
+    inverted = indexes.inverted
+
+    masks = b"".join(m.to_bytes(_MASK_BYTES, "little") for m in indexes.prefilter.masks)
+    bitmap_bytes = (n + 7) // 8
+    postings = b"".join(b.to_bytes(bitmap_bytes, "little") for b in inverted.postings + [inverted.non_ascii])
+
+    sections = [
+        ("line_offsets", indexes.texts.offsets.typecode, indexes.texts.offsets),
+        ("index_offsets", "I", index.offsets),
+        ("flags", "B", index.flags),
+        ("lower", "B", index.lower),
+        ("ascii", "B", index.ascii),
+        ("separators", "I", index.separators),
+        ("separator_offs", "I", index.separator_offsets),
+        ("masks", "B", masks),
+        ("postings", "B", postings),
+    ]
+
+    stat = os.stat(corpus_path)
+    header = _HEADER.pack(MAGIC, VERSION, stat.st_size, stat.st_mtime_ns, _hash(corpus_path), n, len(sections))
+    offset = _HEADER.size + _SECTION.size * len(sections)
+    table = []
+    data = []
+    for name, typecode, values in sections:
+        raw = memoryview(values).cast("B")
+        offset += -offset % 8
+        table.append(_SECTION.pack(name.encode(), typecode.encode(), offset, len(raw)))
+        data.append(raw)
+        offset += len(raw)
+
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        f.writelines(table)
+        for raw in data:
+            f.write(b"\0" * (-f.tell() % 8))
+            f.write(raw)
+    os.replace(tmp, path)
+
+
+def load(corpus_path: str, requirement=lower_requirement, path=None):
+    """
+    Indexes from the cache file, or None if there isn't one or it's stale, of another version or damaged (e.g. cut
+    short by a full disk), so that it is rebuilt
+    """
+    path = path or cache_path(corpus_path)
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+
+    with f:
+        # an empty file can't be mapped
+        if os.fstat(f.fileno()).st_size < _HEADER.size:
+            return None
+        cache = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, size, mtime_ns, digest, n, count = _HEADER.unpack_from(cache)
+    if magic != MAGIC or version != VERSION or _HEADER.size + count * _SECTION.size > len(cache):
+        return None
+
+    stat = os.stat(corpus_path)
+    if stat.st_size != size:
+        return None
+    if stat.st_mtime_ns != mtime_ns:
+        if _hash(corpus_path) != digest:
+            return None
+        # touched but not changed: the next launch needn't hash it again
+        _set_mtime(path, stat.st_mtime_ns)
+
+    view = memoryview(cache)
+    sections = {}
+    for k in range(count):
+        name, typecode, offset, length = _SECTION.unpack_from(cache, _HEADER.size + k * _SECTION.size)
+        if offset + length > len(cache):
+            return None
+        try:
+            sections[name.rstrip(b"\0").decode()] = view[offset:offset + length].cast(typecode.decode())
+        except (UnicodeDecodeError, ValueError, TypeError):
+            return None
+    if not _SECTIONS <= sections.keys():
+        return None
+
+    masks = sections["masks"]
+    postings = sections["postings"]
+    bitmap_bytes = (n + 7) // 8
+    if (len(sections["line_offsets"]) != n + 1 or len(sections["index_offsets"]) != n + 1 or
+            len(masks) != n * _MASK_BYTES or len(postings) != 129 * bitmap_bytes):
+        return None
+
+    index = CorpusIndex.from_arrays(sections["index_offsets"], sections["flags"], sections["lower"],
+                                    sections["ascii"], sections["separators"], sections["separator_offs"])
+
+    prefilter = Prefilter([], requirement, [int.from_bytes(masks[i:i + _MASK_BYTES], "little")
+                                            for i in range(0, len(masks), _MASK_BYTES)])
+
+    bitmaps = [int.from_bytes(postings[i:i + bitmap_bytes], "little") for i in range(0, 129 * bitmap_bytes,
+                                                                                        bitmap_bytes)]
+    inverted = InvertedIndex.from_bitmaps(n, bitmaps[:128], bitmaps[128], requirement)
+
+    texts = MappedCorpus(corpus_path, sections["line_offsets"])
+    return Indexes(texts, index, prefilter, inverted)
+
+
+def _set_mtime(path: str, mtime_ns: int):
+    """Rewrites the corpus mtime of the header in place. A cache that can't be written is left as it is"""
+    try:
+        with open(path, 'r+b') as f:
+            f.seek(_MTIME_OFFSET)
+            f.write(struct.pack("<Q", mtime_ns))
+    except OSError:
+        pass
+
+
+def open_indexes(corpus_path: str, requirement=lower_requirement, rebuild=False) -> Indexes:
+    """Loads the cache of the corpus, or builds the indexes and writes the cache when it can't"""
+    indexes = None if rebuild else load(corpus_path, requirement)
+    if indexes is None:
+        indexes = build(corpus_path, requirement)
+        save(indexes, corpus_path)
+    return indexes
+
+
+def test_index_cache(tmp_path):
+    corpus_path = str(tmp_path / "files.txt")
+    with open(corpus_path, 'w') as f:
+        f.write("./arch/arm/boot/head-sharpsl.S\n./drivers/gpu/drm/panel-sharp.c\n./añb/Kconfig\n./mm/slab.c\n")
+
+    assert_that(load(corpus_path)).is_none()
+    built = open_indexes(corpus_path)
+    loaded = load(corpus_path)
+    assert_that(loaded).is_not_none()
+
+    assert_that(list(loaded.texts)).is_equal_to(list(built.texts))
+    assert_that(list(loaded.index.offsets)).is_equal_to(list(built.index.offsets))
+    for row in range(len(built.texts)):
+        assert_that(bytes(loaded.index.flags_of(row))).is_equal_to(bytes(built.index.flags_of(row)))
+        assert_that(list(loaded.index.separators_of(row))).is_equal_to(list(built.index.separators_of(row)))
+        lower = built.index.lower_of(row)
+        assert_that(loaded.index.lower_of(row)).is_equal_to(None if lower is None else lower)
+    assert_that(loaded.prefilter.masks).is_equal_to(built.prefilter.masks)
+    for pattern in ["sharp", "kconfig", "s"]:
+        assert_that(loaded.inverted.candidates(pattern)).is_equal_to(built.inverted.candidates(pattern))
+    loaded.close()
+    built.close()
+
+    print("same size and mtime changed: still valid if the hash is the same, and the new mtime is kept")
+    os.utime(corpus_path, ns=(0, 0))
+    assert_that(load(corpus_path)).is_not_none()
+    with open(cache_path(corpus_path), 'rb') as f:
+        assert_that(_HEADER.unpack(f.read(_HEADER.size))[3]).is_equal_to(0)
+
+    with open(corpus_path, 'a') as f:
+        f.write("./README\n")
+    assert_that(load(corpus_path)).is_none()
+
+    indexes = open_indexes(corpus_path)
+    assert_that(len(indexes.texts)).is_equal_to(5)
+    indexes.close()
+
+    with open(cache_path(corpus_path), 'rb') as f:
+        good = f.read()
+    print("a damaged cache is rebuilt rather than read")
+    for damaged in [b"", good[:_HEADER.size + 10], good[:-20], good.replace(b"postings", b"postingz")]:
+        with open(cache_path(corpus_path), 'wb') as f:
+            f.write(damaged)
+        assert_that(load(corpus_path)).is_none()
+    indexes = open_indexes(corpus_path)
+    assert_that(len(indexes.texts)).is_equal_to(5)
+    indexes.close()
+
+    with open(cache_path(corpus_path), 'r+b') as f:
+        f.seek(8)
+        f.write(struct.pack("<I", VERSION + 1))
+    assert_that(load(corpus_path)).is_none()
+
+
+if __name__ == '__main__':
+    import time
+
+    _path = "../benchmark_data/linux_files_list.txt"
+    t0 = time.perf_counter()
+    _indexes = open_indexes(_path, rebuild=True)
+    print(f"build + save: {time.perf_counter() - t0:.3f}s")
+    _indexes.close()
+
+    t0 = time.perf_counter()
+    _indexes = open_indexes(_path)
+    print(f"load: {time.perf_counter() - t0:.3f}s")
@@ -0,0 +1,190 @@
+import re
+
+from assertpy import assert_that
+
+from prefilter import NON_ASCII, lower_requirement
+
+_nonzero_byte = re.compile(b"[^\x00]")
+_bits_of_byte = [[bit for bit in range(8) if b >> bit & 1] for b in range(256)]
+
+
+def _bitmap(ids: list[int], n: int) -> int:
+    """Sorted line ids as an int with bit i set for line i"""
+    data = bytearray((n + 7) // 8)
+    for i in ids:
+        data[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(data, "little")
+
+
+def bitmap_ids(bitmap: int) -> list[int]:
+    """Set bits of the bitmap in order. Runs of zero bytes are skipped by the regex engine"""
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    ids = []
+    for m in _nonzero_byte.finditer(data):
+        base = m.start() << 3
+        ids.extend(base + bit for bit in _bits_of_byte[data[m.start()]])
+    return ids
+
+
+def _chars(requirement_mask: int) -> list[int]:
+    return [c for c in range(128) if requirement_mask >> c & 1]
+
+
+def _pairs(text: str):
+    """Every "ab" where a comes before b somewhere in the text"""
+    first = {}
+    for k, c in enumerate(text):
+        first.setdefault(c, k)
+    last = {c: k for k, c in enumerate(text)}
+    return [a + b for a, fa in first.items() for b, lb in last.items() if fa < lb]
+
+
+class InvertedIndex:
+    """
+    Posting lists of line ids for every ASCII char, stored as bitmaps (Python ints), so a query is a few ANDs/ORs of
+    them and only the lines with every pattern char come out. `requirement` says which text chars match a pattern
+    char, same as for Prefilter. Lines with non-ASCII chars are always candidates.
+
+    With `bigrams`, there is also a posting list for every ordered pair (a, b) where a comes before b somewhere in
+    the line, so "ab" and "ba" are told apart. It's a lot slower to build.
+    """
+
+    def __init__(self, texts: list[str], requirement=lower_requirement, bigrams=False) -> None:
+        self.requirement = requirement
+        self.n = 0
+        self.postings = [0] * 128
+        self.non_ascii = 0
+        self.pairs = {} if bigrams else None
+        self.extend(texts)
+
+    def extend(self, texts) -> range:
+        """
+        Adds the texts at the end and returns their ids. Their posting lists are built on their own and shifted into
+        place, so each list is copied once per call; add a batch at a time rather than one text at a time.
+        """
+        start = self.n
+        postings = [[] for _ in range(128)]
+        non_ascii = []
+        pairs = {}
+        i = -1
+        for i, text in enumerate(texts):
+            if not text.isascii():
+                non_ascii.append(i)
+                continue
+            for c in set(text):
+                postings[ord(c)].append(i)
+            if self.pairs is not None:
+                for pair in _pairs(text):
+                    pairs.setdefault(pair, []).append(i)
+
+        n = i + 1
+        self.n += n
+        for c, ids in enumerate(postings):
+            if ids:
+                self.postings[c] |= _bitmap(ids, n) << start
+        self.non_ascii |= _bitmap(non_ascii, n) << start
+        for pair, ids in pairs.items():
+            self.pairs[pair] = self.pairs.get(pair, 0) | _bitmap(ids, n) << start
+        return range(start, self.n)
+
+    @classmethod
+    def from_bitmaps(cls, n: int, postings: list[int], non_ascii: int, requirement=lower_requirement):
+        """An index over already built char postings e.g. loaded from an index cache. It has no bigrams"""
+        index = cls.__new__(cls)
+        index.requirement = requirement
+        index.n = n
+        index.postings = postings
+        index.non_ascii = non_ascii
+        index.pairs = None
+        return index
+
+    def add(self, text: str) -> int:
+        """Adds a new text at the end and returns its id"""
+        return self.extend([text]).start
+
+    def remove(self, i: int, text: str):
+        """Takes id i, whose text was `text`, out of its posting lists so it's never a candidate again"""
+        keep = ~(1 << i)
+        if not text.isascii():
+            self.non_ascii &= keep
+            return
+        for c in set(text):
+            self.postings[ord(c)] &= keep
+        if self.pairs is not None:
+            for pair in _pairs(text):
+                self.pairs[pair] &= keep
+
+    def _char(self, p: str) -> int:
+        bitmap = self.non_ascii
+        for c in _chars(self.requirement(p) & ~NON_ASCII):
+            bitmap |= self.postings[c]
+        return bitmap
+
+    def _pair(self, p: str, q: str) -> int:
+        bitmap = self.non_ascii
+        for a in _chars(self.requirement(p) & ~NON_ASCII):
+            for b in _chars(self.requirement(q) & ~NON_ASCII):
+                bitmap |= self.pairs.get(chr(a) + chr(b), 0)
+        return bitmap
+
+    def bitmap(self, pattern: str) -> int:
+        bitmap = (1 << self.n) - 1
+        for p in set(pattern):
+            bitmap &= self._char(p)
+        if self.pairs is not None:
+            for k in range(len(pattern) - 1):
+                bitmap &= self._pair(pattern[k], pattern[k + 1])
+        return bitmap
+
+    def candidates(self, pattern: str) -> list[int]:
+        """Line ids, in order, that can match the pattern"""
+        return bitmap_ids(self.bitmap(pattern))
+
+
+def test_bitmap():
+    assert_that(bitmap_ids(_bitmap([], 10))).is_empty()
+    ids = [0, 3, 7, 8, 9, 700, 1023]
+    assert_that(bitmap_ids(_bitmap(ids, 1024))).is_equal_to(ids)
+
+
+def test_inverted_index():
+    from prefilter import Prefilter, ignore_case_requirement
+
+    texts = ["./arch/arm/boot/compressed/head-sharpsl.S", "./drivers/gpu/drm/panel/panel-sharp-ls037v7dw01.c",
+             "./init/do_mounts.c", "./mm/slab.c", "./añb", "./DRM"]
+    ids = list(range(len(texts)))
+    for requirement in [lower_requirement, ignore_case_requirement]:
+        index = InvertedIndex(texts, requirement)
+        prefilter = Prefilter(texts, requirement)
+        for pattern in ["sharp", "drm", "DRM", "mm", "ab", "ba", "xyz", "ñ", ""]:
+            assert_that(index.candidates(pattern)).described_as(pattern).is_equal_to(prefilter.filter(ids, pattern))
+
+
+def test_inverted_index_bigrams():
+    texts = ["ab", "ba", "a_b", "añb", "bab"]
+    index = InvertedIndex(texts, bigrams=True)
+    assert_that(index.candidates("ab")).is_equal_to([0, 2, 3, 4])
+    assert_that(index.candidates("ba")).is_equal_to([1, 3, 4])
+    assert_that(index.candidates("aba")).is_equal_to([3, 4])
+    assert_that(index.candidates("a")).is_equal_to([0, 1, 2, 3, 4])
+
+    assert_that(index.add("b_a")).is_equal_to(5)
+    index.remove(0, "ab")
+    assert_that(index.candidates("ab")).is_equal_to([2, 3, 4])
+    assert_that(index.candidates("ba")).is_equal_to([1, 3, 4, 5])
+
+
+if __name__ == '__main__':
+    import time
+
+    from corpus import MappedCorpus
+
+    _texts = MappedCorpus("../benchmark_data/linux_files_list.txt")
+    for _bigrams in [False, True]:
+        t0 = time.perf_counter()
+        _index = InvertedIndex(_texts, bigrams=_bigrams)
+        print(f"bigrams={_bigrams} build: {time.perf_counter() - t0:.3f}s")
+        for _pattern in ["s", "sharpd", "kconfig", "dtsi", "xyz"]:
+            t0 = time.perf_counter()
+            _candidates = _index.candidates(_pattern)
+            print(f"  {_pattern:8} {len(_candidates):6} candidates in {(time.perf_counter() - t0) * 1000:.2f}ms")
@@ -0,0 +1,208 @@
+import codecs
+import os
+import selectors
+import sys
+
+from assertpy import assert_that
+
+ESCAPE = "\x1b"
+CTRL_C = "\x03"
+BACKSPACE = ("\b", "\x7f")
+# key that shows the next page of results
+SHOW_MORE = "\t"
+
+# how long the bytes of one escape sequence can take to come in. An ESC with nothing after it for this long is the
+# Escape key
+ESCAPE_TIMEOUT = 0.025
+
+
+def split_keys(text: str) -> (list[str], str):
+    """
+    (keys, rest): text split into keys, an escape sequence (CSI "ESC [ ... final", SS3 "ESC O x" or ESC + one char,
+    i.e. alt + key) being one key. `rest` is an escape sequence cut short at the end of text, to be completed by the
+    next read.
+    """
+    keys = []
+    i = 0
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if c != ESCAPE:
+            keys.append(c)
+            i += 1
+            continue
+        if i + 1 == n:
+            return keys, text[i:]
+        kind = text[i + 1]
+        if kind == "[":
+            end = i + 2
+            while end < n and not "\x40" <= text[end] <= "\x7e":
+                end += 1
+            if end == n:
+                return keys, text[i:]
+            keys.append(text[i:end + 1])
+            i = end + 1
+        elif kind == "O":
+            if i + 2 == n:
+                return keys, text[i:]
+            keys.append(text[i:i + 3])
+            i += 3
+        else:
+            keys.append(text[i:i + 2])
+            i += 2
+    return keys, ""
+
+
+def edit(pattern: str, page_n: int, keys: list[str]) -> (str, int, bool):
+    """
+    (pattern, page, quit) after a burst of keys, applied all at once so only the final pattern gets searched. Escape
+    sequences other than the Escape key itself (arrows, function keys...) are ignored.
+    """
+    for key in keys:
+        if key in (ESCAPE, CTRL_C):
+            return pattern, page_n, True
+        if key == SHOW_MORE:
+            page_n += 1
+        elif key in BACKSPACE:
+            pattern = pattern[0:len(pattern) - 1]
+            page_n = 0
+        elif not key.startswith(ESCAPE) and key.isprintable():
+            pattern += key
+            page_n = 0
+    return pattern, page_n, False
+
+
+class KeyReader:
+    """
+    Keys from a terminal, for a whole session: the tty is put in raw mode once, on enter, and restored on exit.
+    Iterating blocks until there is input, then yields every key that has come in so far as one list, so a paste or
+    fast typing comes out as one burst. Reads take whatever bytes are there, through a selector, and are decoded
+    incrementally so neither a UTF-8 char nor an escape sequence split across reads comes out broken.
+
+    On Windows, where there is no selector on the console, msvcrt is polled instead.
+    """
+
+    def __init__(self, fd=None) -> None:
+        self.fd = sys.stdin.fileno() if fd is None else fd
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self._rest = ""
+        self._saved = None
+        self._selector = None
+
+    def __enter__(self):
+        if os.name == "posix":
+            if os.isatty(self.fd):
+                import termios
+                import tty
+
+                self._saved = termios.tcgetattr(self.fd)
+                # keys typed ahead, while the corpus loads, are kept
+                tty.setraw(self.fd, termios.TCSANOW)
+            self._selector = selectors.DefaultSelector()
+            self._selector.register(self.fd, selectors.EVENT_READ)
+        return self
+
+    def __exit__(self, *_):
+        if self._saved is not None:
+            import termios
+
+            termios.tcsetattr(self.fd, termios.TCSANOW, self._saved)
+            self._saved = None
+        if self._selector is not None:
+            self._selector.close()
+            self._selector = None
+
+    def _read(self, timeout) -> str:
+        """What came in within `timeout` seconds (None: until something does), "" on timeout"""
+        if not self._selector.select(timeout):
+            return ""
+        data = os.read(self.fd, 4096)
+        if not data:
+            raise EOFError
+        return self._decoder.decode(data)
+
+    def read_keys(self) -> list[str]:
+        """The next burst of keys. Blocks until there is one"""
+        if os.name == "nt":
+            return self._read_keys_win()
+        keys = []
+        while not keys:
+            text = self._read(None if not self._rest else ESCAPE_TIMEOUT)
+            if not text:
+                # nothing completed the escape sequence: it's keys typed on their own, an Escape first
+                keys, self._rest = list(self._rest), ""
+                break
+            keys, self._rest = split_keys(self._rest + text)
+            # the rest of a burst is often still on its way
+            while more := self._read(0):
+                more_keys, self._rest = split_keys(self._rest + more)
+                keys += more_keys
+        return keys
+
+    @staticmethod
+    def _read_keys_win() -> list[str]:
+        import msvcrt
+
+        keys = []
+        while not keys or msvcrt.kbhit():
+            key = msvcrt.getwch()
+            # function and arrow keys are a "\x00" or "\xe0" prefix and a second char
+            if key in ("\x00", "\xe0"):
+                key = ESCAPE + msvcrt.getwch()
+            keys.append(key)
+        return keys
+
+    def __iter__(self):
+        try:
+            while True:
+                yield self.read_keys()
+        except EOFError:
+            return
+
+
+def test_split_keys():
+    assert_that(split_keys("ab\x7f")).is_equal_to((["a", "b", "\x7f"], ""))
+    assert_that(split_keys("a\x1b[A\x1bOPb\x1bx")).is_equal_to((["a", "\x1b[A", "\x1bOP", "b", "\x1bx"], ""))
+    assert_that(split_keys("a\x1b[1;5")).is_equal_to((["a"], "\x1b[1;5"))
+    assert_that(split_keys("\x1b")).is_equal_to(([], "\x1b"))
+    assert_that(split_keys("é\x1bO")).is_equal_to((["é"], "\x1bO"))
+
+
+def test_edit():
+    assert_that(edit("ab", 2, ["c", "\x7f", "d"])).is_equal_to(("abd", 0, False))
+    assert_that(edit("ab", 0, ["\t", "\t"])).is_equal_to(("ab", 2, False))
+    assert_that(edit("ab", 0, ["\x1b[A", "\r", "c"])).is_equal_to(("abc", 0, False))
+    assert_that(edit("ab", 0, ["c", "\x1b", "d"])).is_equal_to(("abc", 0, True))
+
+
+def test_key_reader():
+    r, w = os.pipe()
+    try:
+        with KeyReader(r) as reader:
+            print("a paste comes out as one burst")
+            os.write(w, "sharpd".encode())
+            assert_that(reader.read_keys()).is_equal_to(list("sharpd"))
+
+            print("a UTF-8 char and an escape sequence split across reads")
+            os.write(w, "ñ".encode()[:1])
+            os.write(w, "ñ".encode()[1:] + b"\x1b[")
+            os.write(w, b"A")
+            keys = reader.read_keys()
+            while len(keys) < 2:
+                keys += reader.read_keys()
+            assert_that(keys).is_equal_to(["ñ", "\x1b[A"])
+
+            print("an ESC nothing follows is the Escape key")
+            os.write(w, b"x\x1b")
+            keys = reader.read_keys()
+            if keys == ["x"]:
+                keys += reader.read_keys()
+            assert_that(keys).is_equal_to(["x", ESCAPE])
+
+            os.close(w)
+            w = None
+            assert_that(list(reader)).is_empty()
+    finally:
+        os.close(r)
+        if w is not None:
+            os.close(w)
@@ -0,0 +1,309 @@
+import os
+import time
+
+from assertpy import assert_that
+
+from crawler import DEFAULT_IGNORE, WORKERS, Crawler, IgnoreRules, list_dir
+
+ADD = "add"
+REMOVE = "remove"
+RENAME = "rename"
+
+
+class LiveCorpus:
+    """
+    Lines of a changing tree of paths, on top of a frozen list of them (e.g. a MappedCorpus). Ids never change or get
+    reused: an added path gets a new id at the end, a removed one leaves a hole that still returns its old text (so
+    caches can tell what it matched) and a rename is both. The indexes given are updated in place with every change,
+    so nothing is rebuilt or rescanned.
+
+    Events are (ADD, path), (REMOVE, path) or (RENAME, old, new). `apply` returns the ids to pass to
+    NarrowingSearch.update.
+    """
+
+    def __init__(self, texts, index=None, prefilter=None, inverted=None) -> None:
+        self.base = texts
+        self.added = []
+        self.removed = set()
+        self.index = index
+        self.prefilter = prefilter
+        self.inverted = inverted
+        self._ids = None
+
+    def __len__(self):
+        return len(self.base) + len(self.added)
+
+    def __getitem__(self, i: int) -> str:
+        n = len(self.base)
+        return self.base[i] if i < n else self.added[i - n]
+
+    def __iter__(self):
+        yield from self.base
+        yield from self.added
+
+    def alive(self, i: int) -> bool:
+        return i not in self.removed
+
+    def _id_map(self) -> dict:
+        if self._ids is None:
+            # built on the first change rather than up front; a corpus that never changes doesn't need it
+            self._ids = {text: i for i, text in enumerate(self) if i not in self.removed}
+        return self._ids
+
+    def id_of(self, path: str):
+        return self._id_map().get(path)
+
+    def add(self, path: str):
+        """Id of the new path, or None if it's already there"""
+        added = self.extend([path])
+        return added[0] if added else None
+
+    def extend(self, paths) -> list[int]:
+        """
+        Ids of the paths that weren't there already. The indexes get them in one batch, which is a lot cheaper than
+        one at a time for the inverted index (see InvertedIndex.extend), so this is how a crawl streams in.
+        """
+        ids = self._id_map()
+        new = [path for path in dict.fromkeys(paths) if path not in ids]
+        start = len(self)
+        self.added.extend(new)
+        ids.update(zip(new, range(start, start + len(new))))
+        for index in (self.index, self.prefilter, self.inverted):
+            if index is not None:
+                index.extend(new)
+        return list(range(start, len(self)))
+
+    def remove(self, path: str):
+        """Id the path had, or None if it wasn't there"""
+        i = self.id_of(path)
+        if i is None:
+            return None
+        del self._ids[path]
+        self.removed.add(i)
+        if self.prefilter is not None:
+            self.prefilter.remove(i)
+        if self.inverted is not None:
+            self.inverted.remove(i, path)
+        return i
+
+    def apply(self, events) -> (list[int], list[int]):
+        """(added ids, removed ids) of the events. Runs of adds go to the indexes together, see extend"""
+        added = []
+        removed = []
+        adding = []
+        for event in events:
+            if event[0] == RENAME:
+                event = [(REMOVE, event[1]), (ADD, event[2])]
+            else:
+                event = [event]
+            for kind, path in event:
+                if kind == ADD:
+                    adding.append(path)
+                    continue
+                # the path may be one of the pending adds
+                added += self.extend(adding)
+                adding = []
+                i = self.remove(path)
+                if i is not None:
+                    removed.append(i)
+        added += self.extend(adding)
+        return added, removed
+
+
+class PollingWatcher:
+    """
+    Finds what changed under `root` by polling, as `find root` would list it, leaving out what the ignore rules (see
+    crawler.list_dir) leave out. Only directories are stat-ed on a poll, and only the ones whose mtime changed are
+    listed again, since adding, removing or renaming an entry is what changes a directory's mtime. A file removed and
+    one added with the same inode in the same poll are a rename.
+    """
+
+    def __init__(self, root: str, interval=1.0, ignore=DEFAULT_IGNORE, gitignore=True) -> None:
+        self.root = root
+        self.interval = interval
+        self.ignore = ignore
+        self.gitignore = gitignore
+        self._last = 0.0
+        # directory -> (mtime_ns, {name: (inode, is_dir)}, rules for its entries' children), as list_dir returns them
+        self._dirs = {}
+
+    def scan(self, workers=WORKERS) -> list[str]:
+        """Every path under root, root first, crawled in parallel. Also where later polls start from"""
+        crawler = Crawler(self.root, self.ignore, workers, self.gitignore).start()
+        paths = [path for batch in crawler for path in batch]
+        self.follow(crawler)
+        return paths
+
+    def follow(self, crawler: Crawler):
+        """Starts from the directories of a finished crawl, instead of a scan"""
+        self._dirs = crawler.dirs
+        self._last = time.monotonic()
+
+    def _walk(self, directory: str, rules: tuple, paths: list[str]):
+        pending = [(directory, rules)]
+        while pending:
+            directory, rules = pending.pop()
+            listed = self._list(directory, rules)
+            if listed is None:
+                continue
+            _, entries, rules = listed
+            for name, (_, is_dir) in entries.items():
+                path = os.path.join(directory, name)
+                paths.append(path)
+                if is_dir:
+                    pending.append((path, rules))
+
+    def _list(self, directory: str, rules: tuple):
+        listed = list_dir(directory, rules, self.gitignore)
+        if listed is not None:
+            self._dirs[directory] = listed
+        return listed
+
+    def _forget(self, directory: str, paths: list[str]):
+        """Drops a removed directory and everything under it, adding their paths"""
+        _, entries, _ = self._dirs.pop(directory, (0, {}, ()))
+        for name, (_, is_dir) in entries.items():
+            path = os.path.join(directory, name)
+            paths.append(path)
+            if is_dir:
+                self._forget(path, paths)
+
+    def due(self) -> bool:
+        return time.monotonic() - self._last >= self.interval
+
+    def poll(self) -> list[tuple]:
+        """Events since the last scan or poll"""
+        self._last = time.monotonic()
+        added = {}
+        removed = {}
+        for directory, (mtime, entries, _) in list(self._dirs.items()):
+            if directory not in self._dirs:
+                continue
+            try:
+                if os.stat(directory).st_mtime_ns == mtime:
+                    continue
+            except FileNotFoundError:
+                # its parent changed too, and drops it from there
+                continue
+
+            # rules of the directory itself are the ones its parent's listing passed down
+            parent = self._dirs.get(os.path.dirname(directory))
+            listed = self._list(directory, parent[2] if parent else (IgnoreRules(self.ignore, self.root),))
+            now = {} if listed is None else listed[1]
+            for name in entries.keys() - now.keys():
+                path = os.path.join(directory, name)
+                inode, is_dir = entries[name]
+                removed[path] = inode
+                if is_dir:
+                    gone = []
+                    self._forget(path, gone)
+                    removed.update((p, None) for p in gone)
+            for name in now.keys() - entries.keys():
+                path = os.path.join(directory, name)
+                inode, is_dir = now[name]
+                added[path] = inode
+                if is_dir:
+                    new = []
+                    self._walk(path, listed[2], new)
+                    added.update((p, None) for p in new)
+
+        by_inode = {inode: path for path, inode in removed.items() if inode is not None}
+        events = []
+        for path, inode in added.items():
+            old = by_inode.pop(inode, None) if inode is not None else None
+            if old is None:
+                events.append((ADD, path))
+            else:
+                del removed[old]
+                events.append((RENAME, old, path))
+        events.extend((REMOVE, path) for path in removed)
+        return events
+
+
+def test_live_corpus():
+    from corpus_index import CorpusIndex, text_flags
+    from inverted_index import InvertedIndex
+    from prefilter import Prefilter
+
+    texts = ["./a", "./a/sharp.c", "./b"]
+    live = LiveCorpus(texts, CorpusIndex(texts), Prefilter(texts), InvertedIndex(texts))
+
+    added, removed = live.apply([(ADD, "./a/sharpd.c"), (REMOVE, "./b"), (RENAME, "./a/sharp.c", "./a/flat.c"),
+                                 (ADD, "./a"), (REMOVE, "./nope")])
+    assert_that(added).is_equal_to([3, 4])
+    assert_that(removed).is_equal_to([2, 1])
+    assert_that(list(live)).is_equal_to(["./a", "./a/sharp.c", "./b", "./a/sharpd.c", "./a/flat.c"])
+    assert_that([live.alive(i) for i in range(len(live))]).is_equal_to([True, False, False, True, True])
+    assert_that(live.id_of("./a/flat.c")).is_equal_to(4)
+
+    assert_that(bytes(live.index.flags_of(4))).is_equal_to(bytes(text_flags("./a/flat.c")))
+    assert_that(live.inverted.candidates("sharp")).is_equal_to([3])
+    assert_that(live.prefilter.filter(list(range(len(live))), "b")).is_empty()
+
+
+def test_live_narrowing():
+    from narrowing import NarrowingSearch
+    from prefilter import Prefilter
+    from query_cache import QueryCache
+
+    def _contains(text, pattern):
+        it = iter(text)
+        return 0 if all(c in it for c in pattern) else None
+
+    texts = ["abc", "axbxc", "ab", "cba", "b"]
+    live = LiveCorpus(texts, prefilter=Prefilter(texts))
+    engine = NarrowingSearch(live, _contains, prefilter=live.prefilter, cache=QueryCache())
+    before = engine.search("ab")
+    engine.search("abc")
+    engine.search("b")
+    engine.search("ab")
+    hits = engine.cache.hits
+
+    engine.update(*live.apply([(ADD, "zab"), (REMOVE, "abc"), (ADD, "cc")]))
+    assert_that(engine.scored).is_equal_to(0)
+    assert_that([i for i, _ in engine.search("ab")]).is_equal_to([1, 2, 5])
+    assert_that([i for i, _ in before]).is_equal_to([0, 1, 2])
+
+    print("'abc' is cached and the removed 'abc' matched it, so it's scored again")
+    assert_that([i for i, _ in engine.search("abc")]).is_equal_to([1])
+    assert_that(engine.cache.hits).is_equal_to(hits)
+
+    print("nothing changed can match 'x', so 'x' stays cached")
+    engine.search("x")
+    engine.update(*live.apply([(ADD, "q")]))
+    engine.search("b")
+    engine.search("x")
+    assert_that(engine.cache.hits).is_equal_to(hits + 1)
+
+
+def test_polling_watcher(tmp_path):
+    root = str(tmp_path)
+    os.makedirs(os.path.join(root, "a", "b"))
+    for name in ["a/x.c", "a/b/y.c", "z.c"]:
+        open(os.path.join(root, name), "w").close()
+
+    watcher = PollingWatcher(root, interval=0)
+    paths = watcher.scan()
+    assert_that(sorted(os.path.relpath(p, root) for p in paths)).is_equal_to(
+        [".", "a", "a/b", "a/b/y.c", "a/x.c", "z.c"])
+    assert_that(watcher.poll()).is_empty()
+
+    def touch_dirs():
+        # mtimes can be too coarse to see two changes in a row
+        for d, (mtime, entries, rules) in watcher._dirs.items():
+            watcher._dirs[d] = (mtime - 1, entries, rules)
+
+    open(os.path.join(root, "a", "new.c"), "w").close()
+    os.rename(os.path.join(root, "z.c"), os.path.join(root, "a", "w.c"))
+    os.rename(os.path.join(root, "a", "b"), os.path.join(root, "c"))
+    touch_dirs()
+    events = watcher.poll()
+    join = os.path.join
+    assert_that(sorted(events)).is_equal_to(sorted([
+        (ADD, join(root, "a", "new.c")), (RENAME, join(root, "z.c"), join(root, "a", "w.c")),
+        (RENAME, join(root, "a", "b"), join(root, "c")), (ADD, join(root, "c", "y.c")),
+        (REMOVE, join(root, "a", "b", "y.c"))]))
+
+    os.remove(os.path.join(root, "c", "y.c"))
+    touch_dirs()
+    assert_that(watcher.poll()).is_equal_to([(REMOVE, join(root, "c", "y.c"))])
@@ -0,0 +1,293 @@
+from functools import reduce
+from operator import or_
+
+from assertpy import assert_that
+
+from prefilter import char_mask
+
+
+class Frame:
+    """Results of one pattern. `candidates` are the line ids that matched it."""
+
+    def __init__(self, pattern: str, candidates: list[int], results: list[(int, int)]) -> None:
+        self.pattern = pattern
+        self.candidates = candidates
+        self.results = results
+
+
+class NarrowingSearch:
+    """
+    Scores only the survivors of the previous pattern when the pattern grows.
+
+    Both scorers match the pattern as an (in order) subsequence of the text, so if a text doesn't match "ab", it
+    can't match "abc" either. Each keystroke pushes a Frame on a stack; backspace pops back to an earlier Frame
+    and returns its results without scoring anything. An `alg` whose matches of a longer pattern aren't always among
+    those of its prefix (e.g. Typo) tells so with alg.narrows(prefix, pattern); narrowing then starts over.
+
+    With a CorpusIndex, `alg` also gets the flags and the lowercase bytes (None if it isn't ASCII) of each text i.e.
+    alg(text, pattern, flags=..., lower=...). With a Prefilter,
+    candidates that lack one of the new pattern chars are dropped before scoring. With an InvertedIndex, the first
+    pattern starts from its candidates instead of the whole corpus. With a QueryCache, a pattern that was searched
+    before comes back without scoring even after its Frame is gone, and a cached prefix of the pattern seeds the
+    candidates when it's longer than the top Frame's.
+
+    With `base`, only those ids are searched instead of the whole corpus. The inverted index and the cache, which are
+    about the whole corpus, aren't meant to go with it.
+    """
+
+    def __init__(self, texts: list[str], alg, index=None, prefilter=None, inverted=None, cache=None,
+                 base=None) -> None:
+        self.texts = texts
+        self.alg = alg
+        self.index = index
+        self.prefilter = prefilter
+        self.inverted = inverted
+        self.cache = cache
+        # what its results are cached under, with the pattern: engines of the same alg share them
+        self.cache_key = getattr(alg, "__name__", type(alg).__name__)
+        self.scored = 0
+        self._stack = [Frame("", list(range(len(texts))) if base is None else list(base), [])]
+
+    def search(self, pattern: str) -> list[(int, int)]:
+        """Returns (line id, score) of every match, in corpus order unless they are narrowed from the cache"""
+        for results in self.scan(pattern):
+            pass
+        return results
+
+    def scan(self, pattern: str, chunk=None):
+        """
+        Same as search but yields the results so far after every `chunk` candidates, the last one being all of
+        them. The pattern's Frame is only pushed once the scan is complete, so a caller can drop the generator at
+        any point to abandon a stale pattern.
+        """
+        stack = self._stack
+        narrows = getattr(self.alg, "narrows", None)
+        while len(stack) > 1 and not (pattern.startswith(stack[-1].pattern) and
+                                      (narrows is None or narrows(stack[-1].pattern, pattern))):
+            stack.pop()
+
+        top = stack[-1]
+        if top.pattern == pattern:
+            yield top.results
+            return
+
+        seed = None
+        if self.cache is not None:
+            cached = self.cache.get(self.cache_key, pattern)
+            if cached is not None:
+                results = list(zip(*cached))
+                self.scored = 0
+                stack.append(Frame(pattern, list(cached[0]), results))
+                yield results
+                return
+            seed = self.cache.longest_prefix(self.cache_key, pattern, len(top.pattern))
+            if seed is not None and narrows is not None and not narrows(seed[0], pattern):
+                seed = None
+
+        candidates = top.candidates
+        if seed is not None:
+            prefix, candidates = seed
+            if self.prefilter is not None:
+                candidates = self.prefilter.filter(candidates, set(pattern) - set(prefix))
+        elif self.inverted is not None and len(stack) == 1:
+            candidates = self.inverted.candidates(pattern)
+        elif self.prefilter is not None:
+            # survivors of top have all of its chars already
+            candidates = self.prefilter.filter(candidates, set(pattern) - set(top.pattern))
+
+        chunk = chunk or max(len(candidates), 1)
+        results = []
+        self.scored = 0
+        for start in range(0, len(candidates), chunk):
+            self._score(candidates[start:start + chunk], pattern, results)
+            self.scored = min(start + chunk, len(candidates))
+            if self.scored < len(candidates):
+                yield results
+
+        stack.append(Frame(pattern, [i for i, _ in results], results))
+        if self.cache is not None:
+            self.cache.put(self.cache_key, pattern, results)
+        yield results
+
+    def _score(self, ids: list[int], pattern: str, results: list[(int, int)]):
+        texts = self.texts
+        alg = self.alg
+        if self.index is None:
+            for i in ids:
+                s = alg(texts[i], pattern)
+                if s is not None:
+                    results.append((i, s))
+        else:
+            flags_of = self.index.flags_of
+            lower_of = self.index.lower_of
+            for i in ids:
+                s = alg(texts[i], pattern, flags=flags_of(i), lower=lower_of(i))
+                if s is not None:
+                    results.append((i, s))
+
+    def update(self, added: list[int], removed: list[int]):
+        """
+        Catches up with lines added to or removed from `texts` (see LiveCorpus) without rescoring what didn't change.
+        Removed ids are dropped from every Frame. Added ids are scored against each Frame's pattern, but only the ones
+        that matched the Frame below. Frames get new lists, so results handed out before stay as they were.
+
+        Cached patterns that one of the changed texts could match are invalidated, going by the prefilter's (or the
+        inverted index's) requirement; without either, the whole cache is.
+        """
+        removed = set(removed)
+        stack = self._stack
+        if removed:
+            stack[0].candidates = [i for i in stack[0].candidates if i not in removed]
+        stack[0].candidates += added
+
+        survivors = list(added)
+        for frame in stack[1:]:
+            new = []
+            self._score(survivors, frame.pattern, new)
+            frame.results = [r for r in frame.results if r[0] not in removed] + new
+            frame.candidates = [i for i, _ in frame.results]
+            survivors = [i for i, _ in new]
+
+        if self.cache is not None and (added or removed):
+            self.cache.invalidate(self._unchanged_by([self.texts[i] for i in [*added, *removed]]))
+
+    def _unchanged_by(self, texts: list[str]):
+        """keep function for QueryCache.invalidate. None, i.e. keep nothing, when there's no requirement to go by"""
+        requirement = self.prefilter.requirement if self.prefilter is not None else \
+            getattr(self.inverted, "requirement", None)
+        if requirement is None:
+            return None
+
+        masks = {char_mask(t) for t in texts}
+        if len(masks) > 64:
+            # e.g. a batch of a crawl: too many to check one by one. Their union can only invalidate more
+            masks = {reduce(or_, masks)}
+
+        def keep(_alg, pattern, _ids):
+            requirements = {requirement(p) for p in pattern}
+            return not any(all(mask & r for r in requirements) for mask in masks)
+
+        return keep
+
+    def depth(self):
+        return len(self._stack) - 1
+
+
+def _contains(text, pattern):
+    it = iter(text)
+    return 0 if all(c in it for c in pattern) else None
+
+
+def test_narrowing():
+    texts = ["abc", "axbxc", "ab", "cba", "b"]
+    engine = NarrowingSearch(texts, _contains)
+
+    assert_that(engine.search("")).is_empty()
+
+    r = engine.search("a")
+    assert_that([i for i, _ in r]).is_equal_to([0, 1, 2, 3])
+    assert_that(engine.scored).is_equal_to(5)
+
+    r = engine.search("ab")
+    assert_that([i for i, _ in r]).is_equal_to([0, 1, 2])
+    assert_that(engine.scored).is_equal_to(4)
+
+    r = engine.search("abc")
+    assert_that([i for i, _ in r]).is_equal_to([0, 1])
+    assert_that(engine.scored).is_equal_to(3)
+    assert_that(engine.depth()).is_equal_to(3)
+
+
+def test_narrowing_backspace():
+    texts = ["abc", "axbxc", "ab", "cba", "b"]
+    engine = NarrowingSearch(texts, _contains)
+    engine.search("a")
+    ab = engine.search("ab")
+    engine.search("abc")
+
+    engine.scored = 0
+    r = engine.search("ab")
+    assert_that(r).is_same_as(ab)
+    assert_that(engine.scored).is_equal_to(0)
+    assert_that(engine.depth()).is_equal_to(2)
+
+    print("a different char after backspace narrows from the shared prefix")
+    r = engine.search("ac")
+    assert_that([i for i, _ in r]).is_equal_to([0, 1])
+    assert_that(engine.scored).is_equal_to(4)
+
+    r = engine.search("b")
+    assert_that([i for i, _ in r]).is_equal_to([0, 1, 2, 3, 4])
+    assert_that(engine.depth()).is_equal_to(1)
+
+
+def test_narrowing_prefilter():
+    from prefilter import Prefilter, exact_requirement
+
+    texts = ["abc", "axbxc", "ab", "cba", "b"]
+    engine = NarrowingSearch(texts, _contains, prefilter=Prefilter(texts, exact_requirement))
+
+    r = engine.search("a")
+    assert_that([i for i, _ in r]).is_equal_to([0, 1, 2, 3])
+    assert_that(engine.scored).is_equal_to(4)
+
+    print("cba has a c but not after ab; it's rejected by scoring, not by the prefilter")
+    r = engine.search("abc")
+    assert_that([i for i, _ in r]).is_equal_to([0, 1])
+    assert_that(engine.scored).is_equal_to(3)
+    assert_that(engine.prefilter.rejected).is_equal_to(2)
+
+
+def test_narrowing_scan():
+    texts = ["abc", "axbxc", "ab", "cba", "b"]
+    engine = NarrowingSearch(texts, _contains)
+
+    partial = [[i for i, _ in r] for r in engine.scan("a", 2)]
+    assert_that(partial).is_equal_to([[0, 1], [0, 1, 2, 3], [0, 1, 2, 3]])
+    partial = [len(r) for r in engine.scan("ab", 1)]
+    assert_that(partial).is_equal_to([1, 2, 3, 3])
+
+    print("an abandoned scan doesn't leave a frame behind")
+    scan = engine.scan("abc", 1)
+    next(scan)
+    scan.close()
+    assert_that(engine.depth()).is_equal_to(2)
+    assert_that([i for i, _ in engine.search("abc")]).is_equal_to([0, 1])
+    assert_that(engine.depth()).is_equal_to(3)
+
+
+def test_narrowing_inverted():
+    from inverted_index import InvertedIndex
+
+    texts = ["abc", "axbxc", "ab", "cba", "b"]
+    engine = NarrowingSearch(texts, _contains, inverted=InvertedIndex(texts))
+
+    r = engine.search("ab")
+    assert_that([i for i, _ in r]).is_equal_to([0, 1, 2])
+    assert_that(engine.scored).is_equal_to(4)
+    r = engine.search("abc")
+    assert_that([i for i, _ in r]).is_equal_to([0, 1])
+    assert_that(engine.scored).is_equal_to(3)
+
+
+def test_narrowing_cache():
+    from query_cache import QueryCache
+
+    texts = ["abc", "axbxc", "ab", "cba", "b"]
+    engine = NarrowingSearch(texts, _contains, cache=QueryCache())
+    engine.search("a")
+    engine.search("ab")
+    abc = engine.search("abc")
+
+    print("'abc' isn't on the stack after 'b', but it's cached")
+    engine.search("b")
+    r = engine.search("abc")
+    assert_that(r).is_equal_to(abc)
+    assert_that(engine.scored).is_equal_to(0)
+    assert_that(engine.cache.hits).is_equal_to(1)
+
+    print("'abcx' is seeded with the ids of 'abc'")
+    engine.search("x")
+    r = engine.search("abcx")
+    assert_that(r).is_empty()
+    assert_that(engine.scored).is_equal_to(2)
@@ -0,0 +1,360 @@
+import threading
+from functools import lru_cache, partial
+
+from assertpy import assert_that
+
+from fuzzy_score_1 import BOUNDARY_FLAG, UPPER_FLAG, _ascii_tables, _Qb, _Qc, _Qd, _QDi, _Qk, eq_ignore_case, \
+    is_boundary, score
+
+# a row cell no alignment reaches
+_NONE = float("-inf")
+# CorpusIndex flags to 1 at a word start, 0 elsewhere
+_BOUNDARY = bytes(f & BOUNDARY_FLAG for f in range(256))
+
+# what a matcher (see OptimalScorer._matchers) returns: the first position, the last one or all of them
+FIRST = 1
+LAST = -1
+ALL = 0
+
+
+@lru_cache(maxsize=256)
+def _ascii_codes(pattern: str, ignore_case=True) -> list:
+    """Per pattern char, the only lowercase byte it matches ASCII text chars of, in either case, or None if not so"""
+    codes = []
+    for table in _ascii_tables(pattern, ignore_case):
+        hits = [code for code, m in enumerate(table) if m]
+        codes.append(hits[0] if len(hits) == 1 and table[hits[0]] == 3 else None)
+    return codes
+
+
+def _matches_str(text: str, equal: set[str], a: int, b: int, kind: int):
+    if kind == ALL:
+        return [i for i in range(a, b) if text[i] in equal]
+    for i in (range(a, b) if kind == FIRST else range(b - 1, a - 1, -1)):
+        if text[i] in equal:
+            return i
+    return -1
+
+
+def _matches_byte(lower: bytes, code: int, a: int, b: int, kind: int):
+    if kind == FIRST:
+        return lower.find(code, a, b)
+    if kind == LAST:
+        return lower.rfind(code, a, b)
+    found = []
+    i = lower.find(code, a, b)
+    while i >= 0:
+        found.append(i)
+        i = lower.find(code, i + 1, b)
+    return found
+
+
+def _matches_table(lower: bytes, flags, table: bytes, a: int, b: int, kind: int):
+    """See fuzzy_score_1._score_ascii for `table`"""
+    if kind == ALL:
+        return [i for i in range(a, b) if table[lower[i]] & (1 if flags[i] & UPPER_FLAG else 2)]
+    for i in (range(a, b) if kind == FIRST else range(b - 1, a - 1, -1)):
+        if table[lower[i]] & (1 if flags[i] & UPPER_FLAG else 2):
+            return i
+    return -1
+
+
+class OptimalScorer:
+    """
+    fuzzy_score_1.score of the best alignment of the pattern instead of the greedy one. score takes the rightmost
+    match of every pattern char, so "aa" in "abab/a" takes the last "a" and pays for the gap before it where "aba"
+    has none.
+
+    For a given alignment, everything score adds up splits into Qc per match, a gap term g(b, c) for every two
+    matches b < c next to each other (the end of the text counts as a match at len(text) that isn't a boundary),
+    and Qk of the first match. In the gap, score commits the chars it has seen every time it passes the start of a
+    word, and what's left next to b costs Qb if b starts a word and QDi + Qd per char otherwise. With t the first
+    word start at or after b + 2:
+
+        c == b + 1:     g = 0
+        b + 1 < c < t:  g = Qb if b starts a word else QDi + Qd * (c - 1 - b)
+        c >= t:         g = Qd * (c - t + 1) + (the above with c = t - 1)
+
+    So for a given b the best c is the best of the next cell, of one range inside b's word and of a suffix, each
+    linear in c. Row j of the DP is the best score of pattern[j:] with pattern[j] at b, computed from row j + 1
+    with per-word suffix maxes and a plain suffix max, O(len(text)) per row, the way fzf's v2 does it. Rows only span
+    from the forward greedy match of their char to the backward one; no alignment gets out of that.
+
+    The rows are lists kept from call to call and only grown, so a call allocates nothing per row. Not thread safe:
+    one scorer per thread. With a CorpusIndex, chars are compared from its lowercase bytes as score does, and a
+    pattern char that only matches one byte is looked for with bytes.find.
+
+    About half the candidates of benchmark.py's queries have more than one alignment, and the DP over them keeps this
+    at about 3x the cost of score: run_search only scores with hybrid_score when asked to (--hybrid).
+    """
+
+    def __init__(self, ignore_case=True) -> None:
+        self.ignore_case = ignore_case
+        self._size = 0
+        self._row = []
+        self._next = []
+        self._word_max = []
+        self._word_max_d = []
+        self._suffix_max = []
+
+    def _grow(self, n: int):
+        if n + 2 > self._size:
+            self._size = max(n + 2, 2 * self._size)
+            for name in ["_row", "_next", "_word_max", "_word_max_d", "_suffix_max"]:
+                setattr(self, name, [_NONE] * self._size)
+
+    def _chars(self, pattern: str) -> list[set[str]]:
+        """Text chars each pattern char matches, the way score compares them"""
+        if not self.ignore_case:
+            return [{p} for p in pattern]
+        return [{p} | {chr(c) for c in (ord(p) - 32, ord(p) + 32) if 0 <= c < 0x110000} for p in pattern]
+
+    def _matchers(self, text: str, pattern: str, flags, lower) -> list:
+        """
+        Per pattern char, matches(a, b): the positions in [a, b) of the text chars it matches. From `lower` (see
+        score) if the text is ASCII, where a char that only matches its own lowercase byte is found with bytes.find
+        """
+        if lower is None or flags is None:
+            return [partial(_matches_str, text, equal) for equal in self._chars(pattern)]
+        tables = _ascii_tables(pattern, self.ignore_case)
+        return [partial(_matches_byte, lower, code) if code is not None else partial(_matches_table, lower, flags, table)
+                for code, table in zip(_ascii_codes(pattern, self.ignore_case), tables)]
+
+    def bounds(self, text: str, pattern: str, flags=None, lower=None):
+        """
+        (lo, hi): positions of the forward and of the backward greedy match of every pattern char, or None if the
+        pattern doesn't match. lo == hi if there is only one alignment.
+        """
+        lower = None if lower is None else bytes(lower)
+        return self._bounds(len(text), self._matchers(text, pattern, flags, lower))
+
+    @staticmethod
+    def _bounds(n: int, matchers: list):
+        lo = []
+        i = 0
+        for matches in matchers:
+            i = matches(i, n, FIRST)
+            if i < 0:
+                return None
+            lo.append(i)
+            i += 1
+
+        hi = [0] * len(matchers)
+        i = n
+        for j in range(len(matchers) - 1, -1, -1):
+            hi[j] = i = matchers[j](lo[j], i, LAST)
+        return lo, hi
+
+    def __call__(self, text: str, pattern: str, flags=None, lower=None):
+        """Same arguments and result as score"""
+        if not pattern:
+            return 0
+        lower = None if lower is None else bytes(lower)
+        matchers = self._matchers(text, pattern, flags, lower)
+        bounds = self._bounds(len(text), matchers)
+        return None if bounds is None else self._align(text, matchers, *bounds, flags)
+
+    def align(self, text: str, pattern: str, lo: list[int], hi: list[int], flags=None, lower=None) -> int:
+        """Score of the best alignment of a matching pattern, given its bounds"""
+        lower = None if lower is None else bytes(lower)
+        return self._align(text, self._matchers(text, pattern, flags, lower), lo, hi, flags)
+
+    def _align(self, text: str, matchers: list, lo: list[int], hi: list[int], flags) -> int:
+        n = len(text)
+        m = len(matchers)
+        self._grow(n)
+        # 1 at the word starts, none at n and n + 1. Nothing before the first possible match is looked at
+        if flags is not None:
+            boundary = bytes(flags).translate(_BOUNDARY) + b"\0\0"
+        else:
+            boundary = bytes(lo[0]) + bytes(is_boundary(text, i) for i in range(lo[0], n)) + b"\0\0"
+        # first word start at or after i, n + 1 if none
+        next_start = lambda i: t if (t := boundary.find(1, i, n)) >= 0 else n + 1
+
+        row = self._row
+        nxt = self._next
+        word_max = self._word_max
+        word_max_d = self._word_max_d
+        suffix_max = self._suffix_max
+
+        # last pattern char: the gap to the end of the text. The end is never a word start
+        first, last = lo[m - 1], hi[m - 1]
+        row[first:last + 1] = [_NONE] * (last + 1 - first)
+        for b in matchers[m - 1](first, last + 1, ALL):
+            row[b] = _Qc + self._gap(b, n, boundary, next_start)
+
+        for j in range(m - 2, -1, -1):
+            row, nxt = nxt, row
+            first, last = lo[j + 1], hi[j + 1]
+            # per-word suffix maxes of nxt[c] and of nxt[c] + Qd * c, and suffix max of the latter, over the span of
+            # row j + 1
+            word_max[last + 1] = word_max_d[last + 1] = suffix_max[last + 1] = _NONE
+            for c in range(last, first - 1, -1):
+                x = nxt[c]
+                y = x + _Qd * c
+                if boundary[c + 1]:
+                    word_max[c] = x
+                    word_max_d[c] = y
+                else:
+                    word_max[c] = x if x > word_max[c + 1] else word_max[c + 1]
+                    word_max_d[c] = y if y > word_max_d[c + 1] else word_max_d[c + 1]
+                suffix_max[c] = y if y > suffix_max[c + 1] else suffix_max[c + 1]
+
+            row[lo[j]:hi[j] + 1] = [_NONE] * (hi[j] + 1 - lo[j])
+            for b in matchers[j](lo[j], hi[j] + 1, ALL):
+                best = nxt[b + 1] if first <= b + 1 <= last else _NONE
+                t = next_start(b + 2)
+                # c in (b + 1, t): inside the word after b, which word_max ends at t - 1 or last
+                c = max(b + 2, first)
+                if c < t and c <= last:
+                    within = word_max[c] + _Qb if boundary[b] else word_max_d[c] + _QDi - _Qd * (b + 1)
+                    if within > best:
+                        best = within
+                # c >= t: the rest of the gap is committed at t
+                if t <= last:
+                    c = max(t, first)
+                    r = t - 2 - b
+                    head = (_Qb if r > 0 else 0) if boundary[b] else (_QDi + _Qd * r if r > 0 else 0)
+                    after = suffix_max[c] + _Qd * (1 - t) + head
+                    if after > best:
+                        best = after
+                row[b] = _Qc + best if best != _NONE else _NONE
+
+        best = _NONE
+        for b in range(lo[0], hi[0] + 1):
+            if row[b] != _NONE:
+                v = row[b] + _Qk(b)
+                if v > best:
+                    best = v
+        return best
+
+    @staticmethod
+    def _gap(b: int, c: int, boundary, next_start) -> int:
+        """g(b, c), see the class docstring"""
+        t = next_start(b + 2) if b + 2 <= c else c + 1
+        if t <= c:
+            r = t - 2 - b
+            committed = _Qd * (c - t + 1)
+        else:
+            r = c - 1 - b
+            committed = 0
+        if r <= 0:
+            return committed
+        return committed + (_Qb if boundary[b] else _QDi + _Qd * r)
+
+
+# a scorer's rows aren't to be shared, so every thread gets scorers of its own (e.g. run_search_async's search thread)
+_local = threading.local()
+
+
+def _scorer(ignore_case: bool) -> OptimalScorer:
+    scorers = getattr(_local, "scorers", None)
+    if scorers is None:
+        scorers = _local.scorers = (OptimalScorer(ignore_case=False), OptimalScorer())
+    return scorers[ignore_case]
+
+
+def optimal_score(text: str, pattern: str, ignore_case=True, flags=None, lower=None):
+    return _scorer(ignore_case)(text, pattern, flags, lower)
+
+
+def hybrid_score(text: str, pattern: str, ignore_case=True, flags=None, lower=None):
+    """
+    optimal_score, with greedy passes as the cheap filter: the forward and backward greedy matches of the pattern
+    reject texts that don't match, and for a text with a single alignment (both passes agree) the greedy score is the
+    best one. The DP only runs for the rest. Safe to call from any thread, each having scorers of its own.
+    """
+    if not pattern:
+        return 0
+    scorer = _scorer(ignore_case)
+    matchers = scorer._matchers(text, pattern, flags, None if lower is None else bytes(lower))
+    bounds = scorer._bounds(len(text), matchers)
+    if bounds is None:
+        return None
+    lo, hi = bounds
+    return score(text, pattern, ignore_case, flags, lower) if lo == hi else scorer._align(text, matchers, lo, hi, flags)
+
+
+def _alignment_score(text: str, pattern: str, positions: list[int]) -> int:
+    """score's backward loop with the matches at `positions` instead of greedy ones"""
+    matched = set(positions)
+    _score = 0
+    _di_acc = 0
+    boundary = False
+    j = len(pattern)
+    for i in range(len(text) - 1, -1, -1):
+        if i in matched:
+            j -= 1
+            _score += _Qc
+            boundary = is_boundary(text, i)
+            if boundary:
+                _score += 0 if _di_acc == 0 else _Qb
+            else:
+                _score += (0 if _di_acc == 0 else _QDi) + _di_acc
+            _di_acc = 0
+            if j == 0:
+                return _score + _Qk(i)
+        else:
+            _di_acc += _Qd
+            if boundary:
+                _score += _di_acc
+                _di_acc = 0
+        boundary = is_boundary(text, i)
+
+
+def test_alignment_score_is_greedy_score():
+    for text, pattern in [("sayYxbyZxcy", "abc"), ("xyAdxyBxy", "ad"), ("ssCxyzaxyzBxyzCxyz", "ab"), ("sad", "ad"),
+                          ("./drivers/gpu/drm/panel/panel-sharp-ls037v7dw01.c", "sharpd")]:
+        backward = OptimalScorer().bounds(text, pattern)[1]
+        assert_that(_alignment_score(text, pattern, backward)).is_equal_to(score(text, pattern))
+
+
+def test_optimal_score():
+    import random
+    from itertools import combinations
+
+    from corpus_index import CorpusIndex
+
+    rng = random.Random(3)
+    for _ in range(400):
+        text = "".join(rng.choice("abAB_/xo") for _ in range(rng.randint(1, 10)))
+        pattern = "".join(rng.choice("ab/") for _ in range(rng.randint(1, 3)))
+        alignments = [c for c in combinations(range(len(text)), len(pattern))
+                      if all(eq_ignore_case(text[i], p) for i, p in zip(c, pattern))]
+        expected = max((_alignment_score(text, pattern, list(c)) for c in alignments), default=None)
+        actual = optimal_score(text, pattern)
+        assert_that(actual).described_as(f"{text} | {pattern}").is_equal_to(expected)
+        index = CorpusIndex([text])
+        flags, lower = index.flags_of(0), index.lower_of(0)
+        assert_that(optimal_score(text, pattern, flags=flags, lower=lower)).is_equal_to(expected)
+        if expected is not None:
+            assert_that(actual).is_greater_than_or_equal_to(score(text, pattern))
+            assert_that(hybrid_score(text, pattern)).is_equal_to(actual)
+            assert_that(hybrid_score(text, pattern, flags=flags, lower=lower)).is_equal_to(actual)
+
+
+def test_scorer_per_thread():
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(1) as pool:
+        other = pool.submit(_scorer, True).result()
+    assert_that(other).is_not_same_as(_scorer(True))
+    assert_that(_scorer(True)).is_same_as(_scorer(True))
+
+
+def test_optimal_score_ranks_word_starts():
+    from corpus_index import text_flags
+
+    print("greedy takes the last 'a', and with it a gap the first one doesn't have")
+    assert_that(score("abab/a", "aa")).is_equal_to(-2)
+    assert_that(optimal_score("abab/a", "aa")).is_equal_to(0)
+    assert_that(optimal_score("abab/a", "aa", ignore_case=False)).is_equal_to(0)
+    assert_that(optimal_score("ABAB/a", "aa", ignore_case=False)).is_none()
+    flags = text_flags("ABAB/a")
+    assert_that(optimal_score("ABAB/a", "Aa", False, flags, b"abab/a")).is_equal_to(
+        optimal_score("ABAB/a", "Aa", ignore_case=False))
+
+    text = "./drivers/gpu/drm/panel/panel-sharp-ls037v7dw01.c"
+    assert_that(optimal_score(text, "sharpd", flags=text_flags(text))).is_equal_to(optimal_score(text, "sharpd"))
+    assert_that(optimal_score(text, "xyz")).is_none()
+    assert_that(optimal_score("", "")).is_equal_to(0)
@@ -0,0 +1,222 @@
+from array import array
+
+from assertpy import assert_that
+
+# dir id of the lines that have no "/", i.e. no directory
+NO_DIR = 0
+
+
+class PathStore:
+    """
+    Lines (paths) kept as a directory trie instead of one string each. A line is split at its last "/" into a
+    directory and a basename. Every directory is stored once, as the id of its parent and its own name; a line is only
+    the id of its directory and its basename, all basenames being one bytes with an offsets array. `store[i]` puts a
+    line back together from the path of its directory, which is built the first time one of its lines is asked for
+    and then kept, and its basename.
+
+    Lines come back exactly as they went in, whatever they are ("", "/x", "a//b", invalid UTF-8 like MappedCorpus):
+    directory NO_DIR stands for none, and a directory's name can be empty.
+
+    `dir_of(i)`, `parent(d)`, `basename(i)` and `basename_start(i)` let a scorer go by directories and basenames
+    without looking for the separators of the text.
+    """
+
+    def __init__(self, lines) -> None:
+        """`lines` are str or bytes, without their newline"""
+        self.parents = array('I', [NO_DIR])
+        self.dir_ids = array('I')
+        self._dir_names = bytearray()
+        self._dir_name_offsets = array('I', [0, 0])
+        names = bytearray()
+        self._name_offsets = array('Q', [0])
+
+        # (parent, name) -> dir id; only needed while building
+        edges = {}
+        last_dir = None
+        last_id = NO_DIR
+        for line in lines:
+            if isinstance(line, str):
+                line = line.encode("utf-8", "surrogateescape")
+            slash = line.rfind(b"/")
+            if slash >= 0:
+                # a listing has the lines of a directory next to each other
+                if line[:slash] != last_dir:
+                    last_dir = line[:slash]
+                    last_id = self._intern(last_dir, edges)
+                self.dir_ids.append(last_id)
+            else:
+                self.dir_ids.append(NO_DIR)
+            names += line[slash + 1:]
+            self._name_offsets.append(len(names))
+
+        self._names = bytes(names)
+        self._dir_names = bytes(self._dir_names)
+        if len(names) < 2 ** 32:
+            self._name_offsets = array('I', self._name_offsets)
+        self._dir_paths = [None] * len(self.parents)
+
+    @classmethod
+    def from_file(cls, path: str):
+        """The lines of a file, read a line at a time"""
+        with open(path, 'rb') as f:
+            return cls(line[:-1] if line.endswith(b"\n") else line for line in f)
+
+    def _intern(self, directory: bytes, edges: dict) -> int:
+        """Id of a directory, adding it and the ones above it that are new. A loop, as a path can be any deep"""
+        d = NO_DIR
+        for name in directory.split(b"/"):
+            parent = d
+            d = edges.get((parent, name))
+            if d is None:
+                d = edges[(parent, name)] = len(self.parents)
+                self.parents.append(parent)
+                self._dir_names += name
+                self._dir_name_offsets.append(len(self._dir_names))
+        return d
+
+    def __len__(self):
+        return len(self.dir_ids)
+
+    def dir_of(self, i: int) -> int:
+        return self.dir_ids[i]
+
+    def parent(self, d: int) -> int:
+        return self.parents[d]
+
+    def dir_name(self, d: int) -> str:
+        offsets = self._dir_name_offsets
+        return self._dir_names[offsets[d]:offsets[d + 1]].decode("utf-8", "surrogateescape")
+
+    def dir_path(self, d: int):
+        """Path of a directory, None for NO_DIR"""
+        paths = self._dir_paths
+        if paths[d] is not None or d == NO_DIR:
+            return paths[d]
+        # up to the nearest directory whose path is known, then down building the paths of the ones below it
+        missing = []
+        while d != NO_DIR and paths[d] is None:
+            missing.append(d)
+            d = self.parents[d]
+        path = paths[d]
+        for d in reversed(missing):
+            path = self.dir_name(d) if path is None else path + "/" + self.dir_name(d)
+            paths[d] = path
+        return path
+
+    def basename(self, i: int) -> str:
+        return self._names[self._name_offsets[i]:self._name_offsets[i + 1]].decode("utf-8", "surrogateescape")
+
+    def basename_start(self, i: int) -> int:
+        """Index of the basename in `store[i]`"""
+        d = self.dir_ids[i]
+        return 0 if d == NO_DIR else len(self.dir_path(d)) + 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+            if i < 0:
+                raise IndexError("PathStore index out of range")
+        d = self.dir_ids[i]
+        name = self._names[self._name_offsets[i]:self._name_offsets[i + 1]].decode("utf-8", "surrogateescape")
+        if d == NO_DIR:
+            return name
+        path = self._dir_paths[d]
+        return (path if path is not None else self.dir_path(d)) + "/" + name
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        """Nothing to release; there for the places that close a MappedCorpus"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def test_path_store():
+    lines = ["./a/b/c.c", "./a/b/d.h", "./a/e", "./a", "top", "", "/abs", "a//b", "./a/bñ/x", "./a/b/c.c"]
+    store = PathStore(lines)
+    assert_that(list(store)).is_equal_to(lines)
+    assert_that(store[-1]).is_equal_to("./a/b/c.c")
+    assert_that(store[2:4]).is_equal_to(["./a/e", "./a"])
+
+    print("directories are stored once")
+    assert_that([store.dir_path(d) for d in range(1, len(store.parents))]).is_equal_to(
+        [".", "./a", "./a/b", "", "a", "a/", "./a/bñ"])
+    assert_that(store.dir_of(0)).is_equal_to(store.dir_of(9)).is_equal_to(store.dir_of(1))
+    assert_that(store.dir_path(store.parent(store.dir_of(0)))).is_equal_to("./a")
+    assert_that(store.dir_of(4)).is_equal_to(NO_DIR)
+    assert_that(store.dir_name(store.dir_of(8))).is_equal_to("bñ")
+
+    assert_that(store.basename(1)).is_equal_to("d.h")
+    assert_that(store.__getitem__).raises(IndexError).when_called_with(-len(lines) - 1)
+    assert_that(store.__getitem__).raises(IndexError).when_called_with(len(lines))
+    assert_that([lines[i][store.basename_start(i):] for i in range(len(lines))]).is_equal_to(
+        [store.basename(i) for i in range(len(lines))])
+
+
+def test_path_store_deep():
+    lines = ["a" + "/" * 2000, "a" + "/b" * 3000 + "/c"]
+    store = PathStore(lines)
+    assert_that(list(store)).is_equal_to(lines)
+    assert_that(store.basename_start(1)).is_equal_to(len(lines[1]) - 1)
+
+
+def test_path_store_file(tmp_path):
+    from corpus import MappedCorpus
+
+    path = tmp_path / "files.txt"
+    path.write_bytes(b"./a\n./b\xff/c\n\n./c")
+    with MappedCorpus(str(path)) as corpus:
+        assert_that(list(PathStore.from_file(str(path)))).is_equal_to(list(corpus))
+    path.write_bytes(b"")
+    assert_that(PathStore.from_file(str(path))).is_empty()
+
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+    import tracemalloc
+
+    from corpus import MappedCorpus
+
+    _path = "../benchmark_data/linux_files_list.txt"
+
+    def _readlines(path):
+        with open(path, 'r', errors="surrogateescape") as text_file:
+            return text_file.readlines()
+
+    def _measure(path):
+        for _name, _load in [("readlines", _readlines), ("mapped", MappedCorpus), ("path store", PathStore.from_file)]:
+            t0 = time.perf_counter()
+            _load(path)
+            elapsed = time.perf_counter() - t0
+
+            tracemalloc.start()
+            _corpus = _load(path)
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            t0 = time.perf_counter()
+            for _ in _corpus:
+                pass
+            print(f"{_name:12} load {elapsed:.3f}s {size / 2 ** 20:6.1f}MB "
+                  f"read all {time.perf_counter() - t0:.3f}s")
+
+    print(f"{_path}:")
+    _measure(_path)
+
+    # many trees like the kernel's, e.g. a monorepo or a file server
+    with tempfile.NamedTemporaryFile("wb", suffix=".txt") as _big:
+        with open(_path, 'rb') as f:
+            _lines = f.read().splitlines()
+        for k in range(12):
+            _big.write(b"\n".join(b"./tree%d/%s" % (k, line[2:]) for line in _lines) + b"\n")
+        _big.flush()
+        print(f"{len(_lines) * 12} lines:")
+        _measure(_big.name)
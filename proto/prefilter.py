@@ -0,0 +1,163 @@
+from assertpy import assert_that
+
+# set in every requirement and in the mask of any text with a non-ASCII char, so those texts are never rejected
+NON_ASCII = 1 << 128
+
+
+def char_mask(text: str) -> int:
+    """Set of the (ASCII) chars of the text as a 128-bit int"""
+    if not text.isascii():
+        return (NON_ASCII << 1) - 1
+
+    mask = 0
+    for c in set(text):
+        mask |= 1 << ord(c)
+    return mask
+
+
+def _bit(code: int) -> int:
+    return 1 << code if 0 <= code < 128 else 0
+
+
+def lower_requirement(p: str) -> int:
+    """Chars c where c.lower() == p. This is how fuzzy_search_2 compares"""
+    lower = _bit(ord(p)) if p.lower() == p else 0
+    upper = _bit(ord(p.upper())) if p.islower() and len(p.upper()) == 1 else 0
+    return NON_ASCII | lower | upper
+
+
+def ignore_case_requirement(p: str) -> int:
+    """Chars that eq_ignore_case(c, p). This is how score compares by default"""
+    code = ord(p)
+    return NON_ASCII | _bit(code) | _bit(code - 32) | _bit(code + 32)
+
+
+def exact_requirement(p: str) -> int:
+    return NON_ASCII | _bit(ord(p))
+
+
+class Prefilter:
+    """
+    Rejects a text before scoring it if it lacks one of the pattern's chars. `requirement(p)` is the set of text chars
+    that can match the pattern char `p`; a text passes if its mask has at least one of them for every `p`.
+    """
+
+    def __init__(self, texts: list[str], requirement=lower_requirement, masks=None) -> None:
+        """`masks` are char_mask of every text if they are already known e.g. loaded from an index cache"""
+        self.requirement = requirement
+        self.masks = [char_mask(t) for t in texts] if masks is None else masks
+        self.checked = 0
+        self.rejected = 0
+
+    def add(self, text: str) -> int:
+        """Adds the mask of a new text at the end and returns its id"""
+        self.masks.append(char_mask(text))
+        return len(self.masks) - 1
+
+    def extend(self, texts) -> range:
+        start = len(self.masks)
+        self.masks.extend(map(char_mask, texts))
+        return range(start, len(self.masks))
+
+    def remove(self, i: int):
+        """A removed text is rejected for any pattern with at least one char"""
+        self.masks[i] = 0
+
+    def filter(self, ids: list[int], chars) -> list[int]:
+        """`ids` that have all the `chars`. Only pass the chars that `ids` haven't been filtered by yet"""
+        requirements = list({self.requirement(c) for c in chars})
+        if not requirements:
+            return ids
+
+        masks = self.masks
+        if len(requirements) == 1:
+            r = requirements[0]
+            passed = [i for i in ids if masks[i] & r]
+        else:
+            passed = [i for i in ids if all(masks[i] & r for r in requirements)]
+
+        self.checked += len(ids)
+        self.rejected += len(ids) - len(passed)
+        return passed
+
+    def rejection_rate(self):
+        return self.rejected / self.checked if self.checked else 0.0
+
+
+def test_char_mask():
+    assert_that(char_mask("")).is_equal_to(0)
+    assert_that(char_mask("aba")).is_equal_to((1 << ord("a")) | (1 << ord("b")))
+    assert_that(char_mask("añ") & NON_ASCII).is_not_zero()
+
+
+def test_requirements():
+    def can_match(c, p, requirement):
+        return char_mask(c) & requirement(p) != 0
+
+    for c in map(chr, range(128)):
+        for p in "aZ0/._-!Añ":
+            assert_that(can_match(c, p, lower_requirement)).is_equal_to(c.lower() == p)
+            assert_that(can_match(c, p, ignore_case_requirement)).is_equal_to(c == p or abs(ord(c) - ord(p)) == 32)
+            assert_that(can_match(c, p, exact_requirement)).is_equal_to(c == p)
+
+
+def test_prefilter():
+    texts = ["abc", "ABC", "xyz", "añ", "a"]
+    prefilter = Prefilter(texts)
+    ids = list(range(len(texts)))
+
+    assert_that(prefilter.filter(ids, "")).is_equal_to(ids)
+    assert_that(prefilter.filter(ids, "ab")).is_equal_to([0, 1, 3])
+    assert_that(prefilter.filter(ids, "b")).is_equal_to([0, 1, 3])
+    assert_that(prefilter.filter(ids, "B")).is_equal_to([3])
+    assert_that(prefilter.checked).is_equal_to(15)
+    assert_that(prefilter.rejected).is_equal_to(8)
+
+    prefilter = Prefilter(texts, exact_requirement)
+    assert_that(prefilter.filter(ids, "B")).is_equal_to([1, 3])
+
+    assert_that(prefilter.add("xB")).is_equal_to(5)
+    prefilter.remove(3)
+    assert_that(prefilter.filter(ids + [5], "B")).is_equal_to([1, 5])
+
+
+def test_prefilter_keeps_matches():
+    from fuzzy_score_1 import score
+    from fuzzy_score_2 import fuzzy_search_2
+
+    texts = ["src/main.rs", "Makefile", "harpd.c", "drivers/usb/Kconfig", "añb", "x", "s", "Ab/cd"]
+    patterns = ["s", "S", "x", "harpd", "sharpd", "kc", "usb", "ab", "ñ", "mk", "cd"]
+    ids = list(range(len(texts)))
+    for search, requirement in [(fuzzy_search_2, lower_requirement), (score, ignore_case_requirement)]:
+        prefilter = Prefilter(texts, requirement)
+        for p in patterns:
+            matches = [i for i in ids if search(texts[i], p) is not None]
+            assert_that(matches).is_subset_of(prefilter.filter(ids, p))
+
+
+if __name__ == '__main__':
+    import time
+
+    from fuzzy_score_2 import fuzzy_search_2
+
+    with open("../benchmark_data/linux_files_list.txt", 'r') as text_file:
+        _texts = text_file.readlines()
+    _all = list(range(len(_texts)))
+
+    t0 = time.perf_counter()
+    _prefilter = Prefilter(_texts)
+    print(f"masks: {time.perf_counter() - t0:.3f}s")
+
+    for _pattern in ["sharpd", "kconfig", "dtsi", "xyz", "usb"]:
+        t0 = time.perf_counter()
+        _full = [_i for _i in _all if fuzzy_search_2(_texts[_i], _pattern) is not None]
+        full = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        _passed = _prefilter.filter(_all, _pattern)
+        _filtered = [_i for _i in _passed if fuzzy_search_2(_texts[_i], _pattern) is not None]
+        filtered = time.perf_counter() - t0
+
+        assert _filtered == _full, f"{_pattern}: {len(_full) - len(_filtered)} matches rejected"
+        print(f"{_pattern:8} rejected {1 - len(_passed) / len(_all):6.1%}  {full:.3f}s -> {filtered:.3f}s  "
+              f"{len(_full)} matches")
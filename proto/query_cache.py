@@ -0,0 +1,118 @@
+import sys
+from array import array
+from collections import OrderedDict
+
+from assertpy import assert_that
+
+# bytes of an entry besides its pattern and matches: the key tuple, the entry tuple and the two arrays
+_ENTRY_OVERHEAD = 2 * sys.getsizeof(()) + 2 * sys.getsizeof(array('I'))
+_ID_BYTES = array('I').itemsize
+_SCORE_BYTES = array('q').itemsize
+
+
+class QueryCache:
+    """
+    LRU of (algorithm, pattern) -> (line id, score) of every match, bounded by the bytes the entries take rather than
+    their count. Ids and scores are kept as two arrays instead of a list of tuples.
+    """
+
+    def __init__(self, max_bytes=64 * 2 ** 20) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def _size(pattern: str, n: int) -> int:
+        return sys.getsizeof(pattern) + _ENTRY_OVERHEAD + n * (_ID_BYTES + _SCORE_BYTES)
+
+    def get(self, alg: str, pattern: str):
+        """(ids, scores) of the pattern or None. Counts a hit or a miss"""
+        entry = self._entries.get((alg, pattern))
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end((alg, pattern))
+        self.hits += 1
+        return entry[0], entry[1]
+
+    def put(self, alg: str, pattern: str, results: list[(int, int)]):
+        key = (alg, pattern)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+
+        ids = array('I', (i for i, _ in results))
+        scores = array('q', (s for _, s in results))
+        size = self._size(pattern, len(ids))
+        if size > self.max_bytes:
+            return
+
+        self._entries[key] = (ids, scores, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self.size -= evicted
+
+    def longest_prefix(self, alg: str, pattern: str, shorter_than: int):
+        """
+        (prefix, ids) of the longest cached pattern that pattern starts with and that is longer than `shorter_than`
+        chars, or None. Every match of pattern is among its ids. Doesn't count as a hit or a miss.
+        """
+        for k in range(len(pattern) - 1, shorter_than, -1):
+            entry = self._entries.get((alg, pattern[:k]))
+            if entry is not None:
+                self._entries.move_to_end((alg, pattern[:k]))
+                return pattern[:k], entry[0]
+        return None
+
+    def invalidate(self, keep=None):
+        """Drops every entry, or only the ones where keep(alg, pattern, ids) is false"""
+        for key, (ids, _, size) in list(self._entries.items()):
+            if keep is None or not keep(key[0], key[1], ids):
+                del self._entries[key]
+                self.size -= size
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def test_query_cache():
+    cache = QueryCache()
+    assert_that(cache.get("score", "ab")).is_none()
+    cache.put("score", "ab", [(3, 1), (7, -2)])
+    ids, scores = cache.get("score", "ab")
+    assert_that(list(zip(ids, scores))).is_equal_to([(3, 1), (7, -2)])
+    assert_that(cache.get("fuzzy_search_2_score", "ab")).is_none()
+    assert_that((cache.hits, cache.misses)).is_equal_to((1, 2))
+
+    cache.put("score", "a", [(3, 1), (5, 0), (7, -2)])
+    prefix, ids = cache.longest_prefix("score", "abc", 0)
+    assert_that(prefix).is_equal_to("ab")
+    assert_that(cache.longest_prefix("score", "abc", 2)).is_none()
+    assert_that(cache.longest_prefix("score", "xbc", 0)).is_none()
+
+
+def test_query_cache_eviction():
+    one = QueryCache._size("a", 10)
+    cache = QueryCache(max_bytes=one * 2)
+    results = [(i, 0) for i in range(10)]
+    cache.put("score", "a", results)
+    cache.put("score", "b", results)
+    cache.get("score", "a")
+    cache.put("score", "c", results)
+
+    assert_that(len(cache)).is_equal_to(2)
+    assert_that(cache.size).is_less_than_or_equal_to(cache.max_bytes)
+    assert_that(cache.get("score", "b")).is_none()
+    assert_that(cache.get("score", "a")).is_not_none()
+
+    print("too big for the cache at all")
+    cache.put("score", "d", [(i, 0) for i in range(1000)])
+    assert_that(cache.get("score", "d")).is_none()
+
+    cache.invalidate(lambda alg, pattern, ids: pattern == "a")
+    assert_that(len(cache)).is_equal_to(1)
+    cache.invalidate()
+    assert_that((len(cache), cache.size)).is_equal_to((0, 0))
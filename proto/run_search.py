@@ -1,179 +1,493 @@
+import argparse
 import os
+import shutil
+import sys
 import threading
+import time
 from random import randint
 
-from _curses import KEY_BACKSPACE
+from assertpy import assert_that
+
+from corpus import MappedCorpus
+from corpus_index import CorpusIndex
+import fuzzy_score_1
+import fuzzy_score_2
+from fuzzy_score_1 import eq_ignore_case, score
+from fuzzy_score_2 import fuzzy_search_2_score
+from index_cache import open_indexes
+from inverted_index import InvertedIndex
+from key_reader import KeyReader, edit
+from crawler import Crawler
+from live_corpus import LiveCorpus, PollingWatcher
+from narrowing import NarrowingSearch
+from optimal_score import hybrid_score
+from prefilter import Prefilter, ignore_case_requirement, lower_requirement
+from query_cache import QueryCache
+from sharded_search import ShardedSearch
+from stages import Stages
+from tokens import TokenSearch, query_positions
+from top_k import TopK, page
+from typo import Typo, TypoIndex, lower_equal
+
+
+CORPUS = "../benchmark_data/linux_files_list.txt"
+
+CLEAR_LINE_END = '\x1b[K'
+# at most one frame drawn per this many seconds, see BufPrint
+FRAME_INTERVAL = 1 / 60
+# around the matched chars of a result
+HIGHLIGHT = '\x1b[1;4m'
+HIGHLIGHT_END = '\x1b[22;24m'
+
+
+def highlight(item: str, marks) -> str:
+    """item with the chars at `marks` (sorted indices) emphasized, one escape pair per run of adjacent ones"""
+    if not marks:
+        return item
+    out = []
+    last = 0
+    run_start = marks[0]
+    for k, m in enumerate(marks):
+        if k + 1 < len(marks) and marks[k + 1] == m + 1:
+            continue
+        out += [item[last:run_start], HIGHLIGHT, item[run_start:m + 1], HIGHLIGHT_END]
+        last = m + 1
+        if k + 1 < len(marks):
+            run_start = marks[k + 1]
+    out.append(item[last:])
+    return "".join(out)
+
+
+def result_rows(texts, top, pattern: str, positions=None) -> (list[str], list):
+    """
+    (lines, marks) of the top results. `positions(text, pattern)` is only called for these, so highlighting costs the
+    same whatever the size of the corpus. A result it has no positions for isn't highlighted.
+    """
+    lines = []
+    marks = []
+    for i, _score in top:
+        prefix = f"[{_score}] "
+        text = texts[i]
+        lines.append(prefix + text)
+        matched = positions(text, pattern) if positions is not None else None
+        marks.append([len(prefix) + k for k in matched] if matched else None)
+    return lines, marks
 
-from fuzzy_score_1 import score
-from fuzzy_score_2 import fuzzy_search_2
 
+class BufPrint:
+    """
+    Draws the pattern with the results below it. Only the rows that changed since the last frame are rewritten, and
+    a frame goes out in a single write. Between frames the cursor is left at the end of the pattern.
 
-def _read_one_wide_char_win(): return msvcrt.getwch()
-
-
-def _char_can_be_escape_win(char): return True if char in ("\x00", "à") else False
-
-
-def _dump_keyboard_buff_win():
-    try:
-        msvcrt.ungetwch("a")
-    except OSError:
-        return msvcrt.getwch()
-    else:
-        _ = msvcrt.getwch();
-        return ""
-
-
-def _read_one_wide_char_nix():
-    old_settings = termios.tcgetattr(sys.stdin.fileno());
-    tty.setraw(sys.stdin.fileno())
-    wchar = sys.stdin.read(1)
-    termios.tcsetattr(sys.stdin.fileno(), termios.TCSANOW, old_settings);
-    return wchar
-
-
-def _char_can_be_escape_nix(char): return True if char == "\x1b" else False
-
-
-def _dump_keyboard_buff_nix():
-    old_settings = termios.tcgetattr(sys.stdin.fileno())
-    tty.setraw(sys.stdin.fileno());
-    os.set_blocking(sys.stdin.fileno(), False)
-    buffer_dump = ""
-    while char := sys.stdin.read(1): buffer_dump += char
-    os.set_blocking(sys.stdin.fileno(), True);
-    termios.tcsetattr(sys.stdin.fileno(), termios.TCSANOW, old_settings)
-    if buffer_dump:
-        return buffer_dump
-    else:
-        return ""
-
-
-if os.name == "nt":
-    import msvcrt
-
-    read_one_wdchar, char_can_escape, dump_key_buffer = _read_one_wide_char_win, _char_can_be_escape_win, _dump_keyboard_buff_win
-if os.name == "posix":
-    import termios, tty, sys
+    A frame that comes less than `frame_interval` seconds after the last one drawn is held back, and replaced by the
+    next one if that comes first: results can come faster than a terminal draws them. `flush` draws the frame held
+    back, if any.
 
-    read_one_wdchar, char_can_escape, dump_key_buffer = _read_one_wide_char_nix, _char_can_be_escape_nix, _dump_keyboard_buff_nix
+    `stamp` marks a key press; the first frame drawn after it adds the time in between to `latencies` (ms).
+    """
+    limit = 20
 
+    def __init__(self, out=None, frame_interval=FRAME_INTERVAL, width=None) -> None:
+        self.out = sys.stdout if out is None else out
+        self.frame_interval = frame_interval
+        # a row that wraps would throw the cursor moves off
+        self.width = (width or shutil.get_terminal_size().columns) - 1
+        # the rows on screen, the pattern first, and how many rows below the pattern the screen has for them
+        self.rows = []
+        self.height = 0
+        self.latencies = []
+        self._pending = None
+        self._drawn_at = float("-inf")
+        self._key_at = None
+
+    def stamp(self):
+        self._key_at = time.perf_counter()
+
+    def _frame(self, _pattern: str, _items: list, _marks) -> list[str]:
+        w = self.width
+        frame = [_pattern[:w]]
+        for i, item in enumerate(_items[0:min(len(_items), self.limit)]):
+            marks = _marks[i] if _marks else None
+            frame.append(highlight(item[:w], marks and [m for m in marks if m < w]))
+        return frame
+
+    def print(self, _pattern: str, _items: list, _marks=None):
+        """`_marks[k]`, if any, are the indices of _items[k] to highlight"""
+        self._pending = (self._frame(_pattern, _items, _marks), min(len(_pattern), self.width))
+        if time.perf_counter() - self._drawn_at >= self.frame_interval:
+            self.flush()
 
-def get_char():
-    wchar = read_one_wdchar()
-    if char_can_escape(wchar):
-        dump = dump_key_buffer()
-        return wchar + dump
+    def clear(self):
+        self._pending = ([], 0)
+        self.flush()
+
+    def flush(self):
+        if self._pending is None:
+            return
+        frame, col = self._pending
+        self._pending = None
+
+        out = []
+        row = 0
+        for r in range(max(len(frame), len(self.rows))):
+            new = frame[r] if r < len(frame) else ""
+            if r < len(self.rows) and self.rows[r] == new:
+                continue
+            out.append(self._move(row, r))
+            row = r
+            out.append("\r" + new + CLEAR_LINE_END)
+        out.append(self._move(row, 0) + "\r" + (f"\x1b[{col}C" if col else ""))
+        self.out.write("".join(out))
+        self.out.flush()
+
+        # rows cleared stay on screen, empty
+        self.rows = frame + [""] * (len(self.rows) - len(frame))
+        self._drawn_at = time.perf_counter()
+        if self._key_at is not None:
+            self.latencies.append((self._drawn_at - self._key_at) * 1000)
+            self._key_at = None
+
+    def _move(self, row: int, to: int) -> str:
+        """Cursor moves from one row to another. Rows the screen doesn't have yet are made with newlines"""
+        if to < row:
+            return f"\x1b[{row - to}A"
+        down = min(to, self.height) - row
+        move = f"\x1b[{down}B" if down > 0 else ""
+        if to > self.height:
+            move += "\n" * (to - self.height)
+            self.height = to
+        return move
+
+    def latency(self) -> str:
+        if not self.latencies:
+            return "no key presses"
+        ordered = sorted(self.latencies)
+        at = lambda q: ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+        return f"input to paint: p50 {at(0.5):.1f} ms, p95 {at(0.95):.1f} ms, max {ordered[-1]:.1f} ms " \
+               f"({len(ordered)} keys)"
+
+
+def run_search(alg, requirement=lower_requirement, workers=0, rebuild=False, watch=None, typos=0, positions=None,
+               latency=False):
+    """
+    With `workers`, the corpus is split across that many processes (see ShardedSearch). With `watch`, the corpus is
+    the tree under that directory: it's searchable while it's being crawled, and once the crawl is done its changes
+    are picked up between keystrokes (see PollingWatcher). With `typos`, up to that many pattern chars that aren't in
+    a text can be left out for it to match (see Typo).
+    Otherwise the indexes come from the corpus' index cache; `rebuild` ignores the cache and writes a new one.
+    Except with `workers` or `typos`, the pattern is space separated tokens that must all match, which can be filters
+    like "!test", "^./arch" or ".yaml$" (see TokenSearch).
+    `positions(text, pattern)` gives the chars of a shown result to highlight (see result_rows). With `latency`, the
+    time from key press to paint is printed on exit. With stages.ENV set, so is the time of each stage of a keystroke
+    (see Stages).
+    """
+    pattern = ""
+    # one frame per key, none of them held back
+    buf_print = BufPrint(frame_interval=0)
+    stages = Stages.from_env()
+    crawler = None
+    watcher = None
+
+    if workers:
+        texts = MappedCorpus(CORPUS)
+        engine = ShardedSearch(texts, alg, requirement, workers)
+    elif watch:
+        crawler = Crawler(watch).start()
+        texts = LiveCorpus([], CorpusIndex([]), Prefilter([], requirement), InvertedIndex([], requirement))
+        engine = TokenSearch(NarrowingSearch(texts, alg, texts.index, texts.prefilter, texts.inverted, QueryCache()))
+    elif typos:
+        indexes = open_indexes(CORPUS, requirement, rebuild)
+        texts = indexes.texts
+        alg = Typo(alg, typos, lower_equal if requirement is lower_requirement else eq_ignore_case)
+        engine = NarrowingSearch(texts, alg, indexes.index, inverted=TypoIndex(texts, alg), cache=QueryCache())
     else:
-        return wchar
-
-
-LINE_UP = '\033[1A'
-LINE_CLEAR = '\x1b[2K'
+        indexes = open_indexes(CORPUS, requirement, rebuild)
+        texts = indexes.texts
+        engine = TokenSearch(NarrowingSearch(texts, alg, indexes.index, indexes.prefilter, indexes.inverted,
+                                             QueryCache()))
+    if isinstance(engine, TokenSearch) and positions is not None:
+        positions = query_positions(positions)
+
+    page_n = 0
+
+    # a burst of keys is one search, for the pattern they end on
+    with KeyReader() as keys:
+        for burst in keys:
+            buf_print.stamp()
+            stages.start()
+            with stages.stage("edit"):
+                pattern, page_n, done = edit(pattern, page_n, burst)
+            if done:
+                break
+
+            with stages.stage("update"):
+                if crawler is not None:
+                    # an update drops the engine's frames and slots, so only when a batch came in
+                    if paths := crawler.drain():
+                        engine.update(texts.extend(paths), [])
+                    if crawler.done:
+                        watcher = PollingWatcher(watch)
+                        watcher.follow(crawler)
+                        crawler = None
+                elif watcher is not None and watcher.due():
+                    engine.update(*texts.apply(watcher.poll()))
+
+            # same pattern on show more, so search returns the cached results
+            # show more past the last page stays on it
+            if workers:
+                with stages.stage("search"):
+                    top = engine.page(pattern, buf_print.limit, page_n)
+                    if not top and page_n:
+                        page_n = max(engine.matched - 1, 0) // buf_print.limit
+                        top = engine.page(pattern, buf_print.limit, page_n)
+                matched = engine.matched
+            else:
+                with stages.stage("search"):
+                    results = engine.search(pattern)
+                matched = len(results)
+                page_n = min(page_n, max(matched - 1, 0) // buf_print.limit)
+                with stages.stage("sort"):
+                    top = page(results, buf_print.limit, page_n)
+            stages.count("scored", engine.scored)
+            stages.count("matched", matched)
+            with stages.stage("format"):
+                # a typo'd pattern doesn't match as a whole, so there is nothing to highlight
+                rows = result_rows(texts, top, pattern, None if typos else positions)
+            with stages.stage("draw"):
+                buf_print.print(pattern, *rows)
+            stages.count("rendered", len(top))
+            stages.end(pattern)
+            stages.keys(burst)
+
+    if workers:
+        engine.close()
+    if not watch:
+        texts.close()
+    if latency:
+        print(f"\n{buf_print.latency()}")
+    stages.close()
+    if stages.enabled:
+        print(f"\n{stages.summary()}")
 
 
-class BufPrint:
+class Pattern:
+    """The latest pattern, shared by the key reader and the search thread. Every change bumps `version`"""
     pattern = ""
-    results = []
-    last_pattern = ""
-    last_items_len = []
-    limit = 20
-
-    def clear(self):
-        for i in reversed(self.last_items_len):
-            print(' ' * i, end='\r')
-            print(end=LINE_UP)
 
-        print(' ' * len(self.last_pattern), end='\r')
+    def __init__(self) -> None:
+        self.version = 0
+        self.closed = False
+        self._changed = threading.Condition()
 
-    def print(self, _pattern: str, _items: list):
-        print(_pattern, flush=True)
-        sub_items = _items[0:min(len(_items), self.limit)]
-        for i, item in enumerate(sub_items):
-            print(item, flush=True)
+    def _set(self, pattern):
+        with self._changed:
+            self.pattern = pattern
+            self.version += 1
+            self._changed.notify_all()
 
-        print(end=LINE_UP, flush=True)
+    def append(self, ch):
+        self._set(self.pattern + ch)
 
-        self.last_pattern = _pattern
-        self.last_items_len = [len(i) for i in sub_items]
+    def backspace(self):
+        self._set(self.pattern[0:len(self.pattern) - 1])
+
+    def type(self, keys: list[str]) -> bool:
+        """A burst of keys as one change, see key_reader.edit. False if they quit"""
+        pattern, _, done = edit(self.pattern, 0, keys)
+        if pattern != self.pattern and not done:
+            self._set(pattern)
+        return not done
+
+    def close(self):
+        with self._changed:
+            self.closed = True
+            self._changed.notify_all()
+
+    def wait(self, version):
+        """Blocks until there is a pattern newer than `version`. Returns (version, pattern) or None once closed"""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version or self.closed)
+            return None if self.closed else (self.version, self.pattern)
+
+
+# candidates scored between two checks for a newer pattern
+SEARCH_CHUNK = 4096
+
+
+def search_latest(engine, pattern: Pattern, show, limit: int, chunk=SEARCH_CHUNK, idle=None):
+    """
+    Searches the latest pattern until `pattern` is closed. A scan is abandoned as soon as a newer pattern comes in.
+    `show(pattern, top)` gets the top `limit` results after every chunk where they changed, and once more when the
+    scan completes. `idle()` is called once a scan completes, before waiting for the next pattern.
+    """
+    version = 0
+    while (latest := pattern.wait(version)) is not None:
+        version, _pattern = latest
+        shown = None
+        # results only grow within a scan, so only a chunk's new ones are pushed
+        top_k = TopK(limit)
+        pushed = 0
+        for results in engine.scan(_pattern, chunk):
+            if pattern.version != version:
+                break
+            top_k.extend(results[pushed:])
+            pushed = len(results)
+            top = top_k.ranked()
+            if top != shown:
+                show(_pattern, top)
+                shown = top
+        else:
+            if shown is None:
+                show(_pattern, [])
+            if idle is not None:
+                idle()
 
 
-def run_search(alg):
-    pattern = ""
+def run_search_async(alg, requirement=lower_requirement, rebuild=False, positions=None, latency=False):
+    _pattern = Pattern()
     buf_print = BufPrint()
 
-    text_file = open("../benchmark_data/linux_files_list.txt", 'r')
-    texts = text_file.readlines()
+    indexes = open_indexes(CORPUS, requirement, rebuild)
+    texts = indexes.texts
+    engine = TokenSearch(NarrowingSearch(texts, alg, indexes.index, indexes.prefilter, indexes.inverted, QueryCache()))
+    if positions is not None:
+        positions = query_positions(positions)
 
-    ch = get_char()
-    while ch != '\x1b':
-        results: list[(str, int)] = []
-        buf_print.clear()
+    def consume_keys(pattern):
+        with KeyReader() as keys:
+            for burst in keys:
+                buf_print.stamp()
+                if not pattern.type(burst):
+                    break
+        pattern.close()
 
-        if ch in [KEY_BACKSPACE, '\b', '\x7f']:
-            pattern = pattern[0:len(pattern) - 1]
-        else:
-            pattern += ch
+    def show(pattern, top):
+        buf_print.print(pattern, *result_rows(texts, top, pattern, positions))
 
-        for text in texts:
-            score = alg(text, pattern)
-            if score is not None:
-                results.append((text.strip(), score))
+    ch = threading.Thread(target=consume_keys, args=(_pattern,), daemon=True)
+    ch.start()
+    # frames held back while results were coming in are drawn once the scan is done
+    search_latest(engine, _pattern, show, buf_print.limit, idle=buf_print.flush)
+    ch.join()
 
-        results = sorted(results, key=lambda x: x[1], reverse=True)
-        results = [f"[{r[1]}] {r[0]}" for r in results]
+    texts.close()
+    if latency:
+        print(f"\n{buf_print.latency()}")
+
+
+def test_search_latest():
+    def _contains(text, pattern):
+        it = iter(text)
+        return 0 if all(c in it for c in pattern) else None
+
+    texts = ["abc", "axbxc", "ab", "cba", "b"] * 4
+    engine = NarrowingSearch(texts, _contains)
+    pattern = Pattern()
+    shown = []
+
+    def show(p, top):
+        shown.append((p, len(top)))
+        if p == "a":
+            print("typing while 'a' is being scanned abandons it")
+            pattern.append("b")
+        elif p == "ab":
+            pattern.close()
 
-        buf_print.print(pattern, results)
+    pattern.append("a")
+    search_latest(engine, pattern, show, 20, chunk=3)
 
-        ch = get_char()
+    assert_that(shown).is_equal_to([("a", 3), ("ab", 3), ("ab", 4), ("ab", 6), ("ab", 8), ("ab", 9), ("ab", 12)])
+    assert_that(engine.depth()).is_equal_to(1)
 
-    text_file.close()
 
+def test_pattern_type():
+    pattern = Pattern()
+    print("a paste is one new pattern, not one per char")
+    assert_that(pattern.type(list("sharpd") + ["\x7f"])).is_true()
+    assert_that((pattern.version, pattern.pattern)).is_equal_to((1, "sharp"))
+    assert_that(pattern.type(["\x1b[A"])).is_true()
+    assert_that(pattern.version).is_equal_to(1)
+    assert_that(pattern.type(["x", "\x1b"])).is_false()
+    assert_that(pattern.pattern).is_equal_to("sharp")
 
-class Pattern:
-    pattern = ""
 
-    def append(self, ch):
-        self.pattern += ch
+def test_buf_print():
+    import io
 
-    def backspace(self):
-        self.pattern = self.pattern[0:len(self.pattern) - 1]
+    out = io.StringIO()
+    buf_print = BufPrint(out, frame_interval=0, width=21)
+    buf_print.stamp()
+    buf_print.print("ab", ["./a/b.c", "./ab", "./x/a/b/very/long/path.c"], [[2, 4], None, [4, 6, 19, 30]])
+    first = out.getvalue()
+    assert_that(first).contains(f"./{HIGHLIGHT}a{HIGHLIGHT_END}/{HIGHLIGHT}b{HIGHLIGHT_END}.c")
+    print("rows are cut to the width, and so are their marks")
+    assert_that(first).contains(f"/long/p{HIGHLIGHT}a{HIGHLIGHT_END}{CLEAR_LINE_END}")
+    assert_that(first.count("\n")).is_equal_to(3)
+    assert_that(buf_print.latencies).is_length(1)
 
+    print("only the rows that changed are written, in one write")
+    out.seek(0)
+    out.truncate()
+    buf_print.print("abc", ["./a/b.c", "./abc"], [[2, 4], None])
+    assert_that(out.getvalue()).is_equal_to(
+        f"\rabc{CLEAR_LINE_END}\x1b[2B\r./abc{CLEAR_LINE_END}\x1b[1B\r{CLEAR_LINE_END}\x1b[3A\r\x1b[3C")
+    assert_that(buf_print.rows).is_length(4)
 
-def run_search_async():
-    _pattern = Pattern()
+    print("frames coming too fast are held back, and the last one is drawn on flush")
+    buf_print.frame_interval = 60
+    out.seek(0)
+    out.truncate()
+    buf_print.print("abcd", [])
+    buf_print.print("abcde", [])
+    assert_that(out.getvalue()).is_empty()
+    buf_print.flush()
+    assert_that(out.getvalue()).contains("abcde").does_not_contain("abcd" + CLEAR_LINE_END)
+    assert_that(buf_print.latencies).is_length(1)
 
-    def consume_chars(pattern):
-        _ch = get_char()
-        while _ch != '\x1b':
-            results: list[(str, int)] = []
-            if _ch in [KEY_BACKSPACE, '\b', '\x7f']:
-                pattern.backspace()
-            else:
-                pattern.append(_ch)
 
-            print(pattern.pattern)
+def test_result_rows():
+    texts = ["./a/sharp.c", "./mm/slab.c", "./init"] * 1000
+    calls = []
 
-            _ch = get_char()
+    def _positions(text, pattern):
+        calls.append(text)
+        return fuzzy_score_2.positions(text, pattern)
 
-    def search():
-        print()
+    lines, marks = result_rows(texts, [(1, -3), (0, 5)], "sl", _positions)
+    assert_that(lines).is_equal_to(["[-3] ./mm/slab.c", "[5] ./a/sharp.c"])
+    print("only the rows shown are matched again")
+    assert_that(calls).is_length(2)
+    assert_that(marks[0]).is_equal_to([10, 11])
+    assert_that(highlight(lines[0], marks[0])).is_equal_to(f"[-3] ./mm/{HIGHLIGHT}sl{HIGHLIGHT_END}ab.c")
+    assert_that(highlight("abcd", [0, 2, 3])).is_equal_to(
+        f"{HIGHLIGHT}a{HIGHLIGHT_END}b{HIGHLIGHT}cd{HIGHLIGHT_END}")
+    assert_that(result_rows(texts, [(2, 0)], "x")[1]).is_equal_to([None])
 
-    ch = threading.Thread(target=consume_chars, args=(_pattern,))
-    ch.start()
-    ch.join()
 
+def run_fuzzy_score_1(rebuild=False):
+    run_search(score, ignore_case_requirement, rebuild=rebuild, positions=fuzzy_score_1.positions)
 
-def run_fuzzy_score_1():
-    run_search(score)
 
+def run_fuzzy_score_2(rebuild=False, watch=None, typos=0, latency=False):
+    run_search(fuzzy_search_2_score, lower_requirement, rebuild=rebuild, watch=watch, typos=typos,
+               positions=fuzzy_score_2.positions, latency=latency)
 
-def run_fuzzy_score_2():
-    run_search(fuzzy_search_2)
 
+def run_hybrid_score(rebuild=False, watch=None, typos=0, latency=False):
+    """
+    Ranks by fuzzy_score_1's score of the best alignment rather than of the greedy one (see optimal_score), at about
+    3x the cost. The chars highlighted are still the greedy ones
+    """
+    run_search(hybrid_score, ignore_case_requirement, rebuild=rebuild, watch=watch, typos=typos,
+               positions=fuzzy_score_1.positions, latency=latency)
+
+
+def run_fuzzy_score_2_sharded():
+    run_search(fuzzy_search_2_score, lower_requirement, os.cpu_count(), positions=fuzzy_score_2.positions)
 
-def run_fuzzy_search_async():
-    run_search_async()
+
+def run_fuzzy_search_async(rebuild=False, latency=False):
+    run_search_async(fuzzy_search_2_score, lower_requirement, rebuild, fuzzy_score_2.positions, latency)
 
 
 if __name__ == '__main__':
@@ -183,6 +497,18 @@ if __name__ == '__main__':
         return randint(-100000, 100000)
 
 
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the corpus' index cache")
+    parser.add_argument("--watch", metavar="DIR", help="search the tree under DIR and follow its changes")
+    parser.add_argument("--typos", metavar="K", type=int, default=0, help="allow up to K typos in the pattern")
+    parser.add_argument("--latency", action="store_true", help="print the key press to paint latency on exit")
+    parser.add_argument("--hybrid", action="store_true",
+                        help="rank by the best alignment of fuzzy_score_1 (optimal_score.hybrid_score), about 3x slower")
+    args = parser.parse_args()
+
     # run_search(alg)
-    # run_fuzzy_search_async()
-    run_fuzzy_score_2()
+    # run_fuzzy_search_async(args.rebuild, args.latency)
+    if args.hybrid:
+        run_hybrid_score(args.rebuild, args.watch, args.typos, args.latency)
+    else:
+        run_fuzzy_score_2(args.rebuild, args.watch, args.typos, args.latency)
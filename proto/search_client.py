@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+
+# only the standard library is imported (assertpy too is imported by the test): the client is started once per query,
+# so its own start up is most of the time it takes
+
+
+def socket_path() -> str:
+    return os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), f"fuzzy_search-{os.getuid()}.sock")
+
+
+class SearchClient:
+    """A connection to a search_daemon (see SearchDaemon for the protocol). Usable from one thread at a time"""
+
+    def __init__(self, path=None) -> None:
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(socket_path() if path is None else path)
+        self._responses = self.socket.makefile("rb")
+        self._id = 0
+
+    def send(self, query: str, limit=20, page=0, positions=False) -> int:
+        """Sends a query without waiting for its results, e.g. on every keystroke. Returns its id"""
+        self._id += 1
+        request = {"id": self._id, "query": query, "limit": limit, "page": page, "positions": positions}
+        self.socket.sendall(json.dumps(request).encode() + b"\n")
+        return self._id
+
+    def receive(self) -> dict:
+        line = self._responses.readline()
+        if not line:
+            raise ConnectionError("the daemon closed the connection")
+        return json.loads(line)
+
+    def search(self, query: str, limit=20, page=0, positions=False) -> dict:
+        """
+        The response to the query, skipping those to the queries sent before it. Raises ValueError if the daemon
+        answered it an error
+        """
+        _id = self.send(query, limit, page, positions)
+        while (response := self.receive()).get("id") != _id:
+            pass
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response
+
+    def close(self):
+        self._responses.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def test_search_client(tmp_path):
+    import asyncio
+    import threading
+
+    from assertpy import assert_that
+
+    from narrowing import NarrowingSearch
+    from search_daemon import SearchDaemon
+    from tokens import TokenSearch
+
+    texts = ["./arch/arm/panel-sharp.yaml", "./drivers/panel/sharp.c", "./mm/slab.c"]
+    path = str(tmp_path / "search.sock")
+    loop = asyncio.new_event_loop()
+    daemon = SearchDaemon(texts, lambda: TokenSearch(NarrowingSearch(texts, lambda t, p: 0 if p in t else None)))
+    server = loop.run_until_complete(daemon.start(path))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        with SearchClient(path) as client:
+            assert_that(client.search("panel !arm")).is_equal_to(
+                {"id": 1, "results": [[0, "./drivers/panel/sharp.c"]], "matched": 1})
+            client.send("s")
+            print("responses to the queries sent before are skipped")
+            assert_that(client.search("sla", limit=1)["results"]).is_equal_to([[0, "./mm/slab.c"]])
+            print("an error is raised rather than waited on")
+            assert_that(client.search).raises(ValueError).when_called_with("sla", limit=-1)
+    finally:
+        async def stop():
+            server.close()
+            # the connection sees the client is gone
+            while not daemon._idle:
+                await asyncio.sleep(0.001)
+
+        asyncio.run_coroutine_threadsafe(stop(), loop).result(1)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Searches the corpus held by search_daemon.py, one result per line")
+    parser.add_argument("query", nargs="+", help="space separated tokens, see tokens.TokenSearch")
+    parser.add_argument("--socket", default=None)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--page", type=int, default=0)
+    parser.add_argument("--scores", action="store_true", help="print the score before each result")
+    args = parser.parse_args()
+
+    try:
+        _client = SearchClient(args.socket)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sys.exit(f"no daemon on {args.socket or socket_path()}, start one with search_daemon.py")
+    with _client:
+        try:
+            _response = _client.search(" ".join(args.query), args.limit, args.page)
+        except ValueError as e:
+            sys.exit(str(e))
+    for _score, _text in _response["results"]:
+        print(f"[{_score}] {_text}" if args.scores else _text)
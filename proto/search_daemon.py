@@ -0,0 +1,223 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+
+from assertpy import assert_that
+
+import fuzzy_score_2
+from fuzzy_score_2 import fuzzy_search_2_score
+from index_cache import open_indexes
+from narrowing import NarrowingSearch
+from prefilter import lower_requirement
+from query_cache import QueryCache
+from run_search import CORPUS, SEARCH_CHUNK
+from search_client import socket_path
+from tokens import TokenSearch, query_positions
+from top_k import page
+
+LIMIT = 20
+
+
+class SearchDaemon:
+    """
+    Serves searches of one corpus, loaded once, to any number of clients over a Unix socket. The protocol is JSON
+    lines: a request is {"id": ..., "query": "panel sharp", "limit": 20, "page": 0, "positions": false} (only "query"
+    is required) and gets one response,
+    {"id": ..., "results": [[score, text] or [score, text, positions], ...], "matched": n}. A client can send a query
+    before the last one is answered, e.g. on every keystroke: the last one is then answered
+    {"id": ..., "cancelled": true} and abandoned. A request that can't be read, or whose search fails, is answered
+    {"id": ..., "error": "..."} (the id is null if there is none to read).
+
+    Every connection gets an engine of its own (`make_engine()`), since an engine narrows from the last query it
+    searched. An engine is taken back when its connection closes and handed to the next one, so a client that connects
+    for every query (e.g. an editor running search_client on every keystroke) still narrows. Searches run on the event
+    loop, `chunk` candidates at a time, so clients take turns and a newer query is read between two chunks.
+    """
+
+    def __init__(self, texts, make_engine, positions=None, chunk=SEARCH_CHUNK) -> None:
+        self.texts = texts
+        self.make_engine = make_engine
+        self.positions = positions
+        self.chunk = chunk
+        self._idle = []
+
+    async def start(self, path: str):
+        """Listens on `path`, replacing the socket of a daemon that is gone"""
+        if os.path.exists(path):
+            try:
+                _, writer = await asyncio.open_unix_connection(path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(path)
+            else:
+                writer.close()
+                await writer.wait_closed()
+                raise OSError(f"a daemon is already listening on {path}")
+        return await asyncio.start_unix_server(self.serve, path)
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        engine = self._idle.pop() if self._idle else self.make_engine()
+        # the task of the last request and its id
+        running = None
+        running_id = None
+        try:
+            while line := await reader.readline():
+                request = None
+                try:
+                    request = json.loads(line)
+                    query = _check(request)
+                except (ValueError, KeyError, TypeError) as e:
+                    _id = request.get("id") if isinstance(request, dict) else None
+                    self._send(writer, {"id": _id, "error": f"bad request: {e!r}"})
+                    continue
+                if running is not None and not running.done():
+                    running.cancel()
+                    self._send(writer, {"id": running_id, "cancelled": True})
+                running = asyncio.create_task(self._search(engine, writer, request, query))
+                running_id = request.get("id")
+            if running is not None:
+                await running
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if running is not None and not running.done():
+                running.cancel()
+            writer.close()
+            self._idle.append(engine)
+
+    async def _search(self, engine, writer, request: dict, query: str):
+        try:
+            results = []
+            for results in engine.scan(query, self.chunk):
+                # the connection reads a newer query, and other connections search, in between
+                await asyncio.sleep(0)
+            top = page(results, request.get("limit", LIMIT), request.get("page", 0))
+            positions = self.positions if request.get("positions") else None
+            rows = []
+            for i, score in top:
+                text = self.texts[i]
+                rows.append([score, text] if positions is None else [score, text, positions(text, query)])
+        except Exception as e:
+            # a client waits for an answer to every query it didn't replace
+            self._send(writer, {"id": request.get("id"), "error": f"search failed: {e!r}"})
+            return
+        # nothing is awaited from here on, so a search is either cancelled or answered
+        self._send(writer, {"id": request.get("id"), "results": rows, "matched": len(results)})
+
+    @staticmethod
+    def _send(writer, response: dict):
+        writer.write(json.dumps(response).encode() + b"\n")
+
+
+def _check(request) -> str:
+    """The query of a request, once its fields are known to be of the right type"""
+    query = request["query"]
+    if not isinstance(query, str):
+        raise TypeError(f"query must be a string, not {query!r}")
+    for key, default in [("limit", LIMIT), ("page", 0)]:
+        value = request.get(key, default)
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise TypeError(f"{key} must be an integer >= 0, not {value!r}")
+    return query
+
+
+async def serve_corpus(path: str, corpus=CORPUS, rebuild=False):
+    indexes = open_indexes(corpus, lower_requirement, rebuild)
+    cache = QueryCache()
+
+    def make_engine():
+        return TokenSearch(NarrowingSearch(indexes.texts, fuzzy_search_2_score, indexes.index, indexes.prefilter,
+                                           indexes.inverted, cache))
+
+    daemon = SearchDaemon(indexes.texts, make_engine, query_positions(fuzzy_score_2.positions))
+    server = await daemon.start(path)
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+    print(f"serving {len(indexes.texts)} lines on {path}", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        os.unlink(path)
+        indexes.close()
+
+
+def _contains(text, pattern):
+    it = iter(text)
+    return 0 if all(c in it for c in pattern) else None
+
+
+def _first(text, query):
+    """positions that fail on "ca", as a search could"""
+    if query == "ca":
+        raise ValueError(query)
+    return [0]
+
+
+def test_search_daemon(tmp_path):
+    texts = ["abc", "axbxc", "ab", "cba", "b"] * 3
+    path = str(tmp_path / "search.sock")
+
+    async def main():
+        daemon = SearchDaemon(texts, lambda: TokenSearch(NarrowingSearch(texts, _contains)),
+                              _first, chunk=2)
+        server = await daemon.start(path)
+        reader, writer = await asyncio.open_unix_connection(path)
+
+        writer.write(b'{"id": 1, "query": "ab", "limit": 2, "positions": true}\n')
+        response = json.loads(await reader.readline())
+        assert_that(response).is_equal_to({"id": 1, "results": [[0, "abc", [0]], [0, "axbxc", [0]]], "matched": 9})
+
+        print("a query sent before the last one is answered cancels it")
+        writer.write(b'{"id": 2, "query": "a"}\n{"id": 3, "query": "abc", "page": 1, "limit": 4}\n')
+        assert_that(json.loads(await reader.readline())).is_equal_to({"id": 2, "cancelled": True})
+        assert_that(json.loads(await reader.readline())).is_equal_to(
+            {"id": 3, "results": [[0, "abc"], [0, "axbxc"]], "matched": 6})
+
+        writer.write(b'{"query": \n')
+        assert_that(json.loads(await reader.readline())).contains_key("error")
+        print("a request of the wrong types is answered an error with its id")
+        writer.write(b'{"id": 4, "query": 5}\n{"id": 5, "query": "a", "limit": "3"}\n[1]\n')
+        responses = [json.loads(await reader.readline()) for _ in range(3)]
+        assert_that([(r["id"], "error" in r) for r in responses]).is_equal_to([(4, True), (5, True), (None, True)])
+        writer.write(b'{"id": 6, "query": "ca", "positions": true}\n')
+        assert_that(json.loads(await reader.readline())).contains_entry({"id": 6}).contains_key("error")
+
+        print("clients are served concurrently")
+        other_reader, other_writer = await asyncio.open_unix_connection(path)
+        other_writer.write(b'{"query": "cb"}\n')
+        writer.write(b'{"query": "b"}\n')
+        responses = await asyncio.gather(reader.readline(), other_reader.readline())
+        assert_that([json.loads(r)["matched"] for r in responses]).is_equal_to([15, 3])
+
+        writer.close()
+        other_writer.close()
+        await asyncio.sleep(0.01)
+        assert_that(daemon._idle).is_length(2)
+
+        print("the socket of a daemon that is still there isn't taken over")
+        try:
+            await daemon.start(path)
+            raise AssertionError("started twice")
+        except OSError as e:
+            assert_that(str(e)).contains("already listening")
+        await asyncio.sleep(0.01)
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(main())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Keeps the corpus loaded and serves searches over a Unix socket")
+    parser.add_argument("--socket", default=socket_path())
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the corpus' index cache")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve_corpus(args.socket, args.corpus, args.rebuild))
+    except KeyboardInterrupt:
+        pass
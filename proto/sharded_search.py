@@ -0,0 +1,127 @@
+import os
+from multiprocessing import Pipe, Process
+
+from assertpy import assert_that
+
+from corpus_index import CorpusIndex
+from inverted_index import InvertedIndex
+from narrowing import NarrowingSearch
+from prefilter import Prefilter, lower_requirement
+from top_k import TopK, page
+
+
+def _serve(conn, texts: list[str], offset: int, alg, requirement):
+    """Worker loop. The shard and its indexes live here for the life of the process; only patterns come in"""
+    if requirement is None:
+        engine = NarrowingSearch(texts, alg, CorpusIndex(texts))
+    else:
+        engine = NarrowingSearch(texts, alg, CorpusIndex(texts), Prefilter(texts, requirement),
+                                 InvertedIndex(texts, requirement))
+    conn.send(len(texts))
+
+    while (message := conn.recv()) is not None:
+        pattern, k = message
+        results = engine.search(pattern)
+        top = TopK(k)
+        for i, s in results:
+            top.push(offset + i, s)
+        conn.send((top.ranked(), len(results), engine.scored))
+    conn.close()
+
+
+class ShardedSearch:
+    """
+    Splits the corpus into one contiguous shard per worker process. Shards are sent once at startup, then each
+    query only sends the pattern to every worker, which runs its own NarrowingSearch and answers with its local top
+    k. `alg` must be picklable and return a number e.g. score or fuzzy_search_2_score.
+    """
+
+    def __init__(self, texts: list[str], alg, requirement=lower_requirement, workers=None) -> None:
+        workers = max(1, min(workers or os.cpu_count() or 1, len(texts)))
+        size = -(-len(texts) // workers)
+
+        # of the last query, over all the shards
+        self.matched = 0
+        self.scored = 0
+        self._connections = []
+        self._processes = []
+        for offset in range(0, max(len(texts), 1), size or 1):
+            parent, child = Pipe()
+            process = Process(target=_serve, args=(child, texts[offset:offset + size], offset, alg, requirement),
+                              daemon=True)
+            process.start()
+            child.close()
+            self._connections.append(parent)
+            self._processes.append(process)
+
+        for conn in self._connections:
+            conn.recv()
+
+    def top(self, pattern: str, k: int) -> list[(int, int)]:
+        """Best k (line id, score) of the whole corpus in rank order"""
+        for conn in self._connections:
+            conn.send((pattern, k))
+
+        merged = TopK(k)
+        self.matched = self.scored = 0
+        for conn in self._connections:
+            ranked, matched, scored = conn.recv()
+            merged.extend(ranked)
+            self.matched += matched
+            self.scored += scored
+        return merged.ranked()
+
+    def page(self, pattern: str, k: int, n=0) -> list[(int, int)]:
+        return self.top(pattern, (n + 1) * k)[n * k:]
+
+    def close(self):
+        for conn in self._connections:
+            conn.send(None)
+            conn.close()
+        for process in self._processes:
+            process.join()
+        self._connections = []
+        self._processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def test_sharded_search():
+    from fuzzy_score_2 import fuzzy_search_2_score
+
+    texts = ["./arch/arm/boot/compressed/head-sharpsl.S", "./drivers/gpu/drm/panel/panel-sharp-ls037v7dw01.c",
+             "./Documentation/devicetree/bindings/display/panel/sharp,ls037v7dw01.yaml", "./init/do_mounts.c",
+             "./Documentation/devicetree/bindings/display/panel/sharp,ld-d5116z01b.yaml", "./README"] * 3
+    single = NarrowingSearch(texts, fuzzy_search_2_score)
+    # as the workers search their shards
+    indexed = NarrowingSearch(texts, fuzzy_search_2_score, CorpusIndex(texts), Prefilter(texts, lower_requirement),
+                              InvertedIndex(texts, lower_requirement))
+
+    with ShardedSearch(texts, fuzzy_search_2_score, workers=4) as sharded:
+        for pattern in ["s", "sh", "sharp", "sharpd", "sh", "xyz", ""]:
+            expected = single.search(pattern)
+            indexed.search(pattern)
+            assert_that(sharded.top(pattern, 5)).is_equal_to(page(expected, 5))
+            assert_that(sharded.matched).is_equal_to(len(expected))
+            assert_that(sharded.scored).is_equal_to(indexed.scored)
+            assert_that(sharded.page(pattern, 4, 1)).is_equal_to(page(expected, 4, 1))
+
+
+if __name__ == '__main__':
+    import time
+
+    from fuzzy_score_2 import fuzzy_search_2_score
+
+    with open("../benchmark_data/linux_files_list.txt", 'r') as text_file:
+        _texts = text_file.readlines()
+
+    for _workers in sorted({1, 2, os.cpu_count() or 1}):
+        with ShardedSearch(_texts, fuzzy_search_2_score, requirement=None, workers=_workers) as _sharded:
+            t0 = time.perf_counter()
+            for _pattern in ["d", "dt", "dts", "s", "sh", "sha", "shar", "sharp"]:
+                _sharded.top(_pattern, 20)
+            print(f"{_workers} workers: {time.perf_counter() - t0:.3f}s")
@@ -0,0 +1,179 @@
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import nullcontext
+
+from assertpy import assert_that
+
+# set to anything but "" or "0" to time the stages of every keystroke and print a summary on exit
+ENV = "FUZZY_STAGES"
+
+# with stages on, these keys capture the next keystroke: cProfile, or tracemalloc's allocations
+PROFILE_KEY = "\x10"  # ctrl + p
+ALLOCATIONS_KEY = "\x01"  # ctrl + a
+
+# keystrokes the histograms are over
+WINDOW = 1024
+
+_off = nullcontext()
+
+
+class _Stage:
+    __slots__ = ("stages", "name", "start")
+
+    def __init__(self, stages, name: str) -> None:
+        self.stages = stages
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+
+    def __exit__(self, *_):
+        self.stages.times[self.name].append(time.perf_counter_ns() - self.start)
+
+
+class Stages:
+    """
+    Wall time of each stage of a keystroke (`with stages.stage("search"):`) and counts of what it went through
+    (`stages.count("matched", n)`), each kept for the last `window` keystrokes, to tell where a slow one went.
+
+    Off, `stage` returns one shared no-op context and `count` returns right away, so it costs a couple of calls per
+    stage per keystroke. `capture(kind)` runs the next keystroke (from `start` to `end`) under cProfile ("profile") or
+    tracemalloc ("allocations"); its report is kept for the summary.
+    """
+
+    def __init__(self, enabled=True, window=WINDOW) -> None:
+        self.enabled = enabled
+        self.times = defaultdict(lambda: deque(maxlen=window))
+        self.counts = defaultdict(lambda: deque(maxlen=window))
+        self.reports = []
+        self._capture = None
+        self._running = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.environ.get(ENV, "") not in ("", "0"))
+
+    def stage(self, name: str):
+        return _Stage(self, name) if self.enabled else _off
+
+    def count(self, name: str, n: int):
+        if self.enabled:
+            self.counts[name].append(n)
+
+    def keys(self, keys: list[str]):
+        """Arms a capture of the next keystroke if one of the keys asks for it"""
+        if self.enabled:
+            if PROFILE_KEY in keys:
+                self.capture("profile")
+            elif ALLOCATIONS_KEY in keys:
+                self.capture("allocations")
+
+    def capture(self, kind: str):
+        self._capture = kind
+
+    def start(self):
+        """A keystroke starts"""
+        if self._capture == "profile":
+            import cProfile
+
+            self._running = cProfile.Profile()
+            self._running.enable()
+        elif self._capture == "allocations":
+            import tracemalloc
+
+            tracemalloc.start()
+            self._running = tracemalloc.take_snapshot()
+
+    def end(self, pattern: str):
+        """The keystroke's frame is drawn"""
+        if self._running is None:
+            return
+        if self._capture == "profile":
+            self._running.disable()
+            import io
+            import pstats
+
+            out = io.StringIO()
+            pstats.Stats(self._running, stream=out).sort_stats("cumulative").print_stats(25)
+            report = out.getvalue()
+        else:
+            import tracemalloc
+
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            top = after.compare_to(self._running, "lineno")[:10]
+            report = f"peak {peak / 2 ** 20:.1f} MB\n" + "\n".join(map(str, top))
+        self.reports.append(f"{self._capture} of {pattern!r}:\n{report}")
+        self._capture = self._running = None
+
+    def close(self):
+        """Stops a capture whose keystroke never ended, e.g. the one that quit"""
+        if self._running is None:
+            return
+        if self._capture == "profile":
+            self._running.disable()
+        else:
+            import tracemalloc
+
+            tracemalloc.stop()
+        self._capture = self._running = None
+
+    def summary(self) -> str:
+        lines = []
+        for name, times in self.times.items():
+            ordered = sorted(times)
+            at = lambda q: ordered[min(int(q * len(ordered)), len(ordered) - 1)] / 1e6
+            lines.append(f"{name:>10}: p50 {at(0.5):8.2f} ms  p95 {at(0.95):8.2f} ms  p99 {at(0.99):8.2f} ms  "
+                         f"max {ordered[-1] / 1e6:8.2f} ms  ({len(ordered)})")
+        for name, counts in self.counts.items():
+            lines.append(f"{name:>10}: mean {sum(counts) / len(counts):10.1f}  max {max(counts):8}  ({len(counts)})")
+        return "\n".join(lines + self.reports)
+
+
+def test_stages():
+    stages = Stages()
+    for n in range(3):
+        stages.start()
+        with stages.stage("search"):
+            sum(range(1000))
+        stages.count("matched", n)
+        stages.end("p")
+    assert_that(stages.times["search"]).is_length(3)
+    assert_that(list(stages.counts["matched"])).is_equal_to([0, 1, 2])
+    assert_that(stages.summary()).contains("search: p50").contains("matched: mean        1.0  max        2  (3)")
+
+    print("only the keystroke after the hotkey is captured")
+    stages.keys(["a", PROFILE_KEY])
+    stages.start()
+    sorted(range(1000))
+    stages.end("ab")
+    stages.start()
+    stages.end("abc")
+    assert_that(stages.reports).is_length(1)
+    assert_that(stages.reports[0]).starts_with("profile of 'ab'").contains("function calls")
+
+    stages.keys([ALLOCATIONS_KEY])
+    stages.start()
+    kept = [str(n) for n in range(10000)]
+    stages.end("ab")
+    assert_that(stages.reports[1]).starts_with("allocations of 'ab'").contains("peak")
+    assert_that(kept).is_not_empty()
+
+    print("a capture the session ends during is stopped")
+    import tracemalloc
+
+    stages.capture("allocations")
+    stages.start()
+    stages.close()
+    assert_that(tracemalloc.is_tracing()).is_false()
+    assert_that(stages.reports).is_length(2)
+
+    off = Stages(enabled=False)
+    assert_that(off.stage("search")).is_same_as(off.stage("draw"))
+    off.count("matched", 1)
+    off.keys([PROFILE_KEY])
+    off.start()
+    off.end("x")
+    assert_that(off.summary()).is_empty()
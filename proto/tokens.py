@@ -0,0 +1,378 @@
+from itertools import repeat
+
+from assertpy import assert_that
+
+from narrowing import NarrowingSearch
+
+NEGATE = "!"
+PREFIX = "^"
+SUFFIX = "$"
+
+
+def is_filter(token: str) -> bool:
+    """A negated or anchored token, checked as a plain substring/prefix/suffix rather than scored"""
+    return token.startswith((NEGATE, PREFIX)) or token.endswith(SUFFIX)
+
+
+def _literal(token: str) -> (str, bool, bool, bool):
+    """(literal, negate, prefix, suffix) of a token"""
+    negate = token.startswith(NEGATE)
+    literal = token[1:] if negate else token
+    prefix = literal.startswith(PREFIX)
+    literal = literal[1:] if prefix else literal
+    suffix = literal.endswith(SUFFIX)
+    return (literal[:-1] if suffix else literal), negate, prefix, suffix
+
+
+def parse_query(query: str) -> list[str]:
+    """
+    Space separated tokens of the query, the filters (see is_filter) first and then the tokens to score, each in the
+    order they were typed. A filter with nothing to check yet ("!", "^", "$") is left out.
+    """
+    tokens = query.split()
+    filters = [t for t in tokens if is_filter(t) and _literal(t)[0]]
+    return filters + [t for t in tokens if not is_filter(t)]
+
+
+class _Slot:
+    """The results of the tokens of a query up to this one, their scores summed. `engine` scored it, if any"""
+
+    def __init__(self, token: str, results: list[(int, int)], engine=None) -> None:
+        self.token = token
+        self.results = results
+        self.engine = engine
+        self._totals = None
+
+    def ids(self) -> list[int]:
+        return [i for i, _ in self.results]
+
+    def totals(self) -> dict:
+        if self._totals is None:
+            self._totals = dict(self.results)
+        return self._totals
+
+
+class TokenSearch:
+    """
+    Space separated tokens that must all match, e.g. "panel sharp yaml". The score of a text is the sum of its scores
+    for every token. A token can also be a filter, which doesn't score: "!test" rejects the texts that contain "test",
+    "^./arch" keeps the ones starting with "./arch", ".yaml$" the ones ending with ".yaml" (and "^x$" the one that is
+    "x"). A filter's literal ignores case unless it has an uppercase char.
+
+    Each token is a slot that keeps the results of the tokens up to it, and the tokens after it only look at those.
+    Filters go first, so no text they reject is ever scored. A query keeps the slots of the tokens it starts with,
+    and a fuzzy token that was edited keeps its NarrowingSearch, so editing the last token narrows (or backs up) as
+    with a single pattern and the tokens before it aren't scored again. The first token scored against the whole
+    corpus uses `engine`, with its inverted index and cache; the next ones get an engine restricted to the slot before
+    theirs.
+
+    Filters don't change scores, so the slots of the tokens last scored without any filter are kept aside: when a
+    filter is typed after them, e.g. "panel sharp !test", their results are only narrowed to the texts the filter
+    keeps instead of being scored again. So are those of a first token that `engine`'s cache has, e.g. one another
+    TokenSearch on the same cache searched.
+    """
+
+    def __init__(self, engine: NarrowingSearch) -> None:
+        self.engine = engine
+        self.texts = engine.texts
+        self.scored = 0
+        self._slots = []
+        self._unfiltered = []
+        self._lower_view = None
+        self._lower_bytes = None
+
+    def search(self, query: str) -> list[(int, int)]:
+        for results in self.scan(query):
+            pass
+        return results
+
+    def scan(self, query: str, chunk=None):
+        """
+        See NarrowingSearch.scan. Every token is scanned in chunks, so a caller can drop a query at any point; while
+        the tokens before the last are scanned no text is known to match them all, and [] is yielded. A slot is kept
+        once it is complete
+        """
+        tokens = parse_query(query)
+        filters = sum(map(is_filter, tokens))
+        slots = self._slots
+        k = 0
+        while k < len(slots) and k < len(tokens) and slots[k].token == tokens[k]:
+            k += 1
+        # an edited token keeps its engine, which narrows from its old token or backs up to a shorter one
+        reuse = k < len(slots) and k < len(tokens) and slots[k].engine is not None and not is_filter(tokens[k])
+        del slots[k + 1 if reuse else k:]
+
+        self.scored = 0
+        if k == len(tokens):
+            yield slots[-1].results if slots else []
+            return
+        if filters and (known := self._known(tokens[filters:], filters)) is not None:
+            # only the results of the tokens are checked, and there is no slot to keep
+            self._slots = []
+            keep = set(self._filters(tokens[:filters], known.ids()))
+            yield [r for r in known.results if r[0] in keep]
+            return
+
+        for j in range(k, len(tokens)):
+            token = tokens[j]
+            prev = slots[j - 1] if j > 0 else None
+            if is_filter(token):
+                ids = self._filter(token, range(len(self.texts)) if prev is None else prev.ids())
+                if prev is None:
+                    slot = _Slot(token, list(zip(ids, repeat(0))))
+                else:
+                    totals = prev.totals()
+                    slot = _Slot(token, [(i, totals[i]) for i in ids])
+            elif not (j == k and reuse) and (known := self._known(tokens[filters:j + 1], filters)) is not None:
+                keep = set(self._filters(tokens[:filters], known.ids())) if filters else None
+                slot = known if keep is None else _Slot(token, [r for r in known.results if r[0] in keep])
+            else:
+                engine = slots[j].engine if j == k and reuse else self._engine(prev)
+                scored = self.scored
+                results = None
+                last = j == len(tokens) - 1
+                for raw in engine.scan(token, chunk):
+                    if results is not None:
+                        yield results if last else []
+                    results = self._add(prev, raw, results)
+                    self.scored = scored + engine.scored
+                slot = _Slot(token, results, engine)
+            if j < len(slots):
+                slots[j] = slot
+            else:
+                slots.append(slot)
+        if not filters:
+            self._unfiltered = slots[:]
+        yield slots[-1].results
+
+    def _known(self, tokens: list[str], filters: int):
+        """The slot of the last of these tokens scored without filters, if they were"""
+        unfiltered = self._unfiltered
+        if tokens and len(unfiltered) >= len(tokens) and all(s.token == t for s, t in zip(unfiltered, tokens)):
+            return unfiltered[len(tokens) - 1]
+        # without filters, `engine` gets the cached results itself, and narrows from them on the next key
+        cache = self.engine.cache
+        if filters and len(tokens) == 1 and cache is not None:
+            cached = cache.get(self.engine.cache_key, tokens[0])
+            if cached is not None:
+                return _Slot(tokens[0], list(zip(*cached)))
+        return None
+
+    @staticmethod
+    def _add(prev, raw: list[(int, int)], results):
+        """
+        The scores of the tokens before added to a token's results. `raw` only grows within a scan, so the results
+        of its earlier chunks are kept
+        """
+        if prev is None:
+            return raw
+        if results is None:
+            results = []
+        totals = prev.totals()
+        results += [(i, totals[i] + s) for i, s in raw[len(results):]]
+        return results
+
+    def _engine(self, prev) -> NarrowingSearch:
+        engine = self.engine
+        if prev is None:
+            return engine
+        return NarrowingSearch(engine.texts, engine.alg, engine.index, engine.prefilter, base=prev.ids())
+
+    def _filters(self, tokens: list[str], ids: list[int]) -> list[int]:
+        for token in tokens:
+            ids = self._filter(token, ids)
+        return ids
+
+    def _filter(self, token: str, ids) -> list[int]:
+        literal, negate, prefix, suffix = _literal(token)
+        texts = self.texts
+        index = self.engine.index
+        ignore_case = literal == literal.lower()
+        # h[a:b] compared to n without slicing it
+        if prefix and suffix:
+            check = lambda h, n, a, b: b - a == len(n) and h.startswith(n, a, b)
+        elif prefix:
+            check = lambda h, n, a, b: h.startswith(n, a, b)
+        elif suffix:
+            check = lambda h, n, a, b: h.endswith(n, a, b)
+        else:
+            check = lambda h, n, a, b: h.find(n, a, b) >= 0
+
+        kept = []
+        if ignore_case and index is not None and literal.isascii():
+            lower = self._lower(index)
+            offsets = index.offsets
+            ascii_ = index.ascii
+            encoded = literal.encode("ascii")
+            for i in ids:
+                if ascii_[i]:
+                    found = check(lower, encoded, offsets[i], offsets[i + 1])
+                else:
+                    text = texts[i].lower()
+                    found = check(text, literal, 0, len(text))
+                if found != negate:
+                    kept.append(i)
+        else:
+            for i in ids:
+                text = texts[i].lower() if ignore_case else texts[i]
+                if check(text, literal, 0, len(text)) != negate:
+                    kept.append(i)
+        return kept
+
+    def _lower(self, index):
+        """
+        The index' lowercase bytes, searched in place. When loaded from the cache they are a memoryview, which has no
+        find: that one is copied, once for as long as the index has it
+        """
+        lower = index.lower
+        if isinstance(lower, (bytes, bytearray)):
+            return lower
+        if self._lower_view is not lower:
+            self._lower_view = lower
+            self._lower_bytes = bytes(lower)
+        return self._lower_bytes
+
+    def update(self, added: list[int], removed: list[int]):
+        """See NarrowingSearch.update. Only `engine` catches up; the slots are made again on the next search"""
+        self.engine.update(added, removed)
+        self._slots = []
+        self._unfiltered = []
+
+
+def query_positions(positions):
+    """
+    positions(text, query) for highlighting (see run_search.result_rows): the union of `positions(text, token)` of
+    every token scored, and the chars an anchor matched
+    """
+
+    def _positions(text: str, query: str):
+        marks = set()
+        for token in parse_query(query):
+            if not is_filter(token):
+                marks.update(positions(text, token) or ())
+                continue
+            literal, negate, prefix, suffix = _literal(token)
+            if not negate and prefix:
+                marks.update(range(min(len(literal), len(text))))
+            elif not negate and suffix:
+                marks.update(range(max(len(text) - len(literal), 0), len(text)))
+        return sorted(marks) or None
+
+    return _positions
+
+
+def _contains(text, pattern):
+    it = iter(text)
+    return 0 if all(c in it for c in pattern) else None
+
+
+def _length(text, pattern, flags=None, lower=None):
+    """_contains that scores shorter texts higher and takes the index' arguments"""
+    return None if _contains(text, pattern) is None else -len(text)
+
+
+TEXTS = ["./arch/arm/panel-sharp.yaml", "./drivers/panel/sharp.c", "./arch/x86/test_sharp.c", "./Documentation/sharp",
+         "./drivers/sharp/panel.yaml"]
+
+
+def test_parse_query():
+    assert_that(parse_query(" panel  sharp ")).is_equal_to(["panel", "sharp"])
+    assert_that(parse_query("panel !test .yaml$ sharp ^./ ! $")).is_equal_to(
+        ["!test", ".yaml$", "^./", "panel", "sharp"])
+    assert_that(_literal("!^./arch$")).is_equal_to(("./arch", True, True, True))
+
+
+def test_token_search():
+    engine = TokenSearch(NarrowingSearch(TEXTS, _contains))
+    assert_that(engine.search("")).is_empty()
+
+    r = engine.search("panel sharp")
+    assert_that([i for i, _ in r]).is_equal_to([0, 1, 4])
+    first = engine._slots[0].results
+
+    print("editing the last token scores it among the matches of the first, and leaves the first alone")
+    r = engine.search("panel sharpc")
+    assert_that([i for i, _ in r]).is_equal_to([1])
+    assert_that(engine.scored).is_equal_to(3)
+    assert_that(engine._slots[0].results).is_same_as(first)
+    r = engine.search("panel sha")
+    assert_that([i for i, _ in r]).is_equal_to([0, 1, 4])
+    assert_that(engine.scored).is_equal_to(3)
+    assert_that(engine.search("panel")).is_same_as(first)
+
+
+def test_token_search_scores():
+    engine = TokenSearch(NarrowingSearch(TEXTS, _length))
+    r = engine.search("sharp panel")
+    assert_that(r).is_equal_to([(0, -2 * len(TEXTS[0])), (1, -2 * len(TEXTS[1])), (4, -2 * len(TEXTS[4]))])
+
+
+def test_token_search_filters():
+    from corpus_index import CorpusIndex
+
+    # as loaded from the index cache
+    mapped = CorpusIndex(TEXTS)
+    mapped.lower = memoryview(bytes(mapped.lower))
+    for index in [None, CorpusIndex(TEXTS), mapped]:
+        engine = TokenSearch(NarrowingSearch(TEXTS, _length, index))
+        assert_that([i for i, _ in engine.search("sharp !test")]).is_equal_to([0, 1, 3, 4])
+        print("filters go first, so only the texts they keep are scored")
+        assert_that([i for i, _ in engine.search("sharp !test ^./arch")]).is_equal_to([0])
+        assert_that(engine.scored).is_equal_to(1)
+        assert_that([i for i, _ in engine.search(".yaml$")]).is_equal_to([0, 4])
+        assert_that(engine.search(".yaml$ panel")).is_equal_to([(0, -len(TEXTS[0])), (4, -len(TEXTS[4]))])
+        assert_that([i for i, _ in engine.search("!^./ARCH ^./doc")]).is_equal_to([3])
+        assert_that([i for i, _ in engine.search("^./DOC")]).is_empty()
+        assert_that([i for i, _ in engine.search("^./drivers/panel/sharp.c$")]).is_equal_to([1])
+
+        print("a filter typed after tokens scored without one narrows their results")
+        engine.search("sharp panel")
+        r = engine.search("sharp panel !arm")
+        assert_that(r).is_equal_to([(1, -2 * len(TEXTS[1])), (4, -2 * len(TEXTS[4]))])
+        assert_that(engine.scored).is_equal_to(0)
+        assert_that([i for i, _ in engine.search("sharp panel !arm !./d")]).is_empty()
+        assert_that([i for i, _ in engine.search("sharp panel")]).is_equal_to([0, 1, 4])
+        assert_that(engine.scored).is_equal_to(0)
+
+    print("a memoryview of lowercase bytes is copied once, not on every filter")
+    assert_that(engine._lower(mapped)).is_same_as(engine._lower(mapped))
+
+
+def test_token_search_cache():
+    from query_cache import QueryCache
+
+    cache = QueryCache()
+    TokenSearch(NarrowingSearch(TEXTS, _contains, cache=cache)).search("sharp")
+    engine = TokenSearch(NarrowingSearch(TEXTS, _contains, cache=cache))
+    print("a first token cached by another search is narrowed to the filters")
+    assert_that([i for i, _ in engine.search("sharp !arch")]).is_equal_to([1, 3, 4])
+    assert_that(engine.scored).is_equal_to(0)
+    print("the next token is scored among them")
+    assert_that([i for i, _ in engine.search("sharp panel !arch")]).is_equal_to([1, 4])
+    assert_that(engine.scored).is_equal_to(3)
+
+
+def test_token_search_scan():
+    engine = TokenSearch(NarrowingSearch(TEXTS * 3, _contains))
+    engine.search("yaml")
+    partial = [len(r) for r in engine.scan("yaml sharp", 2)]
+    assert_that(partial).is_equal_to([2, 4, 6])
+
+    print("the tokens before the last are scanned in chunks too")
+    partial = [len(r) for r in TokenSearch(NarrowingSearch(TEXTS * 3, _contains)).scan("yaml sharp", 2)]
+    assert_that(partial).is_equal_to([0] * 7 + [2, 4, 6])
+
+    print("an abandoned scan leaves the tokens before it")
+    scan = engine.scan("yaml sharpx", 1)
+    next(scan)
+    scan.close()
+    assert_that([i for i, _ in engine.search("yaml sharp")]).is_length(6)
+
+
+def test_query_positions():
+    from fuzzy_score_2 import positions
+
+    _positions = query_positions(positions)
+    assert_that(_positions("./drivers/sharp/panel.yaml", "shp pan")).is_equal_to([10, 11, 14, 16, 17, 18])
+    assert_that(_positions("./arch/sharp.yaml", "^./ar .yaml$ !x")).is_equal_to([0, 1, 2, 3, 12, 13, 14, 15, 16])
+    assert_that(_positions("./arch", "xyz")).is_none()
@@ -0,0 +1,55 @@
+import heapq
+
+from assertpy import assert_that
+
+
+def rank_key(result: (int, int)):
+    """Higher score first; on a tie the lower line id (i.e. corpus order) first, same as a stable sort"""
+    return -result[1], result[0]
+
+
+class TopK:
+    """Keeps the best k of a stream of (line id, score) in a min-heap, without storing or sorting the rest"""
+
+    def __init__(self, k: int) -> None:
+        self.k = k
+        self._heap = []
+
+    def push(self, i: int, score: int):
+        item = (score, -i)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item > self._heap[0]:
+            heapq.heapreplace(self._heap, item)
+
+    def extend(self, results):
+        for i, s in results:
+            self.push(i, s)
+
+    def ranked(self) -> list[(int, int)]:
+        return [(-ni, s) for s, ni in sorted(self._heap, reverse=True)]
+
+
+def page(results: list[(int, int)], k: int, n=0) -> list[(int, int)]:
+    """The n-th k results in rank order. Only (n + 1) * k results are ever ordered"""
+    return heapq.nsmallest((n + 1) * k, results, key=rank_key)[n * k:]
+
+
+def test_top_k():
+    results = [(0, 3), (1, 7), (2, 3), (3, -1), (4, 7), (5, 0)]
+    top = TopK(3)
+    top.extend(results)
+    assert_that(top.ranked()).is_equal_to([(1, 7), (4, 7), (0, 3)])
+
+    top = TopK(10)
+    top.extend(results)
+    assert_that(top.ranked()).is_equal_to(sorted(results, key=lambda x: x[1], reverse=True))
+
+
+def test_page():
+    results = [(i, i % 4) for i in range(10)]
+    expected = sorted(results, key=lambda x: x[1], reverse=True)
+    assert_that(page(results, 4)).is_equal_to(expected[0:4])
+    assert_that(page(results, 4, 1)).is_equal_to(expected[4:8])
+    assert_that(page(results, 4, 2)).is_equal_to(expected[8:10])
+    assert_that(page(results, 4, 3)).is_empty()
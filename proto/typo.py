@@ -0,0 +1,236 @@
+import re
+from itertools import combinations
+
+import numpy as np
+from assertpy import assert_that
+
+from fuzzy_score_1 import _Qe, eq_ignore_case
+
+
+def _popcount(v: np.ndarray) -> np.ndarray:
+    """Set bits of every uint64 of `v`, for numpy before 2.0 that has no np.bitwise_count"""
+    return np.unpackbits(v.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+_bitwise_count = getattr(np, "bitwise_count", _popcount)
+
+
+def lower_equal(c: str, p: str) -> bool:
+    """How fuzzy_search_2 compares a text char with a pattern char"""
+    return c.lower() == p
+
+
+def _equal_chars(p: str, equal) -> set[str]:
+    """Text chars that `equal` a pattern char. Only case pairs are tried, which covers both scorers"""
+    code = ord(p)
+    tried = {p, p.lower(), p.upper()} | {chr(c) for c in (code - 32, code + 32) if 0 <= c < 0x110000}
+    return {c for c in tried if len(c) == 1 and equal(c, p)}
+
+
+class _PatternBits(dict):
+    """char -> bits of the pattern positions it matches, filled in as chars come up"""
+
+    def __init__(self, pattern: str, equal) -> None:
+        super().__init__()
+        self.pattern = pattern
+        self.equal = equal
+
+    def __missing__(self, c):
+        bits = 0
+        for j, p in enumerate(self.pattern):
+            if self.equal(c, p):
+                bits |= 1 << j
+        self[c] = bits
+        return bits
+
+
+def missing(text: str, bits: _PatternBits) -> int:
+    """
+    Pattern chars that have to be left out for the rest to be a subsequence of text, i.e. len(pattern) - LCS. The
+    LCS is bit-parallel (Allison-Dix, Hyyrö): bit j of v is cleared once pattern[j] is part of the LCS so far, so
+    each text char is a few int operations whatever the pattern length.
+    """
+    full = (1 << len(bits.pattern)) - 1
+    v = full
+    for c in text:
+        u = v & bits[c]
+        v = ((v + u) | (v - u)) & full
+    return v.bit_count()
+
+
+def _subpatterns(pattern: str, n: int) -> list[(str, object)]:
+    """(pattern without n of its chars, regex search that tells if it's a subsequence of a lowercase text)"""
+    subs = []
+    for kept in combinations(range(len(pattern)), len(pattern) - n):
+        sub = "".join(pattern[j] for j in kept)
+        subs.append((sub, re.compile(".*?".join(map(re.escape, sub.lower())), re.DOTALL).search))
+    return subs
+
+
+class Typo:
+    """
+    Typo tolerant version of `alg` (score or fuzzy_search_2_score): a text matches if leaving out at most
+    `allowed(pattern)` of the pattern's chars makes it match `alg`. The score is the best `alg` score of the pattern
+    without those chars plus _Qe per char left out, so exact matches rank as they did and typos fall in behind.
+
+    Both scorers let any text chars through between matched ones, so a wrong, missing or transposed key always comes
+    down to one pattern char that isn't matched; that is the only edit there is to count. `equal(c, p)` is how `alg`
+    compares a text char with a pattern char.
+
+    The allowance grows with the pattern: one edit per `per` chars, at most `k`. Any text chars can come between two
+    matched ones, so even one edit lets a lot through on short patterns. Matches of a pattern are only a subset of
+    those of its prefix while the allowance stays the same, which `narrows` tells NarrowingSearch. Don't give
+    NarrowingSearch a Prefilter or an InvertedIndex with it: they drop texts for lacking a pattern char. TypoIndex is
+    the candidate source to use instead.
+    """
+
+    def __init__(self, alg, k=1, equal=lower_equal, per=5) -> None:
+        self.alg = alg
+        self.k = k
+        self.per = per
+        self.equal = equal
+        self.__name__ = f"{getattr(alg, '__name__', type(alg).__name__)}~{k}"
+        self._bits = _PatternBits("", equal)
+        self._subs = {}
+
+    def allowed(self, pattern: str) -> int:
+        return min(self.k, len(pattern) // self.per)
+
+    def narrows(self, prefix: str, pattern: str) -> bool:
+        return self.allowed(pattern) <= self.allowed(prefix)
+
+    def __call__(self, text: str, pattern: str, flags=None, lower=None):
+        allowed = self.allowed(pattern)
+        if allowed == 0:
+            return self.alg(text, pattern, flags=flags, lower=lower)
+
+        if self._bits.pattern != pattern:
+            self._bits = _PatternBits(pattern, self.equal)
+            self._subs = {}
+        edits = missing(text, self._bits)
+        if edits > allowed:
+            return None
+        if edits == 0:
+            s = self.alg(text, pattern, flags=flags, lower=lower)
+            if s is not None:
+                return s
+            edits = 1
+
+        # only a few ways to leave chars out are subsequences, and only those are scored
+        lowered = text.lower()
+        for n in range(edits, allowed + 1):
+            if n not in self._subs:
+                self._subs[n] = _subpatterns(pattern, n)
+            best = None
+            for sub, search in self._subs[n]:
+                if search(lowered) is None:
+                    continue
+                s = self.alg(text, sub, flags=flags, lower=lower)
+                if s is not None and (best is None or s > best):
+                    best = s
+            if best is not None:
+                return best + n * _Qe
+        return None
+
+
+class TypoIndex:
+    """
+    Candidates of a Typo for the whole corpus at once, to plug in as NarrowingSearch's `inverted`, which is asked
+    every time narrowing starts over. It runs the same bit-parallel LCS as `missing` with numpy, one column of an
+    EncodedCorpus at a time, for every text together: v holds one uint64 per text, so patterns of up to 64 chars.
+    The padding after a text is code 0, which matches no pattern char and leaves v as it is.
+    """
+
+    def __init__(self, texts, typo: Typo, corpus=None) -> None:
+        from fuzzy_score_1_batch import EncodedCorpus
+
+        self.typo = typo
+        self.corpus = EncodedCorpus(list(texts)) if corpus is None else corpus
+        self._codes = int(self.corpus.codes.max(initial=0)) + 1
+
+    def _table(self, pattern: str) -> np.ndarray:
+        table = np.zeros(self._codes, dtype=np.uint64)
+        for j, p in enumerate(pattern):
+            for c in _equal_chars(p, self.typo.equal):
+                if ord(c) < self._codes:
+                    table[ord(c)] |= np.uint64(1 << j)
+        return table
+
+    def candidates(self, pattern: str) -> list[int]:
+        """Line ids, in order, within the edits `typo` allows for the pattern"""
+        n = len(self.corpus)
+        if len(pattern) > 64:
+            return list(range(n))
+
+        table = self._table(pattern)
+        full = np.uint64((1 << len(pattern)) - 1)
+        v = np.full(n, full, dtype=np.uint64)
+        for column in self.corpus.codes.T:
+            u = v & table[column]
+            v = ((v + u) | (v - u)) & full
+        return np.flatnonzero(_bitwise_count(v) <= self.typo.allowed(pattern)).tolist()
+
+
+def _lcs(a: str, b: str) -> int:
+    row = [0] * (len(b) + 1)
+    for x in a:
+        prev = row
+        row = [0]
+        for j, y in enumerate(b):
+            row.append(prev[j] + 1 if x == y else max(prev[j + 1], row[j]))
+    return row[-1]
+
+
+def test_popcount():
+    v = np.array([0, 1, 0b1011, 2 ** 64 - 1, 2 ** 63], dtype=np.uint64)
+    assert_that(_popcount(v).tolist()).is_equal_to([0, 1, 3, 64, 1])
+
+
+def test_missing():
+    import random
+
+    rng = random.Random(7)
+    for _ in range(500):
+        text = "".join(rng.choice("abcAB_") for _ in range(rng.randint(0, 12)))
+        pattern = "".join(rng.choice("abc") for _ in range(rng.randint(1, 7)))
+        expected = len(pattern) - _lcs(text.lower(), pattern)
+        assert_that(missing(text, _PatternBits(pattern, lower_equal))).described_as(f"{text} {pattern}") \
+            .is_equal_to(expected)
+
+
+def test_typo():
+    from fuzzy_score_2 import fuzzy_search_2_score
+
+    typo = Typo(fuzzy_search_2_score, k=1)
+    text = "./drivers/gpu/drm/panel/panel-sharp-ls037v7dw01.c"
+    exact = fuzzy_search_2_score(text, "sharpd")
+    assert_that(typo(text, "sharpd")).is_equal_to(exact)
+
+    print("a transposition is one char left out")
+    assert_that(fuzzy_search_2_score(text, "shrapd")).is_none()
+    assert_that(typo(text, "shrapd")).is_equal_to(max(fuzzy_search_2_score(text, "shrpd"),
+                                                      fuzzy_search_2_score(text, "shapd")) + _Qe)
+    assert_that(typo(text, "shrapd")).is_less_than(exact)
+
+    assert_that(typo(text, "shrxpz")).is_none()
+    print("4 chars get no edits")
+    assert_that(typo(text, "shrx")).is_none()
+    assert_that(typo.narrows("shar", "sharp")).is_false()
+    assert_that(typo.narrows("sharp", "sharpd")).is_true()
+
+
+def test_typo_index():
+    from fuzzy_score_1 import score
+    from fuzzy_score_2 import fuzzy_search_2_score
+    from narrowing import NarrowingSearch
+
+    texts = ["./arch/arm/boot/compressed/head-sharpsl.S", "./drivers/gpu/drm/panel/panel-sharp-ls037v7dw01.c",
+             "./init/do_mounts.c", "./mm/slab.c", "./añb/SHARP", "", "./Documentation/hsarpd.txt"]
+    for alg, equal in [(fuzzy_search_2_score, lower_equal), (score, eq_ignore_case)]:
+        typo = Typo(alg, k=2, equal=equal)
+        index = TypoIndex(texts, typo)
+        engine = NarrowingSearch(texts, typo, inverted=index)
+        for pattern in ["s", "shr", "shra", "shrap", "shrapd", "shrapdxy", "sharp"]:
+            expected = [(i, s) for i, text in enumerate(texts) if (s := typo(text, pattern)) is not None]
+            assert_that(set(index.candidates(pattern)).issuperset(i for i, _ in expected)).is_true()
+            assert_that(engine.search(pattern)).described_as(pattern).is_equal_to(expected)